@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.v1.endpoints import auth, market, orders, wallet, transactions, escrow
+from app.api.v1.endpoints import auth, market, orders, wallet, transactions, escrow, system
 
 api_router = APIRouter()
 
@@ -8,4 +8,5 @@ api_router.include_router(market.router, prefix="/market", tags=["Marketplace"])
 api_router.include_router(orders.router, prefix="/orders", tags=["Orders & Escrow"])
 api_router.include_router(wallet.router, prefix="/wallet", tags=["Wallet"])
 api_router.include_router(transactions.router, prefix="/transactions", tags=["transactions"])
-api_router.include_router(escrow.router, prefix="/escrow", tags=["escrow"])
\ No newline at end of file
+api_router.include_router(escrow.router, prefix="/escrow", tags=["escrow"])
+api_router.include_router(system.router, prefix="/system", tags=["System"])
\ No newline at end of file
@@ -1,36 +1,99 @@
+from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 from app.core.config import settings
-from app.db.session import get_db
-from app.models.user import User
+from app.core.principal_cache import Principal, PrincipalCache
+from app.db.session import get_db, request_user_id, ReplicaRouter
+from app.models.user import User, UserRole
 from app.schemas.token import TokenPayload
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login", auto_error=False)
 
-async def get_current_user(
-    db: AsyncSession = Depends(get_db),
-    token: str = Depends(oauth2_scheme)
-) -> User:
+async def get_current_principal(token: str = Depends(oauth2_scheme)) -> Principal:
+    """
+    Utilisateur authentifié réduit à (id, rôle, statut), sans requête DB
+    dans le cas courant. À préférer quand l'endpoint n'a besoin que de l'ID.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Token invalide",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
+    signature = token.rsplit(".", 1)[-1]
+    principal = PrincipalCache.get_by_signature(signature)
+
+    if principal is None:
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            user_id: str = payload.get("sub")
+            # Sans "exp" le jeton ne serait jamais périmé (et l'entrée du cache de signatures sans borne)
+            token_exp = payload.get("exp")
+            if user_id is None or token_exp is None:
+                raise credentials_exception
+            token_data = TokenPayload(sub=user_id)
+        except JWTError:
             raise credentials_exception
-        token_data = TokenPayload(sub=user_id)
-    except JWTError:
-        raise credentials_exception
-        
-    result = await db.execute(select(User).where(User.id == int(token_data.sub)))
-    user = result.scalars().first()
-    
+
+        principal = await PrincipalCache.get_by_user_id(int(token_data.sub))
+        if principal is None:
+            raise credentials_exception
+        PrincipalCache.remember_signature(signature, principal, token_exp)
+
+    if not principal.is_active:
+        raise HTTPException(status_code=400, detail="Compte inactif")
+    # Routage des lectures : ses propres écritures restent visibles (ReplicaRouter)
+    request_user_id.set(principal.id)
+    return principal
+
+async def get_optional_principal(token: Optional[str] = Depends(oauth2_scheme_optional)) -> Optional[Principal]:
+    """Principal si un jeton valide est fourni, None sinon (endpoints publics)."""
+    if not token:
+        return None
+    try:
+        return await get_current_principal(token)
+    except HTTPException:
+        return None
+
+async def get_read_db(principal: Optional[Principal] = Depends(get_optional_principal)):
+    """
+    Session de lecture : réplica à jour si disponible, sinon primaire.
+    Primaire aussi juste après un commit de l'utilisateur (lecture de ses écritures).
+    Aucune écriture ne doit passer par cette session.
+    """
+    session = await ReplicaRouter.read_session(principal.id if principal else None)
+    async with session:
+        yield session
+
+async def get_current_user(
+    db: AsyncSession = Depends(get_db),
+    principal: Principal = Depends(get_current_principal)
+) -> User:
+    """Utilisateur complet (objet ORM) pour les endpoints qui en ont besoin."""
+    user = await db.get(User, principal.id)
     if user is None:
-        raise credentials_exception
-    return user
\ No newline at end of file
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token invalide",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
+async def get_current_admin(principal: Principal = Depends(get_current_principal)) -> Principal:
+    """Réservé aux administrateurs (endpoints d'exploitation)."""
+    if principal.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Réservé aux administrateurs")
+    return principal
+
+async def is_admin_authorization(authorization: Optional[str]) -> bool:
+    """En-tête Authorization d'un admin actif ? (hors injection FastAPI : middlewares)"""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        principal = await get_current_principal(token)
+    except HTTPException:
+        return False
+    return principal.role == UserRole.ADMIN
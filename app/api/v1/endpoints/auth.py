@@ -1,14 +1,21 @@
+import logging
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.db.session import get_db
-from app.core.security import get_password_hash, verify_password, create_access_token
+from app.core.security import (
+    get_password_hash_async,
+    verify_password_async,
+    password_needs_rehash,
+    create_access_token,
+)
 from app.models.user import User
 from app.models.wallet import Wallet
 from app.schemas.user import UserCreate, UserResponse, UserLogin
 from app.schemas.token import Token
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 @router.post("/register", response_model=UserResponse)
 async def register(user_in: UserCreate, db: AsyncSession = Depends(get_db)):
@@ -20,8 +27,7 @@ async def register(user_in: UserCreate, db: AsyncSession = Depends(get_db)):
             raise HTTPException(status_code=400, detail="Ce numéro est déjà utilisé")
 
         # 2. Hasher le password
-        hashed_password = get_password_hash(user_in.password)
-        print(f"✅ Password hashé: {hashed_password[:20]}...")
+        hashed_password = await get_password_hash_async(user_in.password)
 
         # 3. Créer l'utilisateur
         new_user = User(
@@ -41,13 +47,13 @@ async def register(user_in: UserCreate, db: AsyncSession = Depends(get_db)):
         await db.commit()
         await db.refresh(new_user)
 
-        print(f"✅ Utilisateur créé: {new_user.phone}")
+        logger.info(f"✅ Utilisateur créé: {new_user.phone}")
         return new_user
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Erreur registration: {e}")
+        logger.exception(f"❌ Erreur registration: {e}")
         await db.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur serveur: {str(e)}")
 
@@ -60,30 +66,35 @@ async def login(user_in: UserLogin, db: AsyncSession = Depends(get_db)):
         user = result.scalars().first()
 
         if not user:
-            print(f"❌ Utilisateur non trouvé: {user_in.phone}")
+            logger.info(f"❌ Utilisateur non trouvé: {user_in.phone}")
             raise HTTPException(status_code=401, detail="Identifiants incorrects")
 
         # 2. Vérifier le password
-        is_valid = verify_password(user_in.password, user.hashed_password)
-        print(f"Vérification password pour {user_in.phone}: {is_valid}")
-        print(f"  Hash DB: {user.hashed_password[:30]}...")
-        print(f"  Password: {user_in.password}")
+        is_valid = await verify_password_async(user_in.password, user.hashed_password)
 
         if not is_valid:
-            print(f"❌ Password invalide pour {user_in.phone}")
+            logger.info(f"❌ Password invalide pour {user_in.phone}")
             raise HTTPException(status_code=401, detail="Identifiants incorrects")
 
         # 3. Vérifier que le compte est actif
         if not user.is_active:
             raise HTTPException(status_code=400, detail="Compte inactif")
 
-        # 4. Créer le token
+        # 4. Re-hasher si le coût bcrypt a changé (transparent pour l'utilisateur)
+        if password_needs_rehash(user.hashed_password):
+            try:
+                user.hashed_password = await get_password_hash_async(user_in.password)
+                await db.commit()
+            except HTTPException:
+                pass  # Pool saturé : on re-hashera à la prochaine connexion
+
+        # 5. Créer le token
         access_token = create_access_token(subject=user.id)
-        print(f"✅ Login réussi pour {user_in.phone}, token créé")
+        logger.info(f"✅ Login réussi pour {user_in.phone}")
         return {"access_token": access_token, "token_type": "bearer"}
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Erreur login: {e}")
+        logger.exception(f"❌ Erreur login: {e}")
         raise HTTPException(status_code=500, detail=f"Erreur serveur: {str(e)}")
\ No newline at end of file
@@ -1,8 +1,7 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.db.session import get_db
-from app.api.v1.deps import get_current_user
-from app.models.user import User
+from app.api.v1.deps import get_current_principal, get_read_db
+from app.core.principal_cache import Principal
 from app.models.escrow_account import EscrowAccount
 from app.models.order import Order
 from sqlalchemy import select, and_
@@ -11,8 +10,8 @@ router = APIRouter()
 
 @router.get("/")
 async def get_my_escrows(
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Récupérer les escrows de l'artisan"""
     query = select(EscrowAccount).join(
@@ -1,12 +1,10 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
-from sqlalchemy import select
+from typing import List, Optional
 from app.db.session import get_db
-from app.api.v1.deps import get_current_user
-from app.models.user import User
-from app.models.listing import Listing
-from app.schemas.listing import ListingCreate, ListingResponse
+from app.api.v1.deps import get_current_principal, get_read_db
+from app.core.principal_cache import Principal
+from app.schemas.listing import ListingCreate, ListingUpdate, ListingResponse, ListingPage
 from app.services.market_service import MarketService
 
 router = APIRouter()
@@ -15,40 +13,47 @@ router = APIRouter()
 async def create_listing(
     listing_in: ListingCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Créer un nouveau service/produit."""
-    # Création directe avec contrôle des champs pour éviter les erreurs de parsing
-    new_listing = Listing(
-        title=listing_in.title,
-        description=listing_in.description or "",
-        price=listing_in.price,
-        category=listing_in.category,
-        type=listing_in.type,
-        partner_id=current_user.id,
-        price_unit=listing_in.price_unit,
-        latitude=listing_in.latitude,
-        longitude=listing_in.longitude
-    )
-    
-    db.add(new_listing)
-    await db.commit()
-    await db.refresh(new_listing)
-    return new_listing
+    return await MarketService.create_listing(db, listing_in, current_user.id)
+
+@router.patch("/{listing_id}", response_model=ListingResponse)
+async def update_listing(
+    listing_id: int,
+    listing_in: ListingUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Modifier un service/produit (prix, position, disponibilité On/Off)."""
+    return await MarketService.update_listing(db, listing_id, current_user.id, listing_in)
 
 @router.get("/nearby", response_model=List[ListingResponse])
 async def get_nearby(
     lat: float,
     lon: float,
     radius: float = 10.0,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     return await MarketService.get_nearby_listings(db, lat, lon, radius)
 
-@router.get("/", response_model=List[ListingResponse])
+@router.get("/", response_model=ListingPage)
 async def get_all_listings(
-    db: AsyncSession = Depends(get_db)
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    category: Optional[str] = None,
+    type: Optional[str] = None,
+    min_price: Optional[int] = Query(None, ge=0),
+    max_price: Optional[int] = Query(None, ge=0),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Récupère tous les listings disponibles"""
-    result = await db.execute(select(Listing).where(Listing.is_available == True))
-    return result.scalars().all()
\ No newline at end of file
+    """Récupère les listings disponibles, page par page (passer next_cursor)."""
+    return await MarketService.get_listings_page(
+        db,
+        cursor=cursor,
+        limit=limit,
+        category=category,
+        listing_type=type,
+        min_price=min_price,
+        max_price=max_price
+    )
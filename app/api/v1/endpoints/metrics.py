@@ -0,0 +1,129 @@
+import hmac
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from app.core.cache import TieredCache
+from app.core.config import settings
+from app.core.delay_queue import DelayQueue
+from app.core.idempotency import Idempotency
+from app.core.logging import LogPipeline
+from app.core.metrics import metrics
+from app.core.principal_cache import PrincipalCache
+from app.core.scheduler import scheduler_service
+from app.db.session import ReplicaRouter, SQLiteWriter
+from app.services.notification_engine import notification_engine
+
+router = APIRouter()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Compteurs des caches : clé de stats -> label "result"
+CACHE_RESULTS = {
+    "local_hits": "local_hit",
+    "redis_hits": "redis_hit",
+    "stale_served": "stale",
+    "coalesced": "coalesced",
+    "misses": "miss",
+}
+
+
+# ===== Collecteurs (lus au scrape depuis les stats existantes) =====
+
+@metrics.collector
+async def collect_caches():
+    caches = TieredCache.all_stats()
+    auth = PrincipalCache.counters
+    return [
+        ("cache_lookups_total", "counter", "Lectures de cache par résultat", [
+            ("", {"namespace": namespace, "result": result}, stats[key])
+            for namespace, stats in caches.items() for key, result in CACHE_RESULTS.items()
+        ]),
+        ("cache_refreshes_total", "counter", "Recalculs en tâche de fond (stale-while-revalidate)", [
+            ("", {"namespace": namespace}, stats["refreshes"]) for namespace, stats in caches.items()
+        ]),
+        ("cache_errors_total", "counter", "Recalculs de cache en échec", [
+            ("", {"namespace": namespace}, stats["errors"]) for namespace, stats in caches.items()
+        ]),
+        ("cache_local_entries", "gauge", "Entrées du cache local (par worker)", [
+            ("", {"namespace": namespace}, stats["local_size"]) for namespace, stats in caches.items()
+        ]),
+        ("auth_lookups_total", "counter", "Résolutions de jeton (token_hits : sans décodage ni base)", [
+            ("", {"result": "token_hit"}, auth["token_hits"]),
+            ("", {"result": "lookup"}, auth["lookups"]),
+        ]),
+    ]
+
+
+@metrics.collector
+async def collect_backlogs():
+    backlog = await DelayQueue.backlog_by_kind()
+    notifications = notification_engine.stats()
+    return [
+        ("scheduled_tasks_due", "gauge", "Échéances dues non traitées (DelayQueue)", [
+            ("", {"kind": kind.value}, count) for kind, count in backlog.items()
+        ]),
+        ("notifications_queue_depth", "gauge", "Notifications en file", [("", {}, notifications["queue_depth"])]),
+        ("notifications_pending_retries", "gauge", "Notifications en attente de retry", [
+            ("", {}, notifications["pending_retries"])
+        ]),
+        ("notifications_total", "counter", "Notifications par issue", [
+            ("", {"outcome": outcome}, notifications[outcome])
+            for outcome in ("enqueued", "sent", "failed", "retried", "deduplicated")
+        ]),
+        ("scheduler_leader", "gauge", "1 si ce worker détient le bail du scheduler", [
+            ("", {}, 1 if scheduler_service.election.is_leader else 0)
+        ]),
+    ]
+
+
+@metrics.collector
+async def collect_database():
+    replicas = ReplicaRouter.stats()
+    writer = SQLiteWriter.stats()
+    return [
+        ("db_reads_total", "counter", "Lectures routées par destination", [
+            ("", {"target": key.removesuffix("_reads")}, value)
+            for key, value in replicas.items() if key.endswith("_reads")
+        ]),
+        ("db_replica_healthy", "gauge", "Réplica joignable et à jour", [
+            ("", {"replica": str(replica["index"])}, 1 if replica["healthy"] else 0) for replica in replicas["replicas"]
+        ]),
+        ("db_replica_lag_seconds", "gauge", "Retard de réplication mesuré", [
+            ("", {"replica": str(replica["index"])}, replica["lag"]) for replica in replicas["replicas"]
+        ]),
+        ("sqlite_writer_acquisitions_total", "counter", "Passages par la file d'écriture SQLite", [
+            ("", {}, writer["acquired"])
+        ]),
+        ("sqlite_writer_timeouts_total", "counter", "Attentes de la file d'écriture abandonnées", [
+            ("", {}, writer["timeouts"])
+        ]),
+        ("sqlite_writer_waiting", "gauge", "Sessions en attente de la file d'écriture", [("", {}, writer["waiting"])]),
+    ]
+
+
+@metrics.collector
+async def collect_runtime():
+    idempotency = Idempotency.stats()
+    logs = LogPipeline.stats()
+    return [
+        ("idempotency_requests_total", "counter", "Requêtes avec Idempotency-Key par issue", [
+            ("", {"outcome": outcome}, idempotency[outcome])
+            for outcome in ("executed", "replayed", "waited", "mismatched")
+        ]),
+        ("log_records_queued", "gauge", "Enregistrements en attente d'écriture", [("", {}, logs["queued"])]),
+        ("log_records_dropped_total", "counter", "Enregistrements abandonnés (file pleine)", [("", {}, logs["dropped"])]),
+        ("log_records_sampled_out_total", "counter", "Enregistrements écartés par échantillonnage", [
+            ("", {}, logs["sampled_out"])
+        ]),
+    ]
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    """Métriques du worker au format texte Prometheus"""
+    if settings.METRICS_TOKEN:
+        expected = f"Bearer {settings.METRICS_TOKEN}"
+        if not authorization or not hmac.compare_digest(authorization, expected):
+            raise HTTPException(status_code=401, detail="Jeton de métriques invalide")
+    return PlainTextResponse(await metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
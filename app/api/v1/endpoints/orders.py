@@ -1,16 +1,18 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from app.db.session import get_db
-from app.api.v1.deps import get_current_user
-from app.models.user import User
+from app.api.v1.deps import get_current_principal, get_read_db
+from app.core.idempotency import Idempotency
+from app.core.principal_cache import Principal
 from app.models.listing import Listing
 from app.models.order import Order, OrderStatus
-from app.schemas.order import OrderCreate, OrderResponse
+from app.schemas.order import OrderCreate, OrderResponse, OrderPage
 from app.services.escrow_service import EscrowService
-from app.services.ai_simplifier import AISimplifierService   # ⬅️ IMPORT IA
+from app.services.order_service import OrderService
+from app.services.ai_enrichment import EnrichmentWorker, enrichment_worker
 
 router = APIRouter()
 
@@ -18,9 +20,8 @@ router = APIRouter()
 @router.post("/", response_model=OrderResponse)
 async def create_order(
     order_in: OrderCreate,
-    background_tasks: BackgroundTasks,     # ⬅️ Permet d'appeler l'IA en tâche de fond
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Créer une nouvelle demande de service (Statut PENDING)."""
 
@@ -44,35 +45,31 @@ async def create_order(
     )
 
     db.add(new_order)
-    await db.commit()
-    await db.refresh(new_order)
+    await db.flush()
 
-    # ------------- 🔥 INTÉGRATION IA (SAFE ASYNC BACKGROUND TASK) -------------
+    # Enrichissement IA : tâche durable, écrite avec la commande
     if order_in.problem_description:
-        background_tasks.add_task(
-            AISimplifierService.analyze_order,
-            new_order.id,
-            order_in.problem_description
-        )
-        print(f"🧠 IA: Tâche lancée pour order #{new_order.id}")  # ⬅️ LOG DE CONFIRMATION
-    # -------------------------------------------------------------------------
+        EnrichmentWorker.enqueue(db, new_order.id)
+
+    await db.commit()
+    await db.refresh(new_order)
+    enrichment_worker.notify()
 
     return new_order
 
 
-@router.get("/", response_model=List[OrderResponse])
+@router.get("/", response_model=OrderPage)
 async def my_orders(
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    status: Optional[OrderStatus] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    """Récupère l'historique des commandes (Client ou Partenaire)."""
-
-    query = select(Order).where(
-        (Order.client_id == current_user.id) | (Order.partner_id == current_user.id)
-    ).order_by(Order.created_at.desc())
-
-    result = await db.execute(query)
-    return result.scalars().all()
+    """Récupère l'historique des commandes (Client ou Partenaire), page par page."""
+    return await OrderService.get_user_orders(
+        db, current_user.id, cursor=cursor, limit=limit, status=status
+    )
 
 
 # --- ACTIONS ESCROW & WORKFLOW (MVP "Cafard") ---
@@ -81,18 +78,24 @@ async def my_orders(
 @router.post("/{order_id}/pay")
 async def pay_order(
     order_id: int,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    """Le client paie et bloque les fonds (Escrow)."""
-    return await EscrowService.lock_funds(db, order_id, current_user.id)
+    """Le client paie et bloque les fonds (Escrow). Rejouable avec Idempotency-Key."""
+    return await Idempotency.run(
+        db, idempotency_key, f"{current_user.id}:orders.pay", {"order_id": order_id},
+        lambda: EscrowService.lock_funds(db, order_id, current_user.id),
+        response
+    )
 
 
 @router.post("/{order_id}/finish")
 async def finish_work(
     order_id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """L'artisan déclare avoir fini. Démarre le timer 48h."""
     return await EscrowService.declare_job_finished(db, order_id, current_user.id)
@@ -102,7 +105,7 @@ async def finish_work(
 async def validate_work(
     order_id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Le client valide manuellement. Libération immédiate."""
     return await EscrowService.release_funds(db, order_id, trigger_source="CLIENT")
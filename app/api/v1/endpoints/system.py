@@ -0,0 +1,90 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from app.api.v1.deps import get_current_admin
+from app.core.idempotency import Idempotency
+from app.core.logging import LogPipeline
+from app.core.loop_monitor import LoopMonitor
+from app.core.principal_cache import Principal
+from app.core.profiling import Profiler
+from app.core.scheduler import scheduler_service
+from app.db.session import ReplicaRouter, SQLiteWriter
+from app.services.notification_engine import notification_engine
+from app.services.ai_simplifier import AISimplifierService
+from app.services.ai_enrichment import enrichment_worker
+from app.jobs.reconciliation_job import job_reconcile_ledger
+
+router = APIRouter()
+
+@router.get("/leader")
+async def get_scheduler_leader(current_user: Principal = Depends(get_current_admin)):
+    """Détenteur du bail du scheduler (noeud, jeton de fencing, expiration)"""
+    return await scheduler_service.election.describe()
+
+@router.get("/notifications")
+async def get_notification_stats(current_user: Principal = Depends(get_current_admin)):
+    """Débit et retard de livraison des notifications (file, retries, dédupliquées)"""
+    return notification_engine.stats()
+
+@router.get("/ai")
+async def get_ai_stats(current_user: Principal = Depends(get_current_admin)):
+    """Appels modèle, cache d'analyse, circuit breaker et file d'enrichissement"""
+    return {**AISimplifierService.stats(), "enrichment": await enrichment_worker.stats()}
+
+@router.get("/idempotency")
+async def get_idempotency_stats(current_user: Principal = Depends(get_current_admin)):
+    """Requêtes exécutées, rejouées, doublons mis en attente, clés réutilisées"""
+    return Idempotency.stats()
+
+@router.get("/replicas")
+async def get_replica_status(current_user: Principal = Depends(get_current_admin)):
+    """Santé et retard des réplicas, répartition des lectures (réplica / primaire / collantes)"""
+    return ReplicaRouter.stats()
+
+@router.get("/logging")
+async def get_logging_status(current_user: Principal = Depends(get_current_admin)):
+    """Pipeline de logs : file en attente d'écriture, enregistrements abandonnés / échantillonnés"""
+    return LogPipeline.stats()
+
+@router.get("/loop")
+async def get_event_loop_status(current_user: Principal = Depends(get_current_admin)):
+    """Retard de l'event loop : blocages (route, fonction, pile de l'appel bloquant), retard max"""
+    return LoopMonitor.stats()
+
+@router.get("/sqlite")
+async def get_sqlite_writer_status(current_user: Principal = Depends(get_current_admin)):
+    """File d'écriture SQLite : acquisitions, attentes en cours, attente / détention max, délais dépassés"""
+    return SQLiteWriter.stats()
+
+@router.get("/profiles")
+async def list_profiles(current_user: Principal = Depends(get_current_admin)):
+    """Profils enregistrés sur ce worker (requêtes X-Profile: 1, jobs armés), du plus récent au plus ancien"""
+    return {**Profiler.stats(), "jobs": sorted(Profiler.jobs), "profiles": Profiler.list_artifacts()}
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, current_user: Principal = Depends(get_current_admin)):
+    """Résumé d'un profil et allocations encore vivantes en fin d'exécution (diff tracemalloc)"""
+    path = Profiler.artifact_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profil introuvable")
+    return FileResponse(path, media_type="application/json")
+
+@router.get("/profiles/{profile_id}/speedscope")
+async def download_profile(profile_id: str, current_user: Principal = Depends(get_current_admin)):
+    """Profil CPU échantillonné au format speedscope (https://www.speedscope.app)"""
+    path = Profiler.artifact_path(profile_id, speedscope=True)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profil introuvable")
+    return FileResponse(path, media_type="application/json", filename=f"{profile_id}.speedscope.json")
+
+@router.post("/profiles/jobs/{job}")
+async def arm_job_profile(job: str, current_user: Principal = Depends(get_current_admin)):
+    """Profile la prochaine exécution du job (sur le worker leader)"""
+    if job not in Profiler.jobs:
+        raise HTTPException(status_code=404, detail="Job inconnu")
+    await Profiler.arm_job(job)
+    return {"job": job, "armed": True}
+
+@router.post("/ledger/reconcile")
+async def reconcile_ledger(current_user: Principal = Depends(get_current_admin)):
+    """Réconciliation incrémentale immédiate (wallets vérifiés, points posés, écarts)"""
+    return await job_reconcile_ledger(fenced=False)
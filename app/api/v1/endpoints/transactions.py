@@ -1,24 +1,64 @@
-from fastapi import APIRouter, Depends
+from datetime import datetime
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.db.session import get_db
-from app.api.v1.deps import get_current_user
-from app.models.user import User
-from app.models.transaction import Transaction
-from sqlalchemy import select
+from app.api.v1.deps import get_current_principal, get_read_db
+from app.core.principal_cache import Principal
+from app.schemas.transaction import TransactionPage
+from app.services.transaction_service import TransactionService
 
 router = APIRouter()
 
-@router.get("/")
+@router.get("/", response_model=TransactionPage)
 async def get_my_transactions(
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    type: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    order_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    """Récupérer l'historique des transactions de l'utilisateur"""
-    query = select(Transaction).where(
-        Transaction.wallet_id == current_user.wallet.id
-    ).order_by(Transaction.created_at.desc())
-    
-    result = await db.execute(query)
-    transactions = result.scalars().all()
-    
-    return transactions
+    """Récupérer l'historique des transactions de l'utilisateur (filtré, paginé)"""
+    wallet_id = await TransactionService.get_wallet_id(db, current_user.id)
+    return await TransactionService.get_history(
+        db,
+        wallet_id,
+        cursor=cursor,
+        limit=limit,
+        tx_type=type,
+        date_from=date_from,
+        date_to=date_to,
+        order_id=order_id
+    )
+
+@router.get("/export")
+async def export_my_transactions(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    type: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    order_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Export comptable complet (NDJSON ou CSV), envoyé en streaming"""
+    wallet_id = await TransactionService.get_wallet_id(db, current_user.id)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"transactions-{wallet_id}.{format}"
+
+    return StreamingResponse(
+        TransactionService.stream_export(
+            wallet_id,
+            export_format=format,
+            tx_type=type,
+            date_from=date_from,
+            date_to=date_to,
+            order_id=order_id,
+            user_id=current_user.id
+        ),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -1,11 +1,12 @@
+import asyncio
 import os
 import uuid
 from pathlib import Path
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
 from fastapi.responses import JSONResponse
 from app.core.config import settings
-from app.api.v1.deps import get_current_user
-from app.models.user import User
+from app.api.v1.deps import get_current_principal
+from app.core.principal_cache import Principal
 
 router = APIRouter()
 
@@ -16,7 +17,7 @@ Path(settings.STATIC_DIR).mkdir(parents=True, exist_ok=True)
 async def upload_file(
     file: UploadFile = File(...),
     # On force l'utilisateur à être connecté pour l'upload
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Accepte un fichier (idéalement compressé par le client), le sauve
@@ -36,11 +37,10 @@ async def upload_file(
     file_path = Path(settings.STATIC_DIR) / unique_filename
     
     try:
-        # 4. Écriture du fichier sur le disque
-        with open(file_path, "wb") as buffer:
-            # Note: read() charge tout en mémoire, ce qui est acceptable pour des fichiers pré-compressés (150-500 KB)
-            data = await file.read() 
-            buffer.write(data)
+        # 4. Écriture du fichier sur le disque (dans un thread : pas d'I/O disque dans l'event loop)
+        # Note: read() charge tout en mémoire, ce qui est acceptable pour des fichiers pré-compressés (150-500 KB)
+        data = await file.read()
+        await asyncio.to_thread(file_path.write_bytes, data)
             
         # 5. Construction de l'URL de retour
         # L'URL est relative au préfixe /static que nous allons ajouter dans main.py
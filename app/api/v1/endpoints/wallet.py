@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from app.db.session import get_db
-from app.api.v1.deps import get_current_user
-from app.models.user import User
+from app.api.v1.deps import get_current_principal
+from app.core.idempotency import Idempotency
+from app.core.principal_cache import Principal
 from app.models.wallet import Wallet
 from app.schemas.wallet import WalletResponse, WalletDepositRequest, WalletWithdrawRequest
 from app.services.wallet_service import WalletService
@@ -14,25 +17,46 @@ router = APIRouter()
 @router.get("/me", response_model=WalletResponse)
 async def get_my_wallet(
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Récupère le wallet de l'utilisateur connecté."""
     return await WalletService.get_balance(db, current_user.id)
 
+@router.get("/me/balance-as-of")
+async def get_my_balance_as_of(
+    at: datetime = Query(..., description="Date (ISO 8601)"),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Solde du wallet à une date passée (relevé)."""
+    return await WalletService.balance_as_of(db, current_user.id, at)
+
 @router.post("/deposit")
 async def deposit_to_wallet(
     deposit_in: WalletDepositRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    """Dépose de l'argent sur le wallet"""
-    return await WalletService.deposit(db, current_user.id, deposit_in.amount)
+    """Dépose de l'argent sur le wallet (rejouable sans double crédit avec Idempotency-Key)"""
+    return await Idempotency.run(
+        db, idempotency_key, f"{current_user.id}:wallet.deposit", deposit_in,
+        lambda: WalletService.deposit(db, current_user.id, deposit_in.amount),
+        response
+    )
 
 @router.post("/withdraw")
 async def withdraw_from_wallet(
     withdraw_in: WalletWithdrawRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    """Retrait d'argent du wallet"""
-    return await WalletService.withdraw(db, current_user.id, withdraw_in.amount)
\ No newline at end of file
+    """Retrait d'argent du wallet (rejouable sans double débit avec Idempotency-Key)"""
+    return await Idempotency.run(
+        db, idempotency_key, f"{current_user.id}:wallet.withdraw", withdraw_in,
+        lambda: WalletService.withdraw(db, current_user.id, withdraw_in.amount),
+        response
+    )
\ No newline at end of file
@@ -1,6 +1,35 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, ClassVar, Dict, Iterable, NamedTuple, Optional, Tuple
+
 import redis.asyncio as redis
+from redis.exceptions import RedisError
 from app.core.config import settings
-from typing import Optional
+from app.core.metrics import observe_cache
+
+logger = logging.getLogger(__name__)
+
+# Écrit l'entrée et l'ajoute aux ensembles de ses tags, sauf si une génération
+# de tag a changé depuis le début du chargement (invalidation concurrente).
+# KEYS : clé, n générations, n ensembles de tags ; ARGV : valeur, expiration, n générations lues
+_STORE_IF_GENERATIONS_SCRIPT = """
+local n = (#KEYS - 1) / 2
+for i = 1, n do
+    if (redis.call('get', KEYS[1 + i]) or '0') ~= ARGV[2 + i] then
+        return 0
+    end
+end
+redis.call('set', KEYS[1], ARGV[1], 'EX', ARGV[2])
+for i = 1, n do
+    redis.call('sadd', KEYS[1 + n + i], KEYS[1])
+    redis.call('expire', KEYS[1 + n + i], ARGV[2])
+end
+return 1
+"""
 
 class CacheManager:
     _redis: Optional[redis.Redis] = None
@@ -9,8 +38,8 @@ class CacheManager:
     def get_client(cls) -> redis.Redis:
         if cls._redis is None:
             cls._redis = redis.from_url(
-                settings.REDIS_URL, 
-                encoding="utf-8", 
+                settings.REDIS_URL,
+                encoding="utf-8",
                 decode_responses=True
             )
         return cls._redis
@@ -19,4 +48,389 @@ class CacheManager:
     async def close(cls):
         if cls._redis:
             await cls._redis.close()
-            cls._redis = None
\ No newline at end of file
+            cls._redis = None
+
+
+class LRUCache:
+    """LRU borné en mémoire (par worker). Pas thread-safe : réservé à l'event loop."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def items(self):
+        return list(self._data.items())
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class CacheEntry(NamedTuple):
+    value: Any
+    fresh_until: float  # Au-delà : valeur "stale", servie pendant le recalcul
+    stale_until: float  # Au-delà : valeur inutilisable
+    tags: Tuple[str, ...] = ()
+
+
+class TieredCache:
+    """
+    Cache à deux niveaux : LRU local (par worker) devant Redis.
+
+    - Single-flight : une seule coroutine par clé recalcule, les autres attendent
+    - Stale-while-revalidate : une valeur expirée depuis peu est servie
+      immédiatement pendant que le recalcul tourne en tâche de fond
+    - TTL avec jitter pour éviter que des clés chaudes expirent ensemble
+    - Tags optionnels pour une invalidation ciblée ; chaque tag a une
+      génération (Redis + locale) incrémentée par invalidate_tags. Un
+      chargement lancé avant une invalidation n'est pas stocké : les
+      générations lues avant le loader sont comparées au moment d'écrire
+
+    Le loader ne doit pas dépendre d'une ressource liée à la requête (session DB
+    de la requête...) : il peut être exécuté en tâche de fond après la réponse.
+    Redis fait foi : une clé absente de Redis (supprimée ou invalidée par un
+    autre worker) n'est plus servie depuis la copie locale au-delà de local_ttl.
+    Redis indisponible => fonctionnement dégradé sur le seul cache local.
+    """
+
+    _instances: ClassVar[Dict[str, "TieredCache"]] = {}
+    # Après une erreur Redis, on ne retente qu'après ce délai (évite de payer
+    # un timeout de connexion à chaque lecture quand Redis est tombé)
+    REDIS_RETRY_DELAY: ClassVar[float] = 5.0
+    _redis_retry_at: ClassVar[float] = 0.0
+    # Durée de vie d'une génération de tag (doit dépasser le plus long chargement)
+    GENERATION_TTL: ClassVar[int] = 24 * 3600
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl: float,
+        stale_ttl: float = 0,
+        local_ttl: float = 5,
+        local_maxsize: int = 1024,
+        jitter: float = 0.1,
+    ):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.local_ttl = local_ttl
+        self.jitter = jitter
+        self._local = LRUCache(local_maxsize)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._inflight_tags: Dict[str, Tuple[str, ...]] = {}
+        self._generations: Dict[str, int] = {}
+        self.counters = {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "stale_served": 0,
+            "refreshes": 0,
+            "errors": 0,
+            "discarded": 0,  # chargements invalidés en cours de route, non stockés
+        }
+        TieredCache._instances[namespace] = self
+
+    # ===== Redis =====
+
+    @classmethod
+    def _redis(cls) -> Optional[redis.Redis]:
+        if time.time() < cls._redis_retry_at:
+            return None
+        return CacheManager.get_client()
+
+    def _redis_failed(self, action: str, error: Exception):
+        TieredCache._redis_retry_at = time.time() + self.REDIS_RETRY_DELAY
+        logger.warning(f"⚠️ Cache {self.namespace}: {action} Redis impossible: {error}")
+
+    # ===== Clés =====
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.namespace}:tag:{tag}"
+
+    def _generation_key(self, tag: str) -> str:
+        return f"{self.namespace}:gen:{tag}"
+
+    # ===== Lecture =====
+
+    async def get_or_set(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        tags: Iterable[str] = (),
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await self._get_or_set(key, loader, tags)
+        finally:
+            observe_cache(self.namespace, time.perf_counter() - started)
+
+    async def _get_or_set(self, key: str, loader: Callable[[], Awaitable[Any]], tags: Iterable[str]) -> Any:
+        full_key = self._key(key)
+        now = time.time()
+
+        local = self._local.get(full_key)
+        if local is not None:
+            entry, local_until = local
+            if local_until > now and entry.fresh_until > now:
+                self.counters["local_hits"] += 1
+                return entry.value
+
+        entry, reachable = await self._redis_get(full_key)
+        if entry is not None:
+            self._local.set(full_key, (entry, now + self.local_ttl))
+        else:
+            entry = self._local_fallback(full_key, local, reachable)
+
+        if entry is not None and entry.fresh_until > now:
+            self.counters["redis_hits"] += 1
+            return entry.value
+
+        if entry is not None and entry.stale_until > now:
+            self.counters["stale_served"] += 1
+            if full_key not in self._inflight:
+                self.counters["refreshes"] += 1
+                self._start_load(full_key, loader, tuple(tags))
+            return entry.value
+
+        if full_key in self._inflight:
+            self.counters["coalesced"] += 1
+        else:
+            self.counters["misses"] += 1
+            self._start_load(full_key, loader, tuple(tags))
+        return await asyncio.shield(self._inflight[full_key])
+
+    async def get(self, key: str) -> Any:
+        """Lecture seule (fraîche ou périmée depuis peu), sans recalcul. None si absente."""
+        started = time.perf_counter()
+        try:
+            return await self._get(key)
+        finally:
+            observe_cache(self.namespace, time.perf_counter() - started)
+
+    async def _get(self, key: str) -> Any:
+        full_key = self._key(key)
+        now = time.time()
+
+        local = self._local.get(full_key)
+        if local is not None and local[1] > now and local[0].fresh_until > now:
+            self.counters["local_hits"] += 1
+            return local[0].value
+
+        entry, reachable = await self._redis_get(full_key)
+        if entry is not None:
+            self._local.set(full_key, (entry, now + self.local_ttl))
+        else:
+            entry = self._local_fallback(full_key, local, reachable)
+
+        if entry is not None and entry.stale_until > now:
+            self.counters["redis_hits" if entry.fresh_until > now else "stale_served"] += 1
+            return entry.value
+        self.counters["misses"] += 1
+        return None
+
+    def _local_fallback(self, full_key: str, local: Optional[tuple], reachable: bool) -> Optional[CacheEntry]:
+        """Entrée locale utilisable quand Redis n'a rien renvoyé"""
+        # Une autre coroutine a pu charger la clé pendant l'attente Redis
+        current = self._local.get(full_key)
+        if not reachable:
+            # Redis indisponible : la copie locale reste la meilleure source
+            current = current or local
+            return current[0] if current is not None else None
+        if current is not None and current is not local and current[1] > time.time():
+            return current[0]
+        # Absente de Redis (supprimée / invalidée ailleurs, ou expirée) : copie locale caduque
+        self._local.delete(full_key)
+        return None
+
+    def _start_load(self, full_key: str, loader: Callable[[], Awaitable[Any]], tags: Tuple[str, ...]):
+        task = asyncio.ensure_future(self._load(full_key, loader, tags))
+        self._inflight[full_key] = task
+        self._inflight_tags[full_key] = tags
+        task.add_done_callback(lambda t: self._on_load_done(full_key, t))
+
+    def _on_load_done(self, full_key: str, task: asyncio.Task):
+        if self._inflight.get(full_key) is task:
+            del self._inflight[full_key]
+            self._inflight_tags.pop(full_key, None)
+        if not task.cancelled() and task.exception() is not None:
+            self.counters["errors"] += 1
+            logger.warning(f"⚠️ Cache {self.namespace}: échec du recalcul de {full_key}: {task.exception()}")
+
+    async def _load(self, full_key: str, loader: Callable[[], Awaitable[Any]], tags: Tuple[str, ...]) -> Any:
+        generations = await self._read_generations(tags) if tags else None
+        value = await loader()
+        await self._store(full_key, value, tags, generations)
+        return value
+
+    def _local_generations(self, tags: Tuple[str, ...]) -> Tuple[int, ...]:
+        return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    async def _read_generations(self, tags: Tuple[str, ...]) -> tuple:
+        """(générations locales, générations Redis ou None si illisibles) avant un chargement"""
+        local = self._local_generations(tags)
+        client = self._redis()
+        if client is None:
+            return local, None
+        try:
+            values = await client.mget([self._generation_key(tag) for tag in tags])
+        except (RedisError, OSError) as e:
+            self._redis_failed("lecture des générations", e)
+            return local, None
+        return local, [value or "0" for value in values]
+
+    # ===== Écriture / invalidation =====
+
+    async def set(self, key: str, value: Any, tags: Iterable[str] = ()):
+        await self._store(self._key(key), value, tuple(tags))
+
+    async def _store(
+        self,
+        full_key: str,
+        value: Any,
+        tags: Tuple[str, ...],
+        generations: Optional[tuple] = None,
+    ):
+        """
+        Écrit l'entrée (local + Redis). Avec `generations` (lues avant le
+        chargement), rien n'est écrit si un des tags a été invalidé entre-temps.
+        """
+        if generations is not None and generations[0] != self._local_generations(tags):
+            self.counters["discarded"] += 1
+            return
+
+        now = time.time()
+        ttl = self.ttl * random.uniform(1 - self.jitter, 1 + self.jitter)
+        entry = CacheEntry(value, now + ttl, now + ttl + self.stale_ttl, tags)
+        expire = int(ttl + self.stale_ttl) + 1
+        payload = json.dumps({"v": value, "f": entry.fresh_until, "s": entry.stale_until, "t": tags})
+
+        client = self._redis()
+        if client is not None and (generations is None or generations[1] is not None):
+            try:
+                if generations is None:
+                    async with client.pipeline(transaction=False) as pipe:
+                        pipe.set(full_key, payload, ex=expire)
+                        for tag in tags:
+                            tag_key = self._tag_key(tag)
+                            pipe.sadd(tag_key, full_key)
+                            pipe.expire(tag_key, expire)
+                        await pipe.execute()
+                else:
+                    stored = await client.eval(
+                        _STORE_IF_GENERATIONS_SCRIPT,
+                        1 + 2 * len(tags),
+                        full_key,
+                        *(self._generation_key(tag) for tag in tags),
+                        *(self._tag_key(tag) for tag in tags),
+                        payload,
+                        expire,
+                        *generations[1],
+                    )
+                    if not stored:
+                        self.counters["discarded"] += 1
+                        return
+            except (RedisError, OSError) as e:
+                self._redis_failed("écriture", e)
+
+        # Invalidation locale pendant l'écriture Redis : pas de copie locale
+        if generations is not None and generations[0] != self._local_generations(tags):
+            self.counters["discarded"] += 1
+            return
+        self._local.set(full_key, (entry, now + self.local_ttl))
+
+    async def delete(self, *keys: str):
+        full_keys = [self._key(key) for key in keys]
+        for full_key in full_keys:
+            self._local.delete(full_key)
+        client = self._redis()
+        if not full_keys or client is None:
+            return
+        try:
+            await client.delete(*full_keys)
+        except (RedisError, OSError) as e:
+            self._redis_failed("suppression", e)
+
+    async def invalidate_tags(self, *tags: str):
+        """
+        Supprime toutes les entrées rattachées à l'un des tags (local + Redis)
+        et incrémente leurs générations : les chargements en cours ne seront
+        pas stockés, et les lectures suivantes n'attendent plus ces chargements.
+        """
+        tag_set = set(tags)
+        for tag in tag_set:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+        for full_key, (entry, _) in self._local.items():
+            if tag_set.intersection(entry.tags):
+                self._local.delete(full_key)
+        for full_key, inflight_tags in list(self._inflight_tags.items()):
+            if tag_set.intersection(inflight_tags):
+                del self._inflight_tags[full_key]
+                self._inflight.pop(full_key, None)
+
+        client = self._redis()
+        if client is None:
+            return
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                for tag in tag_set:
+                    pipe.incr(self._generation_key(tag))
+                    pipe.expire(self._generation_key(tag), self.GENERATION_TTL)
+                await pipe.execute()
+            for tag in tag_set:
+                tag_key = self._tag_key(tag)
+                keys = await client.smembers(tag_key)
+                await client.delete(tag_key, *keys)
+        except (RedisError, OSError) as e:
+            self._redis_failed("invalidation", e)
+
+    async def _redis_get(self, full_key: str) -> Tuple[Optional[CacheEntry], bool]:
+        """(entrée ou None, Redis joignable) : distingue une clé absente d'un Redis indisponible"""
+        client = self._redis()
+        if client is None:
+            return None, False
+        try:
+            raw = await client.get(full_key)
+        except (RedisError, OSError) as e:
+            self._redis_failed("lecture", e)
+            return None, False
+        if not raw:
+            return None, True
+        data = json.loads(raw)
+        return CacheEntry(data["v"], data["f"], data["s"], tuple(data.get("t", ()))), True
+
+    # ===== Statistiques =====
+
+    def stats(self) -> dict:
+        lookups = sum(self.counters[k] for k in ("local_hits", "redis_hits", "misses", "coalesced", "stale_served"))
+        hits = self.counters["local_hits"] + self.counters["redis_hits"] + self.counters["stale_served"]
+        return {
+            **self.counters,
+            "local_size": len(self._local),
+            "inflight": len(self._inflight),
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+    @classmethod
+    def all_stats(cls) -> Dict[str, dict]:
+        return {namespace: cache.stats() for namespace, cache in cls._instances.items()}
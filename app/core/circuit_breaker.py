@@ -0,0 +1,71 @@
+"""
+CircuitBreaker - Coupe les appels vers une dépendance qui échoue en boucle
+
+CLOSED : appels normaux. Après `failure_threshold` échecs consécutifs, OPEN :
+plus aucun appel pendant `cooldown` secondes. Puis HALF_OPEN : un seul appel
+d'essai, qui referme le circuit s'il réussit ou le rouvre s'il échoue.
+"""
+
+import time
+
+
+class CircuitOpenError(Exception):
+    """Appel refusé : circuit ouvert"""
+
+
+class CircuitBreaker:
+
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+    def __init__(self, name: str, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.counters = {"opened": 0, "rejected": 0}
+
+    def retry_after(self) -> float:
+        """Secondes avant qu'un appel soit de nouveau autorisé (0 si autorisé)"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(self.opened_at + self.cooldown - time.monotonic(), 0.0)
+
+    def before_call(self):
+        if self.state == self.OPEN:
+            if self.retry_after() > 0:
+                self.counters["rejected"] += 1
+                raise CircuitOpenError(f"Circuit {self.name} ouvert")
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self.counters["rejected"] += 1
+                raise CircuitOpenError(f"Circuit {self.name} en test")
+            self._probe_in_flight = True
+
+    def record_success(self):
+        self.failures = 0
+        self.state = self.CLOSED
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.counters["opened"] += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_after": round(self.retry_after(), 1),
+            **self.counters,
+        }
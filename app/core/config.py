@@ -22,8 +22,107 @@ class Settings(BaseSettings):
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
 
+    # Hachage des mots de passe (bcrypt hors event loop)
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4  # hachages simultanés max par worker
+    PASSWORD_HASH_MAX_QUEUE_MS: int = 2000  # attente max avant rejet 429
+
+    # Cache d'authentification (principal vérifié)
+    AUTH_CACHE_LOCAL_TTL: int = 30  # secondes, borne la propagation d'une invalidation entre workers
+    AUTH_CACHE_REDIS_TTL: int = 300
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+
+    # Journalisation (app.core.logging)
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # "json" ou "text"
+    LOG_LEVELS: str = ""  # niveaux par module, ex. "app.core.cache=DEBUG,uvicorn.access=WARNING"
+    LOG_SAMPLING: str = ""  # fraction gardée sous WARNING, ex. "app.core.cache=0.01"
+    LOG_QUEUE_SIZE: int = 10000  # au-delà, les enregistrements sont abandonnés (comptés)
+    DB_ECHO: bool = False  # requêtes SQL journalisées (sqlalchemy.engine en INFO)
+
+    # Métriques (/metrics, format Prometheus)
+    METRICS_TOKEN: str = ""  # si défini, /metrics exige "Authorization: Bearer <token>"
+    SERVER_TIMING: bool = True  # en-tête Server-Timing (app / db / cache) sur chaque réponse
+
+    # Profilage à la demande (app.core.profiling) : requêtes X-Profile: 1 d'un admin, jobs armés
+    PROFILING_ENABLED: bool = True  # False : middleware non installé, jobs jamais profilés
+    PROFILE_DIR: str = "profiles"  # artefacts <id>.json et <id>.speedscope.json
+    PROFILE_INTERVAL_MS: float = 5.0  # période d'échantillonnage de la pile
+    PROFILE_MAX_SECONDS: float = 120.0  # échantillonnage arrêté au-delà (la requête continue)
+    PROFILE_MAX_ARTIFACTS: int = 50  # les plus anciens sont supprimés
+    PROFILE_TRACEMALLOC_FRAMES: int = 1  # profondeur des traces d'allocation (1 : par ligne, le moins coûteux)
+
+    # Surveillance de l'event loop (app.core.loop_monitor)
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL_MS: float = 50.0  # période du battement (retard mesuré à chaque réveil)
+    LOOP_STALL_THRESHOLD_MS: float = 200.0  # au-delà : blocage, pile du thread de l'event loop relevée
+    LOOP_STALL_HISTORY: int = 50  # derniers blocages gardés pour GET /system/loop
+
+    # SQLite (petits déploiements régionaux)
+    SQLITE_PROFILE: str = "production"  # "production" (WAL, pragmas, écrivain unique) ou "legacy" (défauts SQLite)
+    SQLITE_SYNCHRONOUS: str = "NORMAL"  # sûr en WAL : seule la dernière transaction peut être perdue sur coupure
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024  # octets lus par mmap
+    SQLITE_CACHE_SIZE_KB: int = 64 * 1024  # cache de pages par connexion
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # attente du verrou d'écriture (autres processus) et de la file
+    SQLITE_SINGLE_WRITER: bool = True  # écritures du processus sérialisées dans l'event loop (profil production)
+
+    # Réplicas en lecture (optionnels)
+    DATABASE_REPLICA_URLS: str = ""  # URLs séparées par des virgules (même format que le primaire)
+    REPLICA_MAX_LAG: float = 5.0  # secondes de retard au-delà desquelles on lit sur le primaire
+    REPLICA_STICKY_SECONDS: float = 10.0  # lectures sur le primaire après un commit de l'utilisateur
+    REPLICA_HEALTH_INTERVAL: int = 5  # secondes entre deux sondes de santé / retard
+
+    # Jobs planifiés
+    AUTO_RELEASE_CHUNK_SIZE: int = 500  # escrows libérés (et commités) par lot
+    REMINDER_CHUNK_SIZE: int = 500  # commandes escaladées (et commitées) par lot
+    DELAY_QUEUE_BATCH_SIZE: int = 500  # échéances retirées de la file par passage
+    DELAY_QUEUE_MAX_SLEEP: int = 60  # sommeil max du dispatcher (secondes)
+    DELAY_QUEUE_LEASE: int = 300  # bail d'une échéance en cours de traitement (secondes)
+
+    # Grand livre
+    PLATFORM_ACCOUNT_PHONE: str = "KOCO-PLATFORM"  # compte technique crédité des commissions
+    LEDGER_RECONCILE_HOUR: int = 2  # réconciliation nocturne (heure UTC)
+    LEDGER_RECONCILE_BATCH_SIZE: int = 1000  # wallets vérifiés (et commités) par lot
+
+    # Idempotence des appels monétaires (en-tête Idempotency-Key)
+    IDEMPOTENCY_TTL: int = 24 * 3600  # secondes de conservation d'une réponse rejouable
+    IDEMPOTENCY_LOCK_TTL: int = 30  # secondes avant qu'un marqueur "en cours" orphelin expire
+    IDEMPOTENCY_WAIT_TIMEOUT: float = 10.0  # attente max d'un doublon concurrent avant 409
+
+    # Élection du leader des jobs (un seul worker exécute le scheduler)
+    # "database" ou "redis" : choix du backend d'élection seulement. Le fencing
+    # (check_fence) compare toujours le jeton de la ligne leader_leases en base
+    LEADER_BACKEND: str = "database"
+    LEADER_LEASE_TTL: int = 15  # secondes sans renouvellement avant bascule
+    LEADER_RENEW_INTERVAL: int = 5  # renouvellement (leader) / tentative (suiveurs)
+
+    # Notifications sortantes (SMS / WhatsApp)
+    NOTIFICATION_PROVIDER: str = "log"  # "log", "fake" ou "http"
+    NOTIFICATION_HTTP_URL: str = ""  # endpoint d'envoi par lot du fournisseur
+    NOTIFICATION_HTTP_TOKEN: str = ""
+    NOTIFICATION_RATE_PER_SECOND: float = 20.0  # messages/s autorisés par le fournisseur
+    NOTIFICATION_BATCH_SIZE: int = 50  # messages par appel fournisseur
+    NOTIFICATION_WORKERS: int = 4
+    NOTIFICATION_QUEUE_SIZE: int = 10000  # au-delà, l'appelant attend (backpressure)
+    NOTIFICATION_MAX_RETRIES: int = 5
+    NOTIFICATION_DEDUPE_TTL: int = 7 * 24 * 3600  # secondes
+
     # IA
     GEMINI_API_KEY: str = ""
+    AI_CACHE_TTL: int = 30 * 24 * 3600  # analyse d'une description normalisée (secondes)
+    AI_CACHE_MAX_ENTRIES: int = 5000  # entrées du LRU local
+    AI_PROVIDER: str = "gemini"  # "gemini" ou "stub" (local, déterministe)
+    AI_BATCH_SIZE: int = 10  # descriptions par appel modèle
+    AI_CONCURRENCY: int = 2  # appels modèle simultanés par worker
+    AI_CALL_TIMEOUT: float = 30.0  # secondes
+    AI_BREAKER_THRESHOLD: int = 3  # échecs consécutifs avant ouverture du circuit
+    AI_BREAKER_COOLDOWN: int = 60  # secondes circuit ouvert
+    AI_ENRICH_POLL_INTERVAL: int = 5  # secondes entre deux lectures de la file vide
+    AI_ENRICH_LEASE: int = 300  # secondes avant qu'une tâche non confirmée redevienne visible
+    AI_ENRICH_MAX_ATTEMPTS: int = 5
+    AI_LOCAL_CLASSIFIER: bool = True  # classifieur local avant tout appel modèle
+    AI_LOCAL_MIN_CONFIDENCE: float = 0.9  # en dessous, le modèle distant tranche
+    AI_LOCAL_TRAINING_LIMIT: int = 20000  # commandes enrichies apprises au démarrage
 
     @computed_field
     @property
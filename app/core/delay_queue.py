@@ -0,0 +1,157 @@
+"""
+DelayQueue - Échéances précises par commande (rappels, libération 48h)
+
+Les échéances sont des lignes `scheduled_tasks` écrites dans la même
+transaction que le changement de statut (durables, fonctionne sous SQLite
+comme sous PostgreSQL). Le dispatcher du SchedulerService dort jusqu'à la
+prochaine échéance et ne traite que ce qui est dû.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import AsyncSessionLocal
+from app.models.scheduled_task import ScheduledTask, TaskKind
+
+logger = logging.getLogger(__name__)
+
+# Délais depuis la déclaration de fin de travaux (delivered_at)
+REMINDER_DELAYS_HOURS = (24, 36, 47)
+AUTO_RELEASE_DELAY_HOURS = 48
+
+# Échéances consommées par le dispatcher du scheduler
+DISPATCH_KINDS = (TaskKind.REMINDER, TaskKind.AUTO_RELEASE)
+
+
+class DelayQueue:
+
+    _wakeup: Optional[asyncio.Event] = None
+
+    @classmethod
+    def _event(cls) -> asyncio.Event:
+        if cls._wakeup is None:
+            cls._wakeup = asyncio.Event()
+        return cls._wakeup
+
+    @staticmethod
+    def enqueue(db: AsyncSession, kind: TaskKind, order_id: int, due_at: datetime):
+        """Ajoute une échéance (sans commit : écrite avec la transaction appelante)"""
+        db.add(ScheduledTask(kind=kind, order_id=order_id, due_at=due_at))
+
+    @classmethod
+    def schedule_delivery_timers(cls, db: AsyncSession, order_id: int, delivered_at: datetime):
+        """Rappels J+1 / +36h / +47h et libération automatique à +48h"""
+        for hours in REMINDER_DELAYS_HOURS:
+            cls.enqueue(db, TaskKind.REMINDER, order_id, delivered_at + timedelta(hours=hours))
+        cls.enqueue(db, TaskKind.AUTO_RELEASE, order_id, delivered_at + timedelta(hours=AUTO_RELEASE_DELAY_HOURS))
+
+    @classmethod
+    def notify(cls):
+        """Réveille le dispatcher local (nouvelle échéance potentiellement plus proche)"""
+        cls._event().set()
+
+    @classmethod
+    async def wait(cls, timeout: float):
+        """Dort jusqu'au timeout ou jusqu'à un notify()"""
+        event = cls._event()
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        event.clear()
+
+    @staticmethod
+    async def next_due_at(kinds: Sequence[TaskKind] = DISPATCH_KINDS) -> Optional[datetime]:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(func.min(ScheduledTask.due_at)).where(ScheduledTask.kind.in_(kinds))
+            )
+            return result.scalar()
+
+    @staticmethod
+    async def backlog(now: Optional[datetime] = None, kinds: Sequence[TaskKind] = tuple(TaskKind)) -> int:
+        """Nombre d'échéances déjà dues et non traitées"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(func.count()).select_from(ScheduledTask).where(
+                    ScheduledTask.kind.in_(kinds),
+                    ScheduledTask.due_at <= (now or datetime.utcnow())
+                )
+            )
+            return result.scalar() or 0
+
+    @staticmethod
+    async def backlog_by_kind(now: Optional[datetime] = None) -> Dict[TaskKind, int]:
+        """Échéances dues et non traitées, par type (en une requête)"""
+        async with AsyncSessionLocal() as db:
+            rows = await db.execute(
+                select(ScheduledTask.kind, func.count())
+                .where(ScheduledTask.due_at <= (now or datetime.utcnow()))
+                .group_by(ScheduledTask.kind)
+            )
+            counts = {kind: 0 for kind in TaskKind}
+            counts.update({kind: count for kind, count in rows})
+            return counts
+
+    # ===== Consommation avec bail (traitements à confirmer) =====
+
+    @staticmethod
+    async def lease_due(kind: TaskKind, limit: int, lease_seconds: float) -> List[Tuple[int, int, int]]:
+        """
+        Loue des échéances dues : due_at est repoussé de lease_seconds et
+        attempts incrémenté, sans supprimer la ligne. Si le worker meurt avant
+        complete(), l'échéance redevient visible à la fin du bail.
+        Retourne des (task_id, order_id, attempts).
+        """
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(ScheduledTask.id)
+                .where(ScheduledTask.kind == kind, ScheduledTask.due_at <= now)
+                .order_by(ScheduledTask.due_at)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+            task_ids = result.scalars().all()
+            if not task_ids:
+                return []
+
+            result = await db.execute(
+                update(ScheduledTask)
+                .where(ScheduledTask.id.in_(task_ids))
+                .values(
+                    due_at=now + timedelta(seconds=lease_seconds),
+                    attempts=ScheduledTask.attempts + 1
+                )
+                .returning(ScheduledTask.id, ScheduledTask.order_id, ScheduledTask.attempts)
+                .execution_options(synchronize_session=False)
+            )
+            leased = [tuple(row) for row in result.all()]
+            await db.commit()
+            return leased
+
+    @staticmethod
+    async def complete(db: AsyncSession, task_ids: Sequence[int]):
+        """Supprime des échéances traitées (sans commit : avec l'écriture du résultat)"""
+        if task_ids:
+            await db.execute(
+                delete(ScheduledTask)
+                .where(ScheduledTask.id.in_(task_ids))
+                .execution_options(synchronize_session=False)
+            )
+
+    @staticmethod
+    async def reschedule(db: AsyncSession, task_ids: Sequence[int], due_at: datetime):
+        """Replanifie des échéances à retenter (sans commit)"""
+        if task_ids:
+            await db.execute(
+                update(ScheduledTask)
+                .where(ScheduledTask.id.in_(task_ids))
+                .values(due_at=due_at)
+                .execution_options(synchronize_session=False)
+            )
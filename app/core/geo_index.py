@@ -0,0 +1,308 @@
+"""
+GeoIndex - Index spatial des listings disponibles
+
+Redis GEO (GEOADD / GEOSEARCH) en priorité. Si Redis est absent, on se replie
+sur un index en mémoire découpé en cellules (grille lat/lon), pour que le coût
+d'une recherche dépende du nombre de voisins et non de la taille de la table.
+"""
+
+import logging
+import math
+import uuid
+from typing import Dict, List, Optional, Set, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import CacheManager
+from app.models.listing import Listing
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371
+
+# Pendant une reconstruction (verrou présent), note le listing modifié
+_MARK_DIRTY_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    redis.call('sadd', KEYS[2], ARGV[1])
+    redis.call('pexpire', KEYS[2], ARGV[2])
+end
+return 0
+"""
+
+# Libère le verrou uniquement s'il est toujours le nôtre
+_UNLOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distance orthodromique en km entre deux points (Haversine)"""
+    d_lat = math.radians(lat2 - lat1)
+    d_lon = math.radians(lon2 - lon1)
+    a = (math.sin(d_lat / 2) ** 2 +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
+         math.sin(d_lon / 2) ** 2)
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def _is_valid_point(lat: Optional[float], lon: Optional[float]) -> bool:
+    # Limites acceptées par Redis GEO (projection Web Mercator)
+    return (
+        lat is not None and lon is not None
+        and -85.05112878 <= lat <= 85.05112878
+        and -180 <= lon <= 180
+    )
+
+
+class GeoIndex:
+    """Index spatial des listings (Redis GEO + repli en mémoire)"""
+
+    REDIS_KEY = "market:geo:listings"
+    REBUILD_LOCK_KEY = "market:geo:listings:rebuild-lock"
+    DIRTY_KEY = "market:geo:listings:dirty"
+    REBUILD_LOCK_TTL = 300  # secondes
+    CELL_DEG = 0.05  # ~5,5 km de côté à l'équateur
+    REBUILD_BATCH = 500
+
+    # Repli en mémoire (par worker)
+    _points: Dict[int, Tuple[float, float]] = {}
+    _cells: Dict[Tuple[int, int], Set[int]] = {}
+    # Listings modifiés sur ce worker pendant une reconstruction (None hors reconstruction)
+    _dirty: Optional[Set[int]] = None
+
+    # ===== Index en mémoire =====
+
+    @classmethod
+    def _cell(cls, lat: float, lon: float) -> Tuple[int, int]:
+        return (math.floor(lat / cls.CELL_DEG), math.floor(lon / cls.CELL_DEG))
+
+    @classmethod
+    def _local_add(cls, listing_id: int, lat: float, lon: float):
+        if cls._dirty is not None:
+            cls._dirty.add(listing_id)
+        cls._local_remove(listing_id)
+        cls._points[listing_id] = (lat, lon)
+        cls._cells.setdefault(cls._cell(lat, lon), set()).add(listing_id)
+
+    @classmethod
+    def _local_remove(cls, listing_id: int):
+        if cls._dirty is not None:
+            cls._dirty.add(listing_id)
+        point = cls._points.pop(listing_id, None)
+        if point is None:
+            return
+        cell = cls._cell(*point)
+        members = cls._cells.get(cell)
+        if members is not None:
+            members.discard(listing_id)
+            if not members:
+                del cls._cells[cell]
+
+    @classmethod
+    def _local_search(cls, lat: float, lon: float, radius_km: float) -> List[Tuple[int, float]]:
+        # Boîte englobante convertie en plage de cellules
+        d_lat = radius_km / 111.0
+        d_lon = radius_km / (111.0 * max(math.cos(math.radians(lat)), 0.01))
+        min_cell = cls._cell(lat - d_lat, lon - d_lon)
+        max_cell = cls._cell(lat + d_lat, lon + d_lon)
+
+        hits = []
+        for cell_lat in range(min_cell[0], max_cell[0] + 1):
+            for cell_lon in range(min_cell[1], max_cell[1] + 1):
+                for listing_id in cls._cells.get((cell_lat, cell_lon), ()):
+                    p_lat, p_lon = cls._points[listing_id]
+                    dist = haversine_km(lat, lon, p_lat, p_lon)
+                    if dist <= radius_km:
+                        hits.append((listing_id, dist))
+
+        hits.sort(key=lambda hit: hit[1])
+        return hits
+
+    # ===== Redis =====
+
+    @classmethod
+    def _mark_dirty(cls, pipe, listing_id: int):
+        """Marque le listing si une reconstruction est en cours (avant l'écriture, même pipeline)"""
+        pipe.eval(
+            _MARK_DIRTY_SCRIPT, 2, cls.REBUILD_LOCK_KEY, cls.DIRTY_KEY, listing_id, cls.REBUILD_LOCK_TTL * 1000
+        )
+
+    # ===== API publique =====
+
+    @classmethod
+    async def add(cls, listing_id: int, lat: float, lon: float):
+        """Ajoute (ou déplace) un listing dans l'index"""
+        if not _is_valid_point(lat, lon):
+            await cls.remove(listing_id)
+            return
+
+        cls._local_add(listing_id, lat, lon)
+        try:
+            pipe = CacheManager.get_client().pipeline(transaction=False)
+            cls._mark_dirty(pipe, listing_id)
+            pipe.geoadd(cls.REDIS_KEY, (lon, lat, listing_id))
+            await pipe.execute()
+        except (RedisError, OSError) as e:
+            logger.warning(f"⚠️ GeoIndex: GEOADD impossible pour listing #{listing_id}: {e}")
+
+    @classmethod
+    async def remove(cls, listing_id: int):
+        """Retire un listing de l'index"""
+        cls._local_remove(listing_id)
+        try:
+            pipe = CacheManager.get_client().pipeline(transaction=False)
+            cls._mark_dirty(pipe, listing_id)
+            pipe.zrem(cls.REDIS_KEY, listing_id)
+            await pipe.execute()
+        except (RedisError, OSError) as e:
+            logger.warning(f"⚠️ GeoIndex: ZREM impossible pour listing #{listing_id}: {e}")
+
+    @classmethod
+    async def sync_listing(cls, listing: Listing):
+        """Aligne l'index sur l'état du listing (coordonnées + disponibilité)"""
+        if listing.is_available and _is_valid_point(listing.latitude, listing.longitude):
+            await cls.add(listing.id, listing.latitude, listing.longitude)
+        else:
+            await cls.remove(listing.id)
+
+    @classmethod
+    async def search(cls, lat: float, lon: float, radius_km: float) -> List[Tuple[int, float]]:
+        """
+        Retourne les (listing_id, distance_km) dans le rayon, triés par distance.
+        """
+        try:
+            redis = CacheManager.get_client()
+            results = await redis.geosearch(
+                cls.REDIS_KEY,
+                longitude=lon,
+                latitude=lat,
+                radius=radius_km,
+                unit="km",
+                withdist=True,
+                sort="ASC",
+            )
+            return [(int(member), float(dist)) for member, dist in results]
+        except (RedisError, OSError) as e:
+            logger.warning(f"⚠️ GeoIndex: GEOSEARCH indisponible, repli en mémoire: {e}")
+            return cls._local_search(lat, lon, radius_km)
+
+    @staticmethod
+    async def _load_points(db: AsyncSession, listing_ids: Optional[Set[int]] = None) -> Dict[int, Tuple[float, float]]:
+        """Points indexables (disponibles, coordonnées valides), éventuellement restreints à listing_ids"""
+        query = select(Listing.id, Listing.latitude, Listing.longitude).where(
+            Listing.is_available == True,
+            Listing.latitude.is_not(None),
+            Listing.longitude.is_not(None),
+        )
+        if listing_ids is not None:
+            query = query.where(Listing.id.in_(listing_ids))
+        result = await db.execute(query)
+        return {row.id: (row.latitude, row.longitude) for row in result
+                if _is_valid_point(row.latitude, row.longitude)}
+
+    @classmethod
+    async def rebuild(cls, db: AsyncSession) -> int:
+        """
+        Reconstruit l'index depuis la table listings (au démarrage).
+
+        L'index mémoire est reconstruit sur chaque worker ; l'index Redis par
+        un seul (verrou SET NX) : clé temporaire propre à la reconstruction
+        puis RENAME, pour ne jamais exposer un index vide aux autres workers.
+        Les add / remove arrivés pendant la reconstruction (verrou présent)
+        sont notés dans un ensemble "dirty" : ces listings sont relus en base
+        et réappliqués après le RENAME, sinon il les écraserait.
+        """
+        token = uuid.uuid4().hex
+        redis = None
+        owner = False
+        try:
+            redis = CacheManager.get_client()
+            owner = bool(await redis.set(cls.REBUILD_LOCK_KEY, token, nx=True, px=cls.REBUILD_LOCK_TTL * 1000))
+        except (RedisError, OSError) as e:
+            redis = None
+            logger.warning(f"⚠️ GeoIndex: reconstruction Redis impossible, index mémoire seul: {e}")
+
+        cls._dirty = set()
+        try:
+            points = await cls._load_points(db)
+            # Modifiés sur ce worker pendant la lecture : ensuite, l'index mémoire est à jour
+            dirty, cls._dirty = cls._dirty or set(), None
+            cls._points = {}
+            cls._cells = {}
+            for listing_id, (lat, lon) in points.items():
+                cls._local_add(listing_id, lat, lon)
+
+            if owner:
+                dirty |= await cls._rebuild_redis(redis, token, points)
+            elif redis is not None:
+                logger.info("🗺️ GeoIndex: index Redis reconstruit par un autre worker")
+        finally:
+            cls._dirty = None
+            if owner:
+                try:
+                    await redis.eval(_UNLOCK_SCRIPT, 1, cls.REBUILD_LOCK_KEY, token)
+                except (RedisError, OSError) as e:
+                    logger.warning(f"⚠️ GeoIndex: libération du verrou de reconstruction impossible: {e}")
+
+        if dirty:
+            await cls._reapply(db, redis if owner else None, dirty)
+
+        logger.info(f"🗺️ GeoIndex reconstruit: {len(points)} listings indexés ({len(dirty)} modifiés entre-temps)")
+        return len(points)
+
+    @classmethod
+    async def _rebuild_redis(cls, redis, token: str, points: Dict[int, Tuple[float, float]]) -> Set[int]:
+        """Remplit une clé temporaire, RENAME, puis retourne les listings modifiés entre-temps"""
+        tmp_key = f"{cls.REDIS_KEY}:rebuild:{token}"
+        items = list(points.items())
+        try:
+            if not items:
+                await redis.delete(cls.REDIS_KEY)
+            else:
+                for i in range(0, len(items), cls.REBUILD_BATCH):
+                    values = []
+                    for listing_id, (lat, lon) in items[i:i + cls.REBUILD_BATCH]:
+                        values.extend((lon, lat, listing_id))
+                    await redis.geoadd(tmp_key, values)
+                await redis.rename(tmp_key, cls.REDIS_KEY)
+
+            pipe = redis.pipeline(transaction=True)
+            pipe.smembers(cls.DIRTY_KEY)
+            pipe.delete(cls.DIRTY_KEY)
+            members, _ = await pipe.execute()
+            return {int(member) for member in members}
+        except (RedisError, OSError) as e:
+            logger.warning(f"⚠️ GeoIndex: reconstruction Redis impossible, index mémoire seul: {e}")
+            try:
+                await redis.delete(tmp_key)
+            except (RedisError, OSError):
+                pass
+            return set()
+
+    @classmethod
+    async def _reapply(cls, db: AsyncSession, redis, listing_ids: Set[int]):
+        """Relit les listings modifiés pendant la reconstruction et réaligne l'index (mémoire, Redis si fourni)"""
+        points = await cls._load_points(db, listing_ids)
+        for listing_id in listing_ids:
+            if listing_id in points:
+                cls._local_add(listing_id, *points[listing_id])
+            else:
+                cls._local_remove(listing_id)
+        if redis is None:
+            return
+        try:
+            pipe = redis.pipeline(transaction=False)
+            for listing_id in listing_ids:
+                if listing_id in points:
+                    lat, lon = points[listing_id]
+                    pipe.geoadd(cls.REDIS_KEY, (lon, lat, listing_id))
+                else:
+                    pipe.zrem(cls.REDIS_KEY, listing_id)
+            await pipe.execute()
+        except (RedisError, OSError) as e:
+            logger.warning(f"⚠️ GeoIndex: réapplication des listings modifiés impossible: {e}")
@@ -0,0 +1,307 @@
+"""
+Idempotency - Rejeu sûr des appels monétaires (en-tête Idempotency-Key)
+
+Un client qui renvoie la même requête avec la même clé reçoit la réponse
+de la première exécution, sans que l'opération soit rejouée.
+
+- Redis (chemin rapide) : marqueur "pending" posé par SET NX avant
+  l'exécution, remplacé par la réponse après. Un doublon concurrent voit
+  le marqueur et attend la réponse au lieu de s'exécuter en parallèle.
+- Base (source de vérité) : la ligne idempotency_keys est insérée dans la
+  transaction de l'opération, donc commitée avec le mouvement d'argent.
+  Sans Redis, un doublon concurrent bloque sur l'index unique jusqu'au
+  commit de la première requête, puis rejoue sa réponse.
+
+Empreinte (sha256 du corps) : réutiliser une clé pour une autre requête
+est refusé (422). Les erreurs métier (4xx) sont enregistrées et rejouées ;
+les erreurs serveur (5xx, 429) ne le sont pas : la requête peut être
+retentée avec la même clé.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, ClassVar, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from redis.exceptions import RedisError
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import CacheManager
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.idempotency_key import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 255
+REPLAY_HEADER = "Idempotent-Replayed"
+POLL_INTERVAL = 0.05  # secondes, doublé jusqu'à MAX_POLL_INTERVAL
+MAX_POLL_INTERVAL = 0.5
+
+
+class Idempotency:
+
+    # Réveil immédiat des doublons du même worker
+    _waiters: ClassVar[Dict[str, asyncio.Event]] = {}
+    # Après une erreur Redis, on ne retente qu'après ce délai (base seule entre-temps)
+    REDIS_RETRY_DELAY: ClassVar[float] = 5.0
+    _redis_retry_at: ClassVar[float] = 0.0
+    counters = {"executed": 0, "replayed": 0, "waited": 0, "mismatched": 0, "redis_errors": 0}
+
+    @classmethod
+    async def run(
+        cls,
+        db: AsyncSession,
+        key: Optional[str],
+        scope: str,
+        payload: Any,
+        call: Callable[[], Awaitable[Any]],
+        response: Optional[Response] = None
+    ) -> Any:
+        """
+        Exécute `call` une seule fois par (scope, key). `scope` identifie
+        l'utilisateur et l'opération ; `payload` est le corps à comparer.
+        Sans clé, `call` est simplement exécuté.
+        """
+        if key is None:
+            return await call()
+        if not key.strip() or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail="Idempotency-Key invalide")
+
+        full_key = f"{scope}:{key}"
+        fingerprint = hashlib.sha256(
+            json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":")).encode()
+        ).hexdigest()
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+        poll, waited = POLL_INTERVAL, False
+
+        while True:
+            claimed, stored = await cls._redis_claim(full_key, fingerprint)
+            if claimed:
+                break
+            if stored is None:
+                continue  # marqueur expiré entre SET NX et GET : on retente
+            if stored["s"] == "done":
+                return cls._replay(stored["f"], stored["c"], stored["b"], fingerprint, response)
+
+            # Première requête en cours (ce worker ou un autre) : on attend sa réponse
+            cls._check_fingerprint(stored["f"], fingerprint)
+            if not waited:
+                cls.counters["waited"] += 1
+                waited = True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise HTTPException(status_code=409, detail="Requête identique en cours, réessayez plus tard")
+            event = cls._waiters.get(full_key)
+            try:
+                if event is not None:
+                    await asyncio.wait_for(event.wait(), timeout=min(poll, remaining))
+                else:
+                    await asyncio.sleep(min(poll, remaining))
+            except asyncio.TimeoutError:
+                pass
+            poll = min(poll * 2, MAX_POLL_INTERVAL)
+
+        return await cls._execute(db, full_key, fingerprint, call, response, deadline)
+
+    # ===== Exécution =====
+
+    @classmethod
+    async def _execute(
+        cls,
+        db: AsyncSession,
+        full_key: str,
+        fingerprint: str,
+        call: Callable[[], Awaitable[Any]],
+        response: Optional[Response],
+        deadline: float
+    ) -> Any:
+        event = cls._waiters.setdefault(full_key, asyncio.Event())
+        try:
+            # Ligne écrite dans la transaction de l'opération (commitée par le service)
+            db.add(IdempotencyKey(
+                key=full_key,
+                fingerprint=fingerprint,
+                expires_at=datetime.utcnow() + timedelta(seconds=settings.IDEMPOTENCY_TTL)
+            ))
+            try:
+                await db.flush()
+            except IntegrityError:
+                # Déjà exécutée (ou en cours, Redis absent) : on rejoue sa réponse
+                await db.rollback()
+                return await cls._replay_from_db(db, full_key, fingerprint, response, deadline)
+
+            try:
+                result = await call()
+            except HTTPException as e:
+                if e.status_code >= 500 or e.status_code == 429:
+                    await cls._abandon(db, full_key)
+                    raise
+                await cls._store(db, full_key, fingerprint, e.status_code, {"detail": e.detail})
+                raise
+            except BaseException:
+                await cls._abandon(db, full_key)
+                raise
+
+            cls.counters["executed"] += 1
+            await cls._store(db, full_key, fingerprint, 200, jsonable_encoder(result))
+            return result
+        finally:
+            if cls._waiters.get(full_key) is event:
+                del cls._waiters[full_key]
+            event.set()
+
+    @classmethod
+    async def _store(cls, db: AsyncSession, full_key: str, fingerprint: str, status_code: int, body: Any):
+        """Enregistre la réponse (base puis Redis) ; la ligne peut avoir été annulée par un rollback du service"""
+        raw = json.dumps(body)
+        try:
+            stored = await db.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.key == full_key)
+                .values(status_code=status_code, response=raw)
+                .execution_options(synchronize_session=False)
+            )
+            if stored.rowcount == 0:
+                db.add(IdempotencyKey(
+                    key=full_key,
+                    fingerprint=fingerprint,
+                    status_code=status_code,
+                    response=raw,
+                    expires_at=datetime.utcnow() + timedelta(seconds=settings.IDEMPOTENCY_TTL)
+                ))
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+        except Exception as e:
+            # L'opération est commitée : seule la réponse rejouable est perdue
+            await db.rollback()
+            logger.error(f"❌ Idempotency: réponse de {full_key} non enregistrée: {e}")
+
+        await cls._redis_set(full_key, {"s": "done", "f": fingerprint, "c": status_code, "b": body},
+                             ttl_ms=settings.IDEMPOTENCY_TTL * 1000)
+
+    @classmethod
+    async def _abandon(cls, db: AsyncSession, full_key: str):
+        """Échec non rejouable : rien n'est commité, la clé redevient libre"""
+        await db.rollback()
+        client = cls._redis()
+        if client is None:
+            return
+        try:
+            await client.delete(cls._redis_key(full_key))
+        except (RedisError, OSError) as e:
+            cls._redis_failed(e)
+
+    # ===== Rejeu =====
+
+    @classmethod
+    def _check_fingerprint(cls, stored: str, fingerprint: str):
+        if stored != fingerprint:
+            cls.counters["mismatched"] += 1
+            raise HTTPException(status_code=422, detail="Idempotency-Key déjà utilisée pour une autre requête")
+
+    @classmethod
+    def _replay(cls, stored_fingerprint: str, status_code: int, body: Any, fingerprint: str, response: Optional[Response]) -> Any:
+        cls._check_fingerprint(stored_fingerprint, fingerprint)
+        cls.counters["replayed"] += 1
+        if status_code >= 400:
+            raise HTTPException(status_code=status_code, detail=body.get("detail"), headers={REPLAY_HEADER: "true"})
+        if response is not None:
+            response.headers[REPLAY_HEADER] = "true"
+        return body
+
+    @classmethod
+    async def _replay_from_db(
+        cls, db: AsyncSession, full_key: str, fingerprint: str, response: Optional[Response], deadline: float
+    ) -> Any:
+        """La ligne existe : on attend que sa réponse soit enregistrée (juste après le commit)"""
+        poll = POLL_INTERVAL
+        while True:
+            row = (await db.execute(
+                select(IdempotencyKey.fingerprint, IdempotencyKey.status_code, IdempotencyKey.response)
+                .where(IdempotencyKey.key == full_key)
+            )).first()
+            await db.commit()
+            if row is not None and row.response is not None:
+                body = json.loads(row.response)
+                await cls._redis_set(full_key, {"s": "done", "f": row.fingerprint, "c": row.status_code, "b": body},
+                                     ttl_ms=settings.IDEMPOTENCY_TTL * 1000)
+                return cls._replay(row.fingerprint, row.status_code, body, fingerprint, response)
+            if row is not None:
+                cls._check_fingerprint(row.fingerprint, fingerprint)
+            remaining = deadline - time.monotonic()
+            if row is None or remaining <= 0:
+                # Première exécution annulée, ou commitée sans réponse enregistrée (arrêt brutal)
+                raise HTTPException(status_code=409, detail="Requête identique en cours ou déjà traitée, réessayez plus tard")
+            await asyncio.sleep(min(poll, remaining))
+            poll = min(poll * 2, MAX_POLL_INTERVAL)
+
+    # ===== Redis =====
+
+    @staticmethod
+    def _redis_key(full_key: str) -> str:
+        return f"idem:{full_key}"
+
+    @classmethod
+    def _redis(cls):
+        if time.time() < cls._redis_retry_at:
+            return None
+        return CacheManager.get_client()
+
+    @classmethod
+    def _redis_failed(cls, error: Exception):
+        cls.counters["redis_errors"] += 1
+        cls._redis_retry_at = time.time() + cls.REDIS_RETRY_DELAY
+        logger.warning(f"⚠️ Idempotency: Redis indisponible, repli sur la base: {error}")
+
+    @classmethod
+    async def _redis_claim(cls, full_key: str, fingerprint: str) -> Tuple[bool, Optional[dict]]:
+        """(True, None) si la clé nous revient (ou Redis absent), sinon (False, valeur existante)"""
+        client = cls._redis()
+        if client is None:
+            return True, None
+        redis_key = cls._redis_key(full_key)
+        try:
+            pending = json.dumps({"s": "pending", "f": fingerprint})
+            if await client.set(redis_key, pending, nx=True, px=settings.IDEMPOTENCY_LOCK_TTL * 1000):
+                return True, None
+            raw = await client.get(redis_key)
+        except (RedisError, OSError) as e:
+            cls._redis_failed(e)
+            return True, None
+        return False, (json.loads(raw) if raw else None)
+
+    @classmethod
+    async def _redis_set(cls, full_key: str, value: dict, ttl_ms: int):
+        client = cls._redis()
+        if client is None:
+            return
+        try:
+            await client.set(cls._redis_key(full_key), json.dumps(value), px=ttl_ms)
+        except (RedisError, OSError) as e:
+            cls._redis_failed(e)
+
+    # ===== Maintenance =====
+
+    @staticmethod
+    async def purge_expired() -> int:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(IdempotencyKey)
+                .where(IdempotencyKey.expires_at < datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            return result.rowcount or 0
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {**cls.counters, "inflight": len(cls._waiters)}
@@ -0,0 +1,351 @@
+"""
+LeaderElection - Un seul worker exécute les jobs planifiés
+
+Élection par bail (lease) à durée limitée, renouvelé par le leader :
+- backend "database" (défaut) : ligne `leader_leases` prise / renouvelée par
+  UPDATE conditionnel, fonctionne sous SQLite comme sous PostgreSQL
+- backend "redis" : SET NX PX + renouvellement par script Lua
+
+Chaque prise de bail incrémente un jeton de fencing, toujours porté par la
+ligne `leader_leases` (le backend redis n'assure que l'élection : le
+nouveau leader y inscrit son jeton avant de prendre la main). Les jobs
+appellent `check_fence(db)` dans leur transaction avant d'écrire : la ligne
+est relue FOR SHARE, un ancien leader figé (GC, réseau) qui se réveille ne
+peut plus modifier les données.
+Bascule : au plus LEADER_LEASE_TTL + LEADER_RENEW_INTERVAL secondes si le
+leader meurt, immédiate (au prochain essai) s'il s'arrête proprement.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import CacheManager
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.leader_lease import LeaderLease
+
+logger = logging.getLogger(__name__)
+
+# Prend le bail s'il est libre (valeur provisoire : le noeud seul, sans jeton)
+_ACQUIRE_SCRIPT = """
+if redis.call('set', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+# Renouvelle / libère uniquement si le bail est toujours le nôtre (même jeton)
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Remplace la valeur provisoire par noeud|jeton si le bail est toujours le nôtre
+_TAG_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    redis.call('set', KEYS[1], ARGV[2], 'PX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaseLostError(Exception):
+    """Le bail n'est plus détenu par ce worker : l'écriture doit être abandonnée"""
+
+
+class LeaderElection:
+
+    def __init__(self, name: str):
+        self.name = name
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.token: Optional[int] = None
+        self.on_elected: Optional[Callable[[], None]] = None
+        self.on_demoted: Optional[Callable[[], None]] = None
+        self.counters = {"elections": 0, "demotions": 0, "renew_failures": 0, "fence_rejections": 0}
+        self._valid_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def backend(self) -> str:
+        return settings.LEADER_BACKEND
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    @property
+    def is_leader(self) -> bool:
+        # Validité estimée localement à partir de l'instant de la demande :
+        # le leader se démet avant que les autres puissent reprendre le bail
+        return self.token is not None and time.monotonic() < self._valid_until
+
+    # ===== Cycle de vie =====
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            logger.info(f"🗳️ Élection '{self.name}' démarrée (noeud {self.node_id}, backend {self.backend})")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.token is not None:
+            try:
+                await self._release()
+            except Exception as e:
+                logger.warning(f"⚠️ Élection '{self.name}': libération du bail impossible: {e}")
+            self._demote("arrêt du worker")
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                if self.token is not None:
+                    if await self._renew():
+                        self._valid_until = started + settings.LEADER_LEASE_TTL
+                    else:
+                        self._demote("bail repris par un autre noeud")
+                else:
+                    token = await self._acquire()
+                    if token:
+                        self.token = token
+                        self._valid_until = started + settings.LEADER_LEASE_TTL
+                        self.counters["elections"] += 1
+                        logger.info(f"👑 Élection '{self.name}': {self.node_id} devient leader (jeton {token})")
+                        if self.on_elected:
+                            self.on_elected()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.counters["renew_failures"] += 1
+                logger.error(f"❌ Élection '{self.name}': backend injoignable: {e}")
+
+            if self.token is not None and not self.is_leader:
+                self._demote("bail expiré sans renouvellement")
+            await asyncio.sleep(settings.LEADER_RENEW_INTERVAL)
+
+    def _demote(self, reason: str):
+        if self.token is None:
+            return
+        logger.warning(f"⚠️ Élection '{self.name}': {self.node_id} n'est plus leader ({reason})")
+        self.token = None
+        self._valid_until = 0.0
+        self.counters["demotions"] += 1
+        if self.on_demoted:
+            self.on_demoted()
+
+    # ===== Fencing =====
+
+    async def check_fence(self, db: AsyncSession):
+        """
+        Vérifie, dans la transaction de l'appelant, que ce worker détient
+        toujours le bail. Sous PostgreSQL la ligne est verrouillée FOR SHARE :
+        aucune reprise du bail ne peut aboutir avant le commit du lot.
+        Sans élection active (job lancé à la main), aucune vérification.
+        """
+        if not self.running:
+            return
+        if not self.is_leader:
+            self.counters["fence_rejections"] += 1
+            raise LeaseLostError(f"Bail '{self.name}' non détenu")
+
+        # Jeton comparé en base pour les deux backends (avec redis, la ligne
+        # ne porte que le jeton : l'expiration du bail est gérée par Redis)
+        conditions = [
+            LeaderLease.name == self.name,
+            LeaderLease.holder == self.node_id,
+            LeaderLease.token == self.token,
+        ]
+        if self.backend != "redis":
+            conditions.append(LeaderLease.expires_at > datetime.utcnow())
+        result = await db.execute(
+            select(LeaderLease.token).where(*conditions).with_for_update(read=True)
+        )
+        valid = result.scalar() is not None
+
+        if not valid:
+            self.counters["fence_rejections"] += 1
+            token = self.token
+            # Bail repris (ou jeton réécrit par un autre noeud) : nouvelle élection
+            self._demote("jeton de fencing périmé")
+            raise LeaseLostError(f"Jeton de fencing {token} périmé pour '{self.name}'")
+
+    # ===== Backends =====
+
+    @property
+    def _redis_key(self) -> str:
+        return f"leader:{self.name}"
+
+    @property
+    def _redis_value(self) -> str:
+        return f"{self.node_id}|{self.token}"
+
+    async def _acquire(self) -> Optional[int]:
+        ttl_ms = settings.LEADER_LEASE_TTL * 1000
+        if self.backend == "redis":
+            return await self._acquire_redis(ttl_ms)
+
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            await self._ensure_row(db)
+            result = await db.execute(
+                update(LeaderLease)
+                .where(
+                    LeaderLease.name == self.name,
+                    or_(LeaderLease.holder.is_(None), LeaderLease.expires_at < now)
+                )
+                .values(
+                    holder=self.node_id,
+                    token=LeaderLease.token + 1,
+                    expires_at=now + timedelta(seconds=settings.LEADER_LEASE_TTL)
+                )
+                .returning(LeaderLease.token)
+                .execution_options(synchronize_session=False)
+            )
+            token = result.scalar()
+            await db.commit()
+            return token
+
+    async def _acquire_redis(self, ttl_ms: int) -> Optional[int]:
+        """
+        Bail pris dans Redis, jeton tiré en base : l'UPDATE attend les lots de
+        l'ancien leader (verrou FOR SHARE de check_fence), qui échoueront ensuite.
+        """
+        client = CacheManager.get_client()
+        if not await client.eval(_ACQUIRE_SCRIPT, 1, self._redis_key, self.node_id, ttl_ms):
+            return None
+        try:
+            async with AsyncSessionLocal() as db:
+                await self._ensure_row(db)
+                result = await db.execute(
+                    update(LeaderLease)
+                    .where(LeaderLease.name == self.name)
+                    .values(holder=self.node_id, token=LeaderLease.token + 1, expires_at=None)
+                    .returning(LeaderLease.token)
+                    .execution_options(synchronize_session=False)
+                )
+                token = result.scalar()
+                await db.commit()
+        except BaseException:
+            await client.eval(_RELEASE_SCRIPT, 1, self._redis_key, self.node_id)
+            raise
+
+        # Valeur définitive noeud|jeton (renouvellement / libération / describe)
+        tagged = await client.eval(
+            _TAG_SCRIPT, 1, self._redis_key, self.node_id, f"{self.node_id}|{token}", ttl_ms
+        )
+        return token if tagged else None
+
+    async def _renew(self) -> bool:
+        if self.backend == "redis":
+            renewed = await CacheManager.get_client().eval(
+                _RENEW_SCRIPT, 1, self._redis_key, self._redis_value, settings.LEADER_LEASE_TTL * 1000
+            )
+            return bool(renewed)
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(LeaderLease)
+                .where(
+                    LeaderLease.name == self.name,
+                    LeaderLease.holder == self.node_id,
+                    LeaderLease.token == self.token
+                )
+                .values(expires_at=datetime.utcnow() + timedelta(seconds=settings.LEADER_LEASE_TTL))
+                .returning(LeaderLease.token)
+                .execution_options(synchronize_session=False)
+            )
+            renewed = result.scalar() is not None
+            await db.commit()
+            return renewed
+
+    async def _release(self):
+        if self.backend == "redis":
+            await CacheManager.get_client().eval(_RELEASE_SCRIPT, 1, self._redis_key, self._redis_value)
+            return
+
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(LeaderLease)
+                .where(
+                    LeaderLease.name == self.name,
+                    LeaderLease.holder == self.node_id,
+                    LeaderLease.token == self.token
+                )
+                .values(holder=None, expires_at=None)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+    async def _ensure_row(self, db: AsyncSession):
+        exists = await db.execute(select(LeaderLease.id).where(LeaderLease.name == self.name))
+        if exists.scalar() is None:
+            db.add(LeaderLease(name=self.name, token=0))
+            try:
+                await db.commit()
+            except IntegrityError:
+                # Créée en parallèle par un autre worker
+                await db.rollback()
+
+    # ===== Observabilité =====
+
+    async def describe(self) -> dict:
+        """Détenteur actuel du bail, vu depuis le backend"""
+        holder, token, expires_in = None, None, None
+        try:
+            if self.backend == "redis":
+                client = CacheManager.get_client()
+                value = await client.get(self._redis_key)
+                if value:
+                    holder, _, raw_token = value.rpartition("|")
+                    token = int(raw_token)
+                    expires_in = max(await client.pttl(self._redis_key), 0) / 1000
+            else:
+                async with AsyncSessionLocal() as db:
+                    row = (await db.execute(
+                        select(LeaderLease.holder, LeaderLease.token, LeaderLease.expires_at)
+                        .where(LeaderLease.name == self.name)
+                    )).first()
+                if row is not None and row.holder and row.expires_at:
+                    holder, token = row.holder, row.token
+                    expires_in = round(max((row.expires_at - datetime.utcnow()).total_seconds(), 0.0), 3)
+        except (RedisError, OSError) as e:
+            logger.warning(f"⚠️ Élection '{self.name}': lecture du bail impossible: {e}")
+
+        return {
+            "name": self.name,
+            "backend": self.backend,
+            "node_id": self.node_id,
+            "is_leader": self.is_leader,
+            "holder": holder,
+            "token": token,
+            "expires_in": expires_in,
+            "local_token": self.token,
+            **self.counters,
+        }
+
+
+# Élection du worker qui exécute le scheduler (jobs + dispatcher d'échéances)
+scheduler_election = LeaderElection("scheduler")
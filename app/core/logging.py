@@ -0,0 +1,239 @@
+"""
+Journalisation - Pipeline non bloquant (QueueHandler / QueueListener)
+
+Les appels logger.* de l'event loop ne font que déposer l'enregistrement
+dans une file bornée ; un thread (QueueListener) formate et écrit sur la
+sortie standard. File pleine : l'enregistrement est abandonné et compté,
+jamais d'attente côté requête.
+
+- Format JSON (LOG_FORMAT=json) ou texte (LOG_FORMAT=text, dev)
+- ID de requête (en-tête X-Request-ID, sinon généré) ajouté à chaque ligne
+- Niveaux par module : LOG_LEVELS="app.core.cache=DEBUG,uvicorn.access=WARNING"
+- Échantillonnage sous WARNING : LOG_SAMPLING="app.core.cache=0.01"
+  (1 % des enregistrements DEBUG / INFO de ce module et de ses enfants)
+- SQL : DB_ECHO=true passe sqlalchemy.engine en INFO dans ce même pipeline
+"""
+
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import ClassVar, Dict, Optional
+
+from app.core.config import settings
+
+# ID de la requête en cours (posé par RequestIdMiddleware)
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+REQUEST_ID_HEADER = "x-request-id"
+MAX_REQUEST_ID_LENGTH = 64
+
+# Attributs standard d'un LogRecord : le reste vient de extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+
+def _parse_pairs(raw: str) -> Dict[str, str]:
+    """"a=1,b=2" -> {"a": "1", "b": "2"} (entrées mal formées ignorées)"""
+    pairs = {}
+    for item in raw.split(","):
+        name, sep, value = item.partition("=")
+        if sep and name.strip() and value.strip():
+            pairs[name.strip()] = value.strip()
+    return pairs
+
+
+class RequestIdFilter(logging.Filter):
+    """Lu dans le contexte de l'appelant (avant la file), donc dans celui de la requête"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Garde une fraction des enregistrements sous WARNING des modules configurés"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # Préfixes les plus longs d'abord : "app.core.cache" l'emporte sur "app"
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + "."):
+                if random.random() < rate:
+                    return True
+                self.sampled_out += 1
+                return False
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par enregistrement : ts, level, logger, msg, request_id, extra, exc"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s%(request_tag)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        rid = getattr(record, "request_id", None)
+        record.request_tag = f" [{rid}]" if rid else ""
+        return super().format(record)
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """QueueHandler qui n'attend jamais : file pleine, l'enregistrement est compté puis abandonné"""
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Message résolu ici (args potentiellement mutables) ; la trace reste à part pour le JSON
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+
+class LogPipeline:
+
+    _listener: ClassVar[Optional[QueueListener]] = None
+    _handler: ClassVar[Optional[_DroppingQueueHandler]] = None
+    _sampling: ClassVar[Optional[SamplingFilter]] = None
+
+    @classmethod
+    def setup(cls):
+        """Installe le pipeline sur le logger racine (idempotent)"""
+        if cls._handler is not None:
+            cls.start()
+            return
+
+        records: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+        cls._sampling = SamplingFilter({
+            name: float(rate) for name, rate in _parse_pairs(settings.LOG_SAMPLING).items()
+        })
+        cls._handler = _DroppingQueueHandler(records)
+        cls._handler.addFilter(cls._sampling)
+        cls._handler.addFilter(RequestIdFilter())
+
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(TextFormatter() if settings.LOG_FORMAT == "text" else JsonFormatter())
+        cls._listener = QueueListener(records, output, respect_handler_level=False)
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(cls._handler)
+        root.setLevel(settings.LOG_LEVEL.upper())
+
+        # uvicorn installe ses propres handlers (écriture synchrone) : on les remplace
+        for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+            uvicorn_logger = logging.getLogger(name)
+            uvicorn_logger.handlers.clear()
+            uvicorn_logger.propagate = True
+
+        if settings.DB_ECHO:
+            logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
+        for name, level in _parse_pairs(settings.LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(level.upper())
+
+        cls.start()
+        atexit.register(cls.stop)
+
+    @classmethod
+    def start(cls):
+        if cls._listener is not None and cls._listener._thread is None:
+            cls._listener.start()
+
+    @classmethod
+    def stop(cls):
+        """Vide la file puis arrête le thread d'écriture (appelé à la sortie du processus)"""
+        if cls._listener is None or cls._listener._thread is None:
+            return
+        while True:
+            try:
+                cls._listener.stop()
+                return
+            except queue.Full:
+                time.sleep(0.01)  # place pour la sentinelle de fin
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {
+            "running": cls._listener is not None and cls._listener._thread is not None,
+            "queued": cls._handler.queue.qsize() if cls._handler else 0,
+            "dropped": _DroppingQueueHandler.dropped,
+            "sampled_out": cls._sampling.sampled_out if cls._sampling else 0,
+        }
+
+
+class RequestIdMiddleware:
+    """
+    Middleware ASGI : reprend X-Request-ID (proxy, client) ou en génère un,
+    l'expose aux logs de la requête et le renvoie dans la réponse.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        rid = None
+        for name, value in scope.get("headers", ()):
+            if name == REQUEST_ID_HEADER.encode():
+                rid = value.decode("latin-1")[:MAX_REQUEST_ID_LENGTH] or None
+                break
+        rid = rid or uuid.uuid4().hex[:16]
+        token = request_id.set(rid)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(REQUEST_ID_HEADER.encode(), rid.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
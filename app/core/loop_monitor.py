@@ -0,0 +1,209 @@
+"""
+LoopMonitor - Retard de l'event loop et détection des appels bloquants
+
+Une tâche "battement" dort LOOP_MONITOR_INTERVAL_MS puis mesure de combien
+son réveil a été retardé : c'est le retard de l'event loop (histogramme
+event_loop_lag_seconds), ce que subit toute requête prête à reprendre.
+
+Un thread de surveillance vérifie l'âge du dernier battement. Au-delà de
+LOOP_STALL_THRESHOLD_MS, l'event loop est bloqué *en ce moment* : la pile
+de son thread est relevée pendant le blocage, donc sur l'appel fautif
+(bcrypt synchrone, écriture disque, client HTTP bloquant...).
+
+Attribution d'un blocage :
+- route : gabarit de la requête (ou job:<nom>) portée par la tâche en
+  cours, d'après metrics.task_owners ; sinon la coroutine de la tâche
+- function : frame la plus profonde du code de l'application (hors
+  enveloppes d'instrumentation : metrics, profiling...)
+- blocking : frame la plus profonde tout court (souvent dans une librairie)
+
+Les derniers blocages (pile comprise) sont gardés en mémoire (GET
+/system/loop) et journalisés ; compteur event_loop_stalls_total{route,function}.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import ClassVar, Deque, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics, task_owners
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_DIR = os.path.dirname(APP_DIR)
+MAX_STACK_FRAMES = 40
+# Enveloppes d'instrumentation : jamais désignées comme fonction fautive
+WRAPPER_FILES = {
+    os.path.join(APP_DIR, "core", name) for name in ("metrics.py", "profiling.py", "logging.py", "loop_monitor.py")
+}
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+loop_lag = metrics.histogram(
+    "event_loop_lag_seconds", "Retard de réveil de l'event loop (battement)", buckets=LAG_BUCKETS
+)
+loop_stalls = metrics.counter(
+    "event_loop_stalls_total", "Blocages de l'event loop au-delà du seuil", ("route", "function")
+)
+loop_stall_seconds = metrics.histogram(
+    "event_loop_stall_duration_seconds", "Durée des blocages de l'event loop", buckets=LAG_BUCKETS
+)
+
+
+def _where(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    if filename.startswith(PROJECT_DIR + os.sep):
+        filename = os.path.relpath(filename, PROJECT_DIR)
+    return f"{filename}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _owner_label(task: Optional[asyncio.Task]) -> str:
+    if task is None:
+        return "loop"  # callback hors tâche (transport, call_soon...)
+    owner = task_owners.get(task)
+    if isinstance(owner, dict):
+        route = owner.get("route")
+        return f"{owner.get('method')} {getattr(route, 'path', None) or 'unmatched'}"
+    if owner is not None:
+        return str(owner)
+    coro = task.get_coro()
+    return f"task:{getattr(coro, '__qualname__', type(coro).__name__)}"
+
+
+class LoopMonitor:
+
+    _loop: ClassVar[Optional[asyncio.AbstractEventLoop]] = None
+    _loop_thread_id: ClassVar[Optional[int]] = None
+    _heartbeat: ClassVar[Optional[asyncio.Task]] = None
+    _watchdog: ClassVar[Optional[threading.Thread]] = None
+    _stop: ClassVar[threading.Event] = threading.Event()
+    _last_beat: ClassVar[float] = 0.0
+    # Blocage relevé par le thread, complété par le battement au réveil
+    _pending: ClassVar[Optional[dict]] = None
+    _recent: ClassVar[Deque[dict]] = deque(maxlen=50)
+    counters = {"stalls": 0, "unattributed": 0, "max_lag_ms": 0.0}
+
+    @classmethod
+    def start(cls):
+        if not settings.LOOP_MONITOR_ENABLED or cls._heartbeat is not None:
+            return
+        cls._loop = asyncio.get_running_loop()
+        cls._loop_thread_id = threading.get_ident()
+        cls._recent = deque(maxlen=settings.LOOP_STALL_HISTORY)
+        cls._last_beat = time.monotonic()
+        cls._stop.clear()
+        cls._heartbeat = asyncio.create_task(cls._beat(), name="loop-monitor")
+        cls._watchdog = threading.Thread(target=cls._watch, name="loop-watchdog", daemon=True)
+        cls._watchdog.start()
+        logger.info(
+            f"🩺 Surveillance de l'event loop (battement {settings.LOOP_MONITOR_INTERVAL_MS:.0f} ms, "
+            f"seuil {settings.LOOP_STALL_THRESHOLD_MS:.0f} ms)"
+        )
+
+    @classmethod
+    async def stop(cls):
+        if cls._heartbeat is None:
+            return
+        cls._stop.set()
+        cls._heartbeat.cancel()
+        try:
+            await cls._heartbeat
+        except asyncio.CancelledError:
+            pass
+        await asyncio.to_thread(cls._watchdog.join)
+        cls._heartbeat = cls._watchdog = None
+
+    # ===== Event loop =====
+
+    @classmethod
+    async def _beat(cls):
+        interval = settings.LOOP_MONITOR_INTERVAL_MS / 1000
+        threshold = settings.LOOP_STALL_THRESHOLD_MS / 1000
+        while True:
+            await asyncio.sleep(interval)
+            now, previous = time.monotonic(), cls._last_beat
+            lag = max(now - previous - interval, 0.0)
+            cls._last_beat = now
+            loop_lag.observe(lag)
+            cls.counters["max_lag_ms"] = max(cls.counters["max_lag_ms"], round(lag * 1000, 1))
+            if lag >= threshold:
+                cls._record_stall(lag, previous)
+
+    @classmethod
+    def _record_stall(cls, lag: float, beat: float):
+        stall, cls._pending = cls._pending, None
+        # Capture d'un blocage antérieur (thread passé juste après le réveil) : ignorée
+        if stall is not None and stall.pop("beat") != beat:
+            stall = None
+        if stall is None:
+            # Blocage terminé avant le passage du thread de surveillance
+            cls.counters["unattributed"] += 1
+            stall = {"route": "unknown", "function": "unknown", "blocking": "unknown", "stack": []}
+        stall["duration_ms"] = round(lag * 1000, 1)
+        cls.counters["stalls"] += 1
+        loop_stalls.inc(route=stall["route"], function=stall["function"])
+        loop_stall_seconds.observe(lag)
+        cls._recent.appendleft(stall)
+        logger.warning(
+            f"🐌 Event loop bloqué {stall['duration_ms']} ms : {stall['function']} ({stall['route']})",
+            extra={"blocking": stall["blocking"]}
+        )
+
+    # ===== Thread de surveillance =====
+
+    @classmethod
+    def _watch(cls):
+        interval = settings.LOOP_MONITOR_INTERVAL_MS / 1000
+        threshold = settings.LOOP_STALL_THRESHOLD_MS / 1000
+        captured_beat = None
+        while not cls._stop.wait(interval / 2):
+            beat = cls._last_beat
+            if beat == captured_beat or time.monotonic() - beat - interval < threshold:
+                continue
+            captured_beat = beat  # une capture par blocage
+            try:
+                cls._pending = cls._capture(beat)
+            except Exception as e:  # la surveillance ne doit jamais s'arrêter
+                logger.error(f"❌ LoopMonitor: capture impossible: {e}")
+
+    @classmethod
+    def _capture(cls, beat: float) -> Optional[dict]:
+        frame = sys._current_frames().get(cls._loop_thread_id)
+        if frame is None:
+            return None
+        task = asyncio.current_task(cls._loop)
+        stack: List[str] = []
+        function = None
+        while frame is not None:
+            if len(stack) < MAX_STACK_FRAMES:
+                stack.append(f"{_where(frame)} (ligne {frame.f_lineno})")
+            filename = frame.f_code.co_filename
+            if function is None and filename.startswith(APP_DIR + os.sep) and filename not in WRAPPER_FILES:
+                function = _where(frame)
+            frame = frame.f_back
+        stack.reverse()  # ordre d'une trace Python : appel le plus profond en dernier
+        return {
+            "beat": beat,
+            "at": datetime.utcnow().isoformat(),
+            "route": _owner_label(task),
+            "function": function or "external",
+            "blocking": stack[-1].rsplit(" (", 1)[0] if stack else "unknown",
+            "stack": stack,
+        }
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {
+            "enabled": cls._heartbeat is not None,
+            "interval_ms": settings.LOOP_MONITOR_INTERVAL_MS,
+            "threshold_ms": settings.LOOP_STALL_THRESHOLD_MS,
+            **cls.counters,
+            "recent": list(cls._recent),
+        }
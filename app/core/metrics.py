@@ -0,0 +1,352 @@
+"""
+Metrics - Compteurs, jauges et histogrammes au format texte Prometheus
+
+Pas de dépendance externe : quelques primitives en mémoire (par worker,
+event loop uniquement) et un rendu au format d'exposition 0.0.4.
+
+- MetricsMiddleware : latence par route (gabarit, pas l'URL brute),
+  requêtes en cours, en-tête Server-Timing (app / db / cache)
+- instrument_engine : nombre et durée des requêtes SQL (événements
+  before/after_cursor_execute), cumulés aussi par requête HTTP
+- timed_job : durée, issue et dernier succès des jobs planifiés
+- task_owners : requête / job porté par chaque tâche asyncio (attribution
+  des blocages de l'event loop, app.core.loop_monitor)
+- collecteurs : valeurs déjà tenues ailleurs (stats des caches, files,
+  réplicas...) lues au moment du scrape plutôt que dupliquées
+"""
+
+import asyncio
+import functools
+import math
+import time
+import weakref
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+from app.core.config import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+JOB_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+Sample = Tuple[str, Dict[str, str], float]  # (nom, labels, valeur)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        if not self._values and not self.label_names:
+            return [f"{self.name} 0"]
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}" for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Par labels : [compte par bucket (non cumulé) + débordement, somme, total]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        state[0][index] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+
+    def __init__(self, prefix: str = "koco_"):
+        self.prefix = prefix
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Awaitable[Iterable[Tuple[str, str, str, List[Sample]]]]]] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self.prefix + name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(self.prefix + name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(self.prefix + name, help, labels, buckets))
+
+    def collector(self, fn):
+        """
+        Enregistre un collecteur async appelé à chaque scrape. Il retourne des
+        familles (nom, type, aide, [(suffixe, labels, valeur)...]) ; un
+        collecteur en échec est ignoré (compté) sans casser l'export.
+        """
+        self._collectors.append(fn)
+        return fn
+
+    async def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+
+        results = await asyncio.gather(*(fn() for fn in self._collectors), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                collector_errors.inc()
+                continue
+            for name, kind, help, samples in result:
+                full_name = self.prefix + name
+                lines.append(f"# HELP {full_name} {help}")
+                lines.append(f"# TYPE {full_name} {kind}")
+                for suffix, labels, value in samples:
+                    if value is None:
+                        continue
+                    lines.append(f"{full_name}{suffix}{_labels(list(labels), list(labels.values()))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+http_requests = metrics.counter("http_requests_total", "Requêtes HTTP terminées", ("method", "route", "status"))
+http_latency = metrics.histogram("http_request_duration_seconds", "Latence des requêtes HTTP", ("method", "route"))
+http_in_flight = metrics.gauge("http_requests_in_flight", "Requêtes HTTP en cours", ("method",))
+http_db_queries = metrics.histogram(
+    "http_request_db_queries", "Requêtes SQL par requête HTTP", ("route",), buckets=COUNT_BUCKETS
+)
+http_db_time = metrics.histogram("http_request_db_seconds", "Temps SQL cumulé par requête HTTP", ("route",))
+db_queries = metrics.counter("db_queries_total", "Requêtes SQL exécutées", ("engine",))
+db_query_latency = metrics.histogram("db_query_duration_seconds", "Durée des requêtes SQL", ("engine",), QUERY_BUCKETS)
+db_query_errors = metrics.counter("db_query_errors_total", "Requêtes SQL en erreur", ("engine",))
+cache_latency = metrics.histogram(
+    "cache_lookup_duration_seconds", "Durée des lectures de cache (local, Redis, recalcul)", ("namespace",), QUERY_BUCKETS
+)
+job_latency = metrics.histogram("job_duration_seconds", "Durée des jobs planifiés", ("job",), JOB_BUCKETS)
+job_runs = metrics.counter("job_runs_total", "Exécutions des jobs planifiés", ("job", "outcome"))
+job_last_success = metrics.gauge("job_last_success_timestamp_seconds", "Fin du dernier succès (epoch)", ("job",))
+collector_errors = metrics.counter("metrics_collector_errors_total", "Collecteurs en échec pendant un scrape")
+
+
+# ===== Travail porté par chaque tâche =====
+
+# Tâche -> scope ASGI (route lue au besoin, une fois le routage fait) ou "job:<nom>"
+task_owners: "weakref.WeakKeyDictionary[asyncio.Task, object]" = weakref.WeakKeyDictionary()
+
+
+def _own_current_task(owner: object) -> Optional[asyncio.Task]:
+    """Marque la tâche courante ; déjà marquée (job lancé depuis une requête), l'appelant externe est gardé"""
+    task = asyncio.current_task()
+    if task is None or task in task_owners:
+        return None
+    task_owners[task] = owner
+    return task
+
+
+def _release_task(task: Optional[asyncio.Task]):
+    if task is not None:
+        task_owners.pop(task, None)
+
+
+# ===== Temps par requête (Server-Timing) =====
+
+@dataclass
+class RequestTimings:
+    db_queries: int = 0
+    db_seconds: float = 0.0
+    cache_lookups: int = 0
+    cache_seconds: float = 0.0
+
+
+_request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def observe_cache(namespace: str, seconds: float):
+    cache_latency.observe(seconds, namespace=namespace)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.cache_lookups += 1
+        timings.cache_seconds += seconds
+
+
+# ===== SQLAlchemy =====
+
+def instrument_engine(sync_engine, label: str):
+    """Compte et chronomètre les requêtes d'un moteur (sync_engine d'un AsyncEngine)"""
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        db_queries.inc(engine=label)
+        db_query_latency.observe(elapsed, engine=label)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.db_queries += 1
+            timings.db_seconds += elapsed
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(exception_context):
+        db_query_errors.inc(engine=label)
+
+
+# ===== Jobs =====
+
+def timed_job(name: str):
+    """Décorateur des jobs planifiés : durée, issue (ok / error) et horodatage du dernier succès"""
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            task = _own_current_task(f"job:{name}")
+            try:
+                result = await fn(*args, **kwargs)
+            except BaseException:
+                job_runs.inc(job=name, outcome="error")
+                raise
+            finally:
+                _release_task(task)
+                job_latency.observe(time.perf_counter() - started, job=name)
+            job_runs.inc(job=name, outcome="ok")
+            job_last_success.set(time.time(), job=name)
+            return result
+        return wrapper
+
+    return decorate
+
+
+# ===== HTTP =====
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI : latence et statut par gabarit de route (/orders/{order_id}),
+    requêtes en cours, temps SQL / cache de la requête et en-tête Server-Timing.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        started = time.perf_counter()
+        timings = RequestTimings()
+        token = _request_timings.set(timings)
+        task = _own_current_task(scope)
+        status = 500
+        http_in_flight.inc(method=method)
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if settings.SERVER_TIMING:
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    header = (
+                        f"app;dur={elapsed_ms:.1f}, "
+                        f'db;dur={timings.db_seconds * 1000:.1f};desc="{timings.db_queries} queries", '
+                        f'cache;dur={timings.cache_seconds * 1000:.1f};desc="{timings.cache_lookups} lookups"'
+                    )
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            _release_task(task)
+            http_in_flight.dec(method=method)
+            route = scope.get("route")
+            # Routes inconnues regroupées : pas d'explosion de cardinalité sur les 404
+            template = getattr(route, "path", None) or "unmatched"
+            elapsed = time.perf_counter() - started
+            http_requests.inc(method=method, route=template, status=str(status))
+            http_latency.observe(elapsed, method=method, route=template)
+            http_db_queries.observe(timings.db_queries, route=template)
+            http_db_time.observe(timings.db_seconds, route=template)
@@ -0,0 +1,147 @@
+"""
+PrincipalCache - Cache du principal authentifié (id, rôle, statut)
+
+Évite le `SELECT * FROM users` à chaque requête authentifiée :
+1. LRU local indexé par la signature du JWT : ni décodage ni DB
+2. TieredCache par utilisateur (LRU local + Redis) : décodage JWT, pas de DB
+3. Sinon lecture des seuls champs utiles en base
+
+Un changement de `role` ou `is_active` invalide explicitement l'utilisateur
+(après commit). Les autres workers voient l'invalidation au plus tard après
+AUTH_CACHE_LOCAL_TTL secondes : passé ce délai, leur copie locale n'est plus
+servie si l'entrée a disparu de Redis (TieredCache). Redis indisponible, ce
+délai n'est plus garanti (copie locale jusqu'à AUTH_CACHE_REDIS_TTL).
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from app.core.cache import LRUCache, TieredCache
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.user import User, UserRole
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Champs minimaux de l'utilisateur authentifié"""
+    id: int
+    role: UserRole
+    is_active: bool
+
+
+class PrincipalCache:
+
+    _by_signature = LRUCache(settings.AUTH_CACHE_MAX_ENTRIES)
+    _by_user = TieredCache(
+        "auth:principal",
+        ttl=settings.AUTH_CACHE_REDIS_TTL,
+        local_ttl=settings.AUTH_CACHE_LOCAL_TTL,
+        local_maxsize=settings.AUTH_CACHE_MAX_ENTRIES,
+    )
+    counters = {"token_hits": 0, "lookups": 0, "invalidations": 0}
+
+    @classmethod
+    def get_by_signature(cls, signature: str) -> Optional[Principal]:
+        """
+        Principal d'un jeton déjà vérifié. La signature couvre l'en-tête et le
+        payload : un payload modifié ne peut pas réutiliser l'entrée d'un autre.
+        """
+        cls.counters["lookups"] += 1
+        entry = cls._by_signature.get(signature)
+        if entry is None:
+            return None
+        principal, expires_at = entry
+        if expires_at <= time.time():
+            cls._by_signature.delete(signature)
+            return None
+        cls.counters["token_hits"] += 1
+        return principal
+
+    @classmethod
+    def remember_signature(cls, signature: str, principal: Principal, token_exp: float):
+        # Jamais au-delà de l'expiration du jeton
+        expires_at = min(time.time() + settings.AUTH_CACHE_LOCAL_TTL, token_exp)
+        cls._by_signature.set(signature, (principal, expires_at))
+
+    @classmethod
+    async def get_by_user_id(cls, user_id: int) -> Optional[Principal]:
+        async def load() -> Optional[dict]:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(User.id, User.role, User.is_active).where(User.id == user_id)
+                )
+                row = result.first()
+            if row is None:
+                return None
+            return {"id": row.id, "role": row.role.value, "is_active": bool(row.is_active)}
+
+        data = await cls._by_user.get_or_set(str(user_id), load)
+        if data is None:
+            return None
+        return Principal(id=data["id"], role=UserRole(data["role"]), is_active=data["is_active"])
+
+    @classmethod
+    async def invalidate_user(cls, user_id: int):
+        """Invalide toutes les entrées d'un utilisateur (rôle / statut modifié)"""
+        cls._forget_local(user_id)
+        await cls._by_user.delete(str(user_id))
+
+    @classmethod
+    def invalidate_user_nowait(cls, user_id: int):
+        """Version synchrone (hooks ORM) : purge locale immédiate, Redis en tâche de fond"""
+        cls._forget_local(user_id)
+        try:
+            asyncio.get_running_loop().create_task(cls._by_user.delete(str(user_id)))
+        except RuntimeError:
+            logger.warning(f"⚠️ PrincipalCache: pas de loop, invalidation Redis ignorée pour user #{user_id}")
+
+    @classmethod
+    def _forget_local(cls, user_id: int):
+        cls.counters["invalidations"] += 1
+        for signature, (principal, _) in cls._by_signature.items():
+            if principal.id == user_id:
+                cls._by_signature.delete(signature)
+
+    @classmethod
+    def stats(cls) -> dict:
+        lookups = cls.counters["lookups"]
+        user_stats = cls._by_user.stats()
+        # Hits sans DB = jeton déjà vu + principal trouvé dans le cache utilisateur
+        no_db_hits = cls.counters["token_hits"] + user_stats["local_hits"] + user_stats["redis_hits"]
+        return {
+            **cls.counters,
+            "user_cache": user_stats,
+            "hit_ratio": round(no_db_hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# ===== Invalidation automatique sur changement de rôle / statut =====
+
+@event.listens_for(User, "after_update")
+def _track_principal_changes(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.role.history.has_changes() or state.attrs.is_active.history.has_changes():
+        session = Session.object_session(target)
+        if session is not None:
+            session.info.setdefault("principal_invalidations", set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_principal_invalidations(session):
+    # Après commit seulement : sinon un autre worker pourrait recharger l'ancienne valeur
+    for user_id in session.info.pop("principal_invalidations", ()):
+        PrincipalCache.invalidate_user_nowait(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_principal_invalidations(session):
+    session.info.pop("principal_invalidations", None)
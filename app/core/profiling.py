@@ -0,0 +1,328 @@
+"""
+Profiling - Profil CPU échantillonné et diff d'allocations, à la demande
+
+Rien n'est mesuré par défaut : un profil n'est capturé que pour une unité
+de travail désignée par un admin.
+
+- Requête : en-tête X-Profile: 1 (ou ?_profile=1) avec un jeton admin
+  (ProfilingMiddleware, installé seulement si PROFILING_ENABLED)
+- Job planifié : prochaine exécution armée via Profiler.arm_job (Redis,
+  partagé entre workers ; mémoire locale si Redis indisponible)
+
+Pendant la capture, un thread relève toutes les PROFILE_INTERVAL_MS la pile
+du thread de l'event loop, et ne garde l'échantillon que si la tâche en
+cours est celle profilée (les autres requêtes du worker sont ignorées).
+tracemalloc est actif le temps de la capture : le diff (avant / après)
+donne les allocations encore vivantes à la fin, par ligne. Il est global
+au processus : les requêtes concurrentes y figurent aussi, et il ralentit
+tout le worker pendant la capture (jusqu'à x2 sur du code qui alloue
+beaucoup) : la durée mesurée est majorée, la répartition CPU reste juste.
+
+Artefacts dans PROFILE_DIR : <id>.json (résumé + allocations) et
+<id>.speedscope.json (à ouvrir sur https://www.speedscope.app).
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, ClassVar, Dict, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from app.core.cache import CacheManager
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+PROFILE_QUERY = re.compile(rb"(^|&)_profile=(1|true)(&|$)")
+ARTIFACT_ID = re.compile(r"^[0-9a-f]{16}$")
+MAX_STACK_DEPTH = 128
+TOP_ALLOCATIONS = 30
+
+
+class SamplingProfiler:
+    """Échantillonneur de pile (thread) limité à une tâche asyncio"""
+
+    def __init__(self, task: asyncio.Task, interval: float, max_seconds: float):
+        self.task = task
+        self.loop = task.get_loop()
+        self.thread_id = threading.get_ident()  # thread de l'event loop (appelant)
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.frames: List[dict] = []
+        self._frame_index: Dict[Tuple[str, str, int], int] = {}
+        self.samples: List[List[int]] = []
+        self.other_samples = 0  # loop occupé par une autre tâche
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _frame_id(self, frame) -> int:
+        code = frame.f_code
+        key = (getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+        index = self._frame_index.get(key)
+        if index is None:
+            index = self._frame_index[key] = len(self.frames)
+            self.frames.append({"name": key[0], "file": key[1], "line": key[2]})
+        return index
+
+    def _run(self):
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            if asyncio.current_task(self.loop) is not self.task:
+                self.other_samples += 1
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append(self._frame_id(frame))
+                frame = frame.f_back
+            stack.reverse()  # racine d'abord (format speedscope)
+            self.samples.append(stack)
+
+    def speedscope(self, name: str) -> dict:
+        weight = self.interval * 1000
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "koco-profiler",
+            "shared": {"frames": self.frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": len(self.samples) * weight,
+                "samples": self.samples,
+                "weights": [weight] * len(self.samples),
+            }],
+        }
+
+
+class Profiler:
+
+    # Captures en cours (tracemalloc est partagé : arrêté par la dernière)
+    _active: ClassVar[int] = 0
+    _started_tracemalloc: ClassVar[bool] = False
+    # Jobs décorés par profiled_job, et armés localement (repli si Redis indisponible)
+    jobs: ClassVar[set] = set()
+    _armed_jobs: ClassVar[set] = set()
+    counters = {"captured": 0, "failed": 0}
+
+    @classmethod
+    async def capture(cls, kind: str, name: str, work: Callable[[], Awaitable], profile_id: Optional[str] = None):
+        """Exécute `work` sous profilage et enregistre les artefacts ; retourne le résultat de `work`"""
+        profile_id = profile_id or uuid.uuid4().hex[:16]
+        task = asyncio.current_task()
+        sampler = SamplingProfiler(task, settings.PROFILE_INTERVAL_MS / 1000, settings.PROFILE_MAX_SECONDS)
+
+        cls._active += 1
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(settings.PROFILE_TRACEMALLOC_FRAMES)
+            cls._started_tracemalloc = True
+        before = tracemalloc.take_snapshot()
+        started_at, started = datetime.utcnow(), time.perf_counter()
+        sampler.start()
+        error = None
+        try:
+            return await work()
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            sampler.stop()
+            duration = time.perf_counter() - started
+            after = tracemalloc.take_snapshot()
+            cls._active -= 1
+            if cls._active == 0 and cls._started_tracemalloc:
+                tracemalloc.stop()
+                cls._started_tracemalloc = False
+            summary = {
+                "id": profile_id,
+                "kind": kind,
+                "name": name,
+                "started_at": started_at.isoformat(),
+                "duration_ms": round(duration * 1000, 1),
+                "interval_ms": settings.PROFILE_INTERVAL_MS,
+                "samples": len(sampler.samples),
+                "cpu_ms_estimate": round(len(sampler.samples) * settings.PROFILE_INTERVAL_MS, 1),
+                "other_task_samples": sampler.other_samples,
+                "error": error,
+                "allocations": cls._allocation_diff(before, after),
+            }
+            try:
+                await asyncio.to_thread(cls._write, summary, sampler.speedscope(f"{kind} {name}"))
+                cls.counters["captured"] += 1
+                logger.info(f"🔬 Profil {profile_id} enregistré ({kind} {name}, {summary['duration_ms']} ms)")
+            except Exception as e:
+                cls.counters["failed"] += 1
+                logger.error(f"❌ Profil {profile_id} non enregistré: {e}")
+
+    @staticmethod
+    def _allocation_diff(before, after) -> List[dict]:
+        ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+        diff = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+        return [
+            {
+                "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_diff": stat.size_diff,
+                "count_diff": stat.count_diff,
+                "size": stat.size,
+            }
+            for stat in diff[:TOP_ALLOCATIONS]
+        ]
+
+    # ===== Artefacts =====
+
+    @staticmethod
+    def _path(profile_id: str, suffix: str) -> str:
+        return os.path.join(settings.PROFILE_DIR, f"{profile_id}{suffix}")
+
+    @classmethod
+    def _write(cls, summary: dict, speedscope: dict):
+        """Thread : écriture des deux fichiers puis rotation (PROFILE_MAX_ARTIFACTS)"""
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        with open(cls._path(summary["id"], ".speedscope.json"), "w") as f:
+            json.dump(speedscope, f)
+        with open(cls._path(summary["id"], ".json"), "w") as f:
+            json.dump(summary, f)
+
+        summaries = sorted(
+            (entry for entry in os.scandir(settings.PROFILE_DIR) if ARTIFACT_ID.match(entry.name.split(".")[0])
+             and entry.name.endswith(".json") and not entry.name.endswith(".speedscope.json")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in summaries[:-settings.PROFILE_MAX_ARTIFACTS or None]:
+            profile_id = entry.name.split(".")[0]
+            for suffix in (".json", ".speedscope.json"):
+                try:
+                    os.remove(cls._path(profile_id, suffix))
+                except FileNotFoundError:
+                    pass
+
+    @classmethod
+    def artifact_path(cls, profile_id: str, speedscope: bool = False) -> Optional[str]:
+        if not ARTIFACT_ID.match(profile_id):
+            return None
+        path = cls._path(profile_id, ".speedscope.json" if speedscope else ".json")
+        return path if os.path.isfile(path) else None
+
+    @classmethod
+    def list_artifacts(cls) -> List[dict]:
+        """Résumés (sans allocations), du plus récent au plus ancien"""
+        if not os.path.isdir(settings.PROFILE_DIR):
+            return []
+        summaries = []
+        for entry in os.scandir(settings.PROFILE_DIR):
+            if entry.name.endswith(".speedscope.json") or not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path) as f:
+                    summary = json.load(f)
+            except (OSError, ValueError):
+                continue
+            summary.pop("allocations", None)
+            summaries.append(summary)
+        return sorted(summaries, key=lambda summary: summary["started_at"], reverse=True)
+
+    # ===== Jobs =====
+
+    @staticmethod
+    def _job_key(name: str) -> str:
+        return f"profile:job:{name}"
+
+    @classmethod
+    async def arm_job(cls, name: str):
+        """La prochaine exécution du job (sur le worker leader) sera profilée"""
+        try:
+            await CacheManager.get_client().set(cls._job_key(name), "1", ex=24 * 3600)
+        except (RedisError, OSError) as e:
+            logger.warning(f"⚠️ Profiler: Redis indisponible, job {name} armé sur ce worker seulement: {e}")
+            cls._armed_jobs.add(name)
+
+    @classmethod
+    async def _take_job_flag(cls, name: str) -> bool:
+        if name in cls._armed_jobs:
+            cls._armed_jobs.discard(name)
+            return True
+        try:
+            return bool(await CacheManager.get_client().delete(cls._job_key(name)))
+        except (RedisError, OSError):
+            return False
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {**cls.counters, "active": cls._active, "armed_jobs_local": sorted(cls._armed_jobs)}
+
+
+def profiled_job(name: str):
+    """Décorateur de job : profilé si armé (Profiler.arm_job), exécution normale sinon"""
+
+    def decorate(fn):
+        Profiler.jobs.add(name)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if not settings.PROFILING_ENABLED or not await Profiler._take_job_flag(name):
+                return await fn(*args, **kwargs)
+            return await Profiler.capture("job", name, lambda: fn(*args, **kwargs))
+        return wrapper
+
+    return decorate
+
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI : profile la requête portant X-Profile: 1 ou ?_profile=1
+    si `authorize` (jeton admin) l'accepte. L'ID de l'artefact est renvoyé dans X-Profile-Id.
+    """
+
+    def __init__(self, app, authorize: Callable[[Optional[str]], Awaitable[bool]]):
+        self.app = app
+        self.authorize = authorize
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        requested = bool(PROFILE_QUERY.search(scope.get("query_string", b"")))
+        authorization = None
+        for name, value in scope.get("headers", ()):
+            if name == PROFILE_HEADER:
+                requested = requested or value in (b"1", b"true")
+            elif name == b"authorization":
+                authorization = value.decode("latin-1")
+        if not requested or not await self.authorize(authorization):
+            return await self.app(scope, receive, send)
+
+        profile_id = uuid.uuid4().hex[:16]
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(PROFILE_ID_HEADER, profile_id.encode())]
+            await send(message)
+
+        await Profiler.capture(
+            "request", f"{scope['method']} {scope['path']}",
+            lambda: self.app(scope, receive, send_with_id),
+            profile_id=profile_id
+        )
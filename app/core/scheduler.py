@@ -1,20 +1,46 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
+from app.core.config import settings
+from app.core.delay_queue import DelayQueue
+from app.core.leader import scheduler_election
+from app.db.session import AsyncSessionLocal
+from app.models.scheduled_task import TaskKind
 from app.jobs.auto_release_job import job_send_reminders, job_auto_release
+from app.jobs.reconciliation_job import job_reconcile_ledger
+from app.jobs.maintenance_job import job_purge_idempotency_keys
 import logging
 
 logger = logging.getLogger(__name__)
 
+RETRY_BASE_DELAY = 30  # secondes, doublé à chaque tentative
+RETRY_MAX_DELAY = 1800
+
 
 class SchedulerService:
-    """Service centralisant la gestion du scheduler APScheduler"""
+    """
+    Service centralisant la gestion du scheduler APScheduler.
+
+    Démarré dans chaque worker mais en pause : seul le leader élu
+    (scheduler_election) exécute les jobs et le dispatcher d'échéances.
+    """
     
     def __init__(self):
         self.scheduler = AsyncIOScheduler()
+        self.election = scheduler_election
+        self.election.on_elected = self._on_elected
+        self.election.on_demoted = self._on_demoted
+        self._dispatcher: Optional[asyncio.Task] = None
     
     def start(self):
-        """Démarrer le scheduler avec tous les jobs"""
+        """Démarrer le scheduler (en pause) avec tous les jobs, puis l'élection"""
         try:
+            # Les échéances précises passent par le dispatcher (DelayQueue) ;
+            # les jobs périodiques ci-dessous restent le filet de sécurité.
+
             # Job 1: Envoyer les rappels (toutes les 6 heures)
             self.scheduler.add_job(
                 job_send_reminders,
@@ -38,24 +64,137 @@ class SchedulerService:
                 coalesce=True
             )
             logger.info("✅ Job 'auto_release' ajouté (toutes les 1h)")
+
+            # Job 3: Réconciliation incrémentale du grand livre (chaque nuit)
+            self.scheduler.add_job(
+                job_reconcile_ledger,
+                trigger=CronTrigger(hour=settings.LEDGER_RECONCILE_HOUR, minute=0),
+                id='job_reconcile_ledger',
+                name='Réconcilier wallets et transactions',
+                replace_existing=True,
+                max_instances=1,
+                coalesce=True
+            )
+            logger.info(f"✅ Job 'reconcile_ledger' ajouté (chaque nuit à {settings.LEDGER_RECONCILE_HOUR}h)")
+
+            # Job 4: Purge des clés d'idempotence expirées (toutes les 6 heures)
+            self.scheduler.add_job(
+                job_purge_idempotency_keys,
+                trigger=IntervalTrigger(hours=6),
+                id='job_purge_idempotency_keys',
+                name="Purger les clés d'idempotence expirées",
+                replace_existing=True,
+                max_instances=1,
+                coalesce=True
+            )
+            logger.info("✅ Job 'purge_idempotency_keys' ajouté (toutes les 6h)")
             
-            # Démarrer le scheduler
-            self.scheduler.start()
-            logger.info("🚀 SchedulerService démarré avec succès")
+            # Démarrer le scheduler en pause : repris uniquement sur le leader
+            self.scheduler.start(paused=True)
+            self.election.start()
+            logger.info("🚀 SchedulerService démarré avec succès (en attente d'élection)")
             
         except Exception as e:
             logger.error(f"❌ Erreur lors du démarrage du Scheduler: {e}")
             raise
     
-    def stop(self):
-        """Arrêter le scheduler proprement"""
+    async def stop(self):
+        """Arrêter le scheduler proprement (et céder le bail immédiatement)"""
         try:
+            await self.election.stop()
             if self.scheduler.running:
                 self.scheduler.shutdown(wait=False)
                 logger.info("🛑 SchedulerService arrêté")
         except Exception as e:
             logger.error(f"❌ Erreur lors de l'arrêt du Scheduler: {e}")
     
+    def _on_elected(self):
+        self.scheduler.resume()
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch_loop())
+        logger.info("▶️  Leader: jobs planifiés et dispatcher d'échéances actifs")
+
+    def _on_demoted(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        if self.scheduler.running:
+            self.scheduler.pause()
+        logger.info("⏸️  Suiveur: jobs planifiés en pause")
+
+    async def dispatch_due(self) -> dict:
+        """
+        Traite les échéances dues, par lots, et retourne le nombre par type.
+
+        Les échéances sont louées (DelayQueue.lease_due) et non retirées :
+        seules celles dont la commande a avancé, ou n'est plus éligible, sont
+        acquittées ; les autres sont replanifiées avec backoff. Un worker qui
+        meurt en cours de lot les rend visibles à la fin du bail.
+        """
+        processed = {kind.value: 0 for kind in TaskKind}
+        while True:
+            leased = False
+            for kind, job in ((TaskKind.REMINDER, job_send_reminders), (TaskKind.AUTO_RELEASE, job_auto_release)):
+                tasks = await DelayQueue.lease_due(
+                    kind, limit=settings.DELAY_QUEUE_BATCH_SIZE, lease_seconds=settings.DELAY_QUEUE_LEASE
+                )
+                if not tasks:
+                    continue
+                leased = True
+                result = await job(order_ids=sorted({order_id for _, order_id, _ in tasks}))
+                processed[kind.value] += await self._settle(kind, tasks, result)
+            if not leased:
+                break
+        return processed
+
+    @staticmethod
+    async def _settle(kind: TaskKind, tasks: list, result: Optional[dict]) -> int:
+        """
+        Acquitte les échéances dont la commande a avancé ; si le job n'a pas
+        été interrompu, les autres commandes ne sont plus éligibles
+        (validées, annulées...) et leurs échéances sont acquittées aussi.
+        Sinon elles sont replanifiées avec backoff. Retourne le nombre acquitté.
+        """
+        advanced = set(result["order_ids"]) if result else set()
+        interrupted = result is None or result["interrupted"]
+        done_ids, retry = [], []
+        for task_id, order_id, attempts in tasks:
+            if order_id in advanced or not interrupted:
+                done_ids.append(task_id)
+            else:
+                retry.append((task_id, attempts))
+
+        async with AsyncSessionLocal() as db:
+            await DelayQueue.complete(db, done_ids)
+            for task_id, attempts in retry:
+                delay = min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+                await DelayQueue.reschedule(db, [task_id], datetime.utcnow() + timedelta(seconds=delay))
+            await db.commit()
+
+        if retry:
+            logger.warning(f"🔁 {len(retry)} échéances {kind.value} replanifiées (traitement interrompu)")
+        return len(done_ids)
+
+    async def _dispatch_loop(self):
+        """Dort jusqu'à la prochaine échéance (ou un réveil), puis traite ce qui est dû"""
+        while True:
+            try:
+                processed = await self.dispatch_due()
+                if any(processed.values()):
+                    logger.info(f"⏰ Échéances traitées: {processed}")
+
+                timeout = settings.DELAY_QUEUE_MAX_SLEEP
+                next_due = await DelayQueue.next_due_at()
+                if next_due is not None:
+                    delay = (next_due - datetime.utcnow()).total_seconds()
+                    timeout = min(timeout, max(delay, 0.0))
+                await DelayQueue.wait(timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Erreur dans le dispatcher d'échéances: {e}")
+                await asyncio.sleep(settings.DELAY_QUEUE_MAX_SLEEP)
+
     def get_job(self, job_id: str):
         """Récupérer un job par ID"""
         return self.scheduler.get_job(job_id)
@@ -1,9 +1,24 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, Any
+from typing import Optional, Any, Callable
+from fastapi import HTTPException
 from jose import jwt
 import bcrypt
+import logging
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
+# Pool dédié au hachage : bcrypt libère le GIL, des threads suffisent.
+# Le sémaphore borne la concurrence ; l'attente au-delà de
+# PASSWORD_HASH_MAX_QUEUE_MS est rejetée (429) plutôt que mise en file sans fin.
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash"
+)
+_hash_slots = asyncio.Semaphore(settings.PASSWORD_HASH_WORKERS)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Vérifie un mot de passe en clair contre son hash Bcrypt"""
     try:
@@ -15,20 +30,54 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         
         return bcrypt.checkpw(plain_password, hashed_password)
     except Exception as e:
-        print(f"❌ Erreur vérification password: {e}")
+        logger.error(f"❌ Erreur vérification password: {e}")
         return False
 
 def get_password_hash(password: str) -> str:
     """Hash un mot de passe avec Bcrypt"""
     try:
         password_bytes = password.encode('utf-8')
-        salt = bcrypt.gensalt(rounds=12)
+        salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
         hashed = bcrypt.hashpw(password_bytes, salt)
         return hashed.decode('utf-8')
     except Exception as e:
-        print(f"❌ Erreur hash password: {e}")
+        logger.error(f"❌ Erreur hash password: {e}")
         raise
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Vrai si le hash a été créé avec un autre coût que BCRYPT_ROUNDS ($2b$<coût>$...)"""
+    try:
+        return int(hashed_password.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+async def _run_hashing(func: Callable, *args):
+    """Exécute une opération bcrypt dans le pool dédié, sans bloquer l'event loop"""
+    try:
+        await asyncio.wait_for(
+            _hash_slots.acquire(),
+            timeout=settings.PASSWORD_HASH_MAX_QUEUE_MS / 1000
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=429,
+            detail="Serveur occupé, veuillez réessayer",
+            headers={"Retry-After": "1"}
+        )
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, func, *args)
+    finally:
+        _hash_slots.release()
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password hors event loop (429 si le pool est saturé)"""
+    return await _run_hashing(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash hors event loop (429 si le pool est saturé)"""
+    return await _run_hashing(get_password_hash, password)
+
 def create_access_token(subject: str | Any, expires_delta: Optional[timedelta] = None) -> str:
     """Crée un JWT token"""
     if expires_delta:
@@ -3,4 +3,8 @@ from app.models.user import User
 from app.models.wallet import Wallet
 from app.models.listing import Listing
 from app.models.order import Order
-from app.models.transaction import Transaction
\ No newline at end of file
+from app.models.transaction import Transaction
+from app.models.scheduled_task import ScheduledTask
+from app.models.leader_lease import LeaderLease
+from app.models.wallet_checkpoint import WalletCheckpoint
+from app.models.idempotency_key import IdempotencyKey
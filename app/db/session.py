@@ -1,5 +1,22 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from typing import List, Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.elements import TextClause
+
+from app.core.cache import CacheManager
 from app.core.config import settings
+from app.core.metrics import instrument_engine
+
+logger = logging.getLogger(__name__)
 
 # 1. Détection automatique : Est-ce qu'on est sur SQLite ?
 is_sqlite = "sqlite" in settings.SQLALCHEMY_DATABASE_URI
@@ -10,24 +27,360 @@ if is_sqlite:
     # INDISPENSABLE pour éviter les erreurs de thread avec SQLite + FastAPI
     connect_args = {"check_same_thread": False}
 
-# 3. Création de l'engine
+# 3. Création de l'engine (primaire : toutes les écritures)
 engine = create_async_engine(
     settings.SQLALCHEMY_DATABASE_URI,
     future=True,
-    echo=True, # Mettez True en dev pour voir les requêtes SQL dans la console
+    # Pas d'echo (écriture synchrone sur stdout) : DB_ECHO=true journalise le SQL via app.core.logging
     connect_args=connect_args # Injecte la config spéciale si c'est SQLite
 )
 
+instrument_engine(engine.sync_engine, "primary")
+
+sqlite_production = is_sqlite and settings.SQLITE_PROFILE == "production"
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Profil SQLite de production, à chaque nouvelle connexion : WAL (lectures
+    concurrentes de l'écriture), synchronous NORMAL (fsync aux checkpoints
+    seulement), mmap, cache de pages et attente du verrou au lieu d'un échec.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+if sqlite_production:
+    event.listen(engine.sync_engine, "connect", _apply_sqlite_pragmas)
+
+
+class SQLiteWriter:
+    """
+    File d'écriture unique (par processus) pour SQLite.
+
+    SQLite n'accepte qu'un écrivain à la fois : sans file, les sessions
+    concurrentes se disputent le verrou du fichier ("database is locked",
+    attentes du busy handler). Ici une session prend le jeton à sa première
+    écriture et le rend au commit / rollback / close ; les autres attendent
+    leur tour dans l'event loop (FIFO), les lectures ne sont jamais bloquées.
+    Entre processus, c'est busy_timeout qui arbitre.
+    """
+
+    _lock = asyncio.Lock()
+    counters = {"acquired": 0, "timeouts": 0, "waiting": 0, "max_wait_ms": 0.0, "max_hold_ms": 0.0}
+
+    @classmethod
+    async def acquire(cls) -> float:
+        started = time.perf_counter()
+        if cls._lock.locked():
+            cls.counters["waiting"] += 1
+            try:
+                await asyncio.wait_for(cls._lock.acquire(), timeout=settings.SQLITE_BUSY_TIMEOUT_MS / 1000)
+            except asyncio.TimeoutError:
+                cls.counters["timeouts"] += 1
+                raise OperationalError(
+                    "SQLiteWriter.acquire", None,
+                    Exception("database is locked (file d'écriture saturée)")
+                )
+            finally:
+                cls.counters["waiting"] -= 1
+        else:
+            await cls._lock.acquire()  # libre : pas de tâche wait_for à créer
+        acquired_at = time.perf_counter()
+        cls.counters["acquired"] += 1
+        cls.counters["max_wait_ms"] = max(cls.counters["max_wait_ms"], (acquired_at - started) * 1000)
+        return acquired_at
+
+    @classmethod
+    def release(cls, acquired_at: float):
+        cls.counters["max_hold_ms"] = max(cls.counters["max_hold_ms"], (time.perf_counter() - acquired_at) * 1000)
+        cls._lock.release()
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {"enabled": sqlite_production and settings.SQLITE_SINGLE_WRITER, "held": cls._lock.locked(), **cls.counters}
+
+
+def _is_write(statement) -> bool:
+    if isinstance(statement, UpdateBase):
+        return True
+    if isinstance(statement, TextClause):
+        return statement.text.lstrip().split(None, 1)[0].upper() in ("INSERT", "UPDATE", "DELETE", "REPLACE")
+    return False
+
+
+class SQLiteWriterSession(AsyncSession):
+    """AsyncSession qui passe par SQLiteWriter avant sa première écriture (DML ou flush)"""
+
+    async def _writer(self):
+        if "sqlite_writer" not in self.info:
+            self.info["sqlite_writer"] = await SQLiteWriter.acquire()
+
+    def _release_writer(self):
+        acquired_at = self.info.pop("sqlite_writer", None)
+        if acquired_at is not None:
+            SQLiteWriter.release(acquired_at)
+
+    def _has_changes(self) -> bool:
+        return bool(self.new or self.dirty or self.deleted)
+
+    async def execute(self, statement, *args, **kwargs):
+        if _is_write(statement):
+            await self._writer()
+        return await super().execute(statement, *args, **kwargs)
+
+    async def flush(self, objects=None):
+        if self._has_changes():
+            await self._writer()
+        return await super().flush(objects)
+
+    async def commit(self):
+        if self._has_changes():
+            await self._writer()
+        try:
+            return await super().commit()
+        finally:
+            self._release_writer()
+
+    async def rollback(self):
+        try:
+            return await super().rollback()
+        finally:
+            self._release_writer()
+
+    async def close(self):
+        try:
+            return await super().close()
+        finally:
+            self._release_writer()
+
+
+class PrimarySession(Session):
+    """Session sur le primaire (les commits marquent l'utilisateur pour la lecture de ses écritures)"""
+
+
 AsyncSessionLocal = async_sessionmaker(
     bind=engine,
-    class_=AsyncSession,
+    class_=SQLiteWriterSession if sqlite_production and settings.SQLITE_SINGLE_WRITER else AsyncSession,
+    sync_session_class=PrimarySession,
     expire_on_commit=False,
     autoflush=False,
 )
 
+# 4. Réplicas en lecture (optionnels) : DATABASE_REPLICA_URLS séparées par des virgules
+replica_engines: List[AsyncEngine] = [
+    create_async_engine(
+        url,
+        future=True,
+        pool_pre_ping=True,
+        connect_args={"check_same_thread": False} if "sqlite" in url else {}
+    )
+    for url in (u.strip() for u in settings.DATABASE_REPLICA_URLS.split(","))
+    if url
+]
+
+for index, replica in enumerate(replica_engines):
+    instrument_engine(replica.sync_engine, f"replica-{index}")
+    if replica.dialect.name == "sqlite" and settings.SQLITE_PROFILE == "production":
+        event.listen(replica.sync_engine, "connect", _apply_sqlite_pragmas)
+
+ReplicaSessionLocals = [
+    async_sessionmaker(bind=replica, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+    for replica in replica_engines
+]
+
+# Utilisateur authentifié de la requête en cours (posé par get_current_principal)
+request_user_id: ContextVar[Optional[int]] = ContextVar("request_user_id", default=None)
+
+# Retard de réplication en secondes (0 si le réplica a rejoué tout le WAL reçu)
+_PG_REPLICA_LAG = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class ReplicaRouter:
+    """
+    Choix du moteur pour les lectures (get_read_db, exports, caches).
+
+    - Réplica sain au retard <= REPLICA_MAX_LAG, en round-robin
+    - Primaire si aucun réplica n'est configuré, sain ou à jour
+    - Primaire pendant REPLICA_STICKY_SECONDS après un commit de l'utilisateur
+      (lecture de ses propres écritures) : marque locale + Redis entre workers
+    Sondes de santé / retard toutes les REPLICA_HEALTH_INTERVAL secondes.
+    """
+
+    _health: List[dict] = [
+        {"healthy": False, "lag": None, "error": None, "checked_at": None} for _ in replica_engines
+    ]
+    _next = 0
+    _task: Optional[asyncio.Task] = None
+    _sticky_until: dict = {}
+    # Après une erreur Redis, on ne retente qu'après ce délai (marques locales seules)
+    REDIS_RETRY_DELAY = 5.0
+    _redis_retry_at = 0.0
+    counters = {"replica_reads": 0, "primary_reads": 0, "sticky_reads": 0, "fallback_reads": 0}
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return bool(replica_engines)
+
+    # ===== Sessions de lecture =====
+
+    @classmethod
+    async def read_session(cls, user_id: Optional[int] = None) -> AsyncSession:
+        if not cls.enabled():
+            cls.counters["primary_reads"] += 1
+            return AsyncSessionLocal()
+        if user_id is not None and await cls.is_sticky(user_id):
+            cls.counters["sticky_reads"] += 1
+            return AsyncSessionLocal()
+
+        candidates = [
+            index for index, health in enumerate(cls._health)
+            if health["healthy"] and health["lag"] <= settings.REPLICA_MAX_LAG
+        ]
+        if not candidates:
+            cls.counters["fallback_reads"] += 1
+            return AsyncSessionLocal()
+        cls._next = (cls._next + 1) % len(candidates)
+        cls.counters["replica_reads"] += 1
+        return ReplicaSessionLocals[candidates[cls._next]]()
+
+    # ===== Lecture de ses écritures =====
+
+    @staticmethod
+    def _sticky_key(user_id: int) -> str:
+        return f"replica:sticky:{user_id}"
+
+    @classmethod
+    def _redis(cls):
+        if time.time() < cls._redis_retry_at:
+            return None
+        return CacheManager.get_client()
+
+    @classmethod
+    def _redis_failed(cls, error: Exception):
+        cls._redis_retry_at = time.time() + cls.REDIS_RETRY_DELAY
+        logger.warning(f"⚠️ ReplicaRouter: Redis indisponible, marques d'écriture locales seules: {error}")
+
+    @classmethod
+    def mark_write_nowait(cls, user_id: int):
+        """Appelé après commit (synchrone) : marque locale immédiate, Redis en tâche de fond"""
+        now = time.time()
+        cls._sticky_until[user_id] = now + settings.REPLICA_STICKY_SECONDS
+        if len(cls._sticky_until) > 10000:
+            cls._sticky_until = {uid: until for uid, until in cls._sticky_until.items() if until > now}
+        try:
+            asyncio.get_running_loop().create_task(cls._mark_write_redis(user_id))
+        except RuntimeError:
+            pass
+
+    @classmethod
+    async def _mark_write_redis(cls, user_id: int):
+        client = cls._redis()
+        if client is None:
+            return
+        try:
+            await client.set(cls._sticky_key(user_id), 1, px=int(settings.REPLICA_STICKY_SECONDS * 1000))
+        except (RedisError, OSError) as e:
+            cls._redis_failed(e)
+
+    @classmethod
+    async def is_sticky(cls, user_id: int) -> bool:
+        if cls._sticky_until.get(user_id, 0) > time.time():
+            return True
+        client = cls._redis()
+        if client is None:
+            return False
+        try:
+            return bool(await client.exists(cls._sticky_key(user_id)))
+        except (RedisError, OSError) as e:
+            cls._redis_failed(e)
+            return False
+
+    # ===== Santé / retard =====
+
+    @classmethod
+    async def check_replicas(cls):
+        for index, replica in enumerate(replica_engines):
+            health = cls._health[index]
+            try:
+                async with replica.connect() as conn:
+                    if replica.dialect.name == "postgresql":
+                        lag = float((await conn.execute(_PG_REPLICA_LAG)).scalar() or 0)
+                    else:
+                        # Pas de mesure de retard (ex: deux fichiers SQLite en dev) : joignable = à jour
+                        await conn.execute(text("SELECT 1"))
+                        lag = 0.0
+                was_usable = health["healthy"] and health["lag"] <= settings.REPLICA_MAX_LAG
+                usable = lag <= settings.REPLICA_MAX_LAG
+                if usable and not was_usable:
+                    logger.info(f"✅ Réplica #{index} disponible (retard {lag:.1f}s)")
+                elif was_usable and not usable:
+                    logger.warning(f"⚠️ Réplica #{index} en retard ({lag:.1f}s), lectures sur le primaire")
+                health.update(healthy=True, lag=lag, error=None)
+            except Exception as e:
+                if health["healthy"]:
+                    logger.warning(f"⚠️ Réplica #{index} injoignable, lectures sur le primaire: {e}")
+                health.update(healthy=False, error=str(e))
+            health["checked_at"] = time.time()
+
+    @classmethod
+    def start(cls):
+        if cls.enabled() and cls._task is None:
+            cls._task = asyncio.get_running_loop().create_task(cls._run())
+            logger.info(f"📚 ReplicaRouter démarré ({len(replica_engines)} réplica(s))")
+
+    @classmethod
+    async def stop(cls):
+        if cls._task is not None:
+            cls._task.cancel()
+            cls._task = None
+        for replica in replica_engines:
+            await replica.dispose()
+
+    @classmethod
+    async def _run(cls):
+        while True:
+            try:
+                await cls.check_replicas()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ ReplicaRouter: sonde impossible: {e}")
+            await asyncio.sleep(settings.REPLICA_HEALTH_INTERVAL)
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {
+            "replicas": [
+                {"index": index, "url": replica.url.render_as_string(hide_password=True), **cls._health[index]}
+                for index, replica in enumerate(replica_engines)
+            ],
+            **cls.counters,
+        }
+
+
+@event.listens_for(PrimarySession, "after_commit")
+def _mark_user_write(session):
+    # Les lectures suivantes de cet utilisateur iront au primaire le temps que les réplicas rattrapent
+    user_id = request_user_id.get()
+    if user_id is not None and replica_engines:
+        ReplicaRouter.mark_write_nowait(user_id)
+
+
 async def get_db():
     async with AsyncSessionLocal() as session:
         try:
             yield session
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
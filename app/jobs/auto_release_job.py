@@ -1,127 +1,171 @@
 from datetime import datetime, timedelta
+from typing import Optional, Sequence
 import logging
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+import time
+from sqlalchemy import select, update
 
+from app.core.config import settings
+from app.core.delay_queue import REMINDER_DELAYS_HOURS, AUTO_RELEASE_DELAY_HOURS
+from app.core.leader import scheduler_election, LeaseLostError
+from app.core.metrics import timed_job
+from app.core.profiling import profiled_job
 from app.db.session import AsyncSessionLocal
 from app.models.order import Order, OrderStatus
-from app.models.escrow_account import EscrowAccount, EscrowStatus
-from app.models.wallet import Wallet
-from app.models.transaction import Transaction
 from app.services.escrow_service import EscrowService
+from app.services.notification_service import NotificationService
 
 logger = logging.getLogger(__name__)
 
-async def job_send_reminders():
+# Escalade des rappels : (statut source, statut cible, colonne d'envoi, délai depuis livraison)
+REMINDER_STEPS = [
+    (OrderStatus.DELIVERED, OrderStatus.REMINDER_1, "reminder_1_sent_at", REMINDER_DELAYS_HOURS[0]),
+    (OrderStatus.REMINDER_1, OrderStatus.REMINDER_2, "reminder_2_sent_at", REMINDER_DELAYS_HOURS[1]),
+    (OrderStatus.REMINDER_2, OrderStatus.REMINDER_FINAL, "reminder_final_sent_at", REMINDER_DELAYS_HOURS[2]),
+]
+
+@profiled_job("send_reminders")
+@timed_job("send_reminders")
+async def job_send_reminders(order_ids: Optional[Sequence[int]] = None) -> dict:
     """
     Envoie les rappels aux clients pour validation des travaux.
     Statuts: DELIVERED -> REMINDER_1 -> REMINDER_2 -> REMINDER_FINAL
+
+    Chaque étape est un UPDATE conditionnel ... RETURNING id, client_id par
+    lots (aucun objet ORM chargé), commité lot par lot puis notifié en batch.
+    Étapes traitées de la dernière à la première : une commande n'avance que
+    d'un cran par exécution.
+
+    Retourne les rappels envoyés par statut (sent), les commandes avancées
+    (order_ids) et si une étape a été interrompue (erreur, bail perdu) :
+    le dispatcher n'acquitte que les échéances réellement traitées.
     """
-    async with AsyncSessionLocal() as db:
-        try:
-            # Commandes en attente de validation depuis plus de 24h
-            reminder_1_cutoff = datetime.utcnow() - timedelta(hours=24)
-            reminder_2_cutoff = datetime.utcnow() - timedelta(hours=36)  
-            reminder_final_cutoff = datetime.utcnow() - timedelta(hours=47)
-
-            # 🔔 Rappel 1 (24h)
-            orders_reminder_1 = await db.execute(
-                select(Order).where(
-                    and_(
-                        Order.status == OrderStatus.DELIVERED,
-                        Order.delivered_at <= reminder_1_cutoff,
-                        Order.reminder_1_sent_at.is_(None)
-                    )
-                )
+    chunk_size = settings.REMINDER_CHUNK_SIZE
+    sent = {}
+    result = {"sent": sent, "order_ids": [], "interrupted": False}
+
+    for from_status, to_status, sent_at_column, delay_hours in reversed(REMINDER_STEPS):
+        sent_at = getattr(Order, sent_at_column)
+        cutoff = datetime.utcnow() - timedelta(hours=delay_hours)
+        conditions = [
+            Order.status == from_status,
+            Order.delivered_at <= cutoff,
+            sent_at.is_(None)
+        ]
+        if order_ids is not None:
+            conditions.append(Order.id.in_(order_ids))
+
+        sent[to_status.value] = 0
+        while True:
+            chunk_ids = (
+                select(Order.id)
+                .where(*conditions)
+                .limit(chunk_size)
+                .with_for_update(skip_locked=True)
+                .scalar_subquery()
             )
-            
-            for order in orders_reminder_1.scalars().all():
-                order.status = OrderStatus.REMINDER_1
-                order.reminder_1_sent_at = datetime.utcnow()
-                logger.info(f"🔔 Rappel 1 envoyé pour commande #{order.id}")
-
-            # 🔔🔔 Rappel 2 (36h)  
-            orders_reminder_2 = await db.execute(
-                select(Order).where(
-                    and_(
-                        Order.status == OrderStatus.REMINDER_1,
-                        Order.delivered_at <= reminder_2_cutoff,
-                        Order.reminder_2_sent_at.is_(None)
-                    )
-                )
+            stmt = (
+                update(Order)
+                .where(Order.id.in_(chunk_ids), *conditions)
+                .values({Order.status: to_status, sent_at: datetime.utcnow()})
+                .returning(Order.id, Order.client_id)
+                .execution_options(synchronize_session=False)
             )
-            
-            for order in orders_reminder_2.scalars().all():
-                order.status = OrderStatus.REMINDER_2
-                order.reminder_2_sent_at = datetime.utcnow()
-                logger.info(f"🔔🔔 Rappel 2 envoyé pour commande #{order.id}")
-
-            # 🔔🔔🔔 Rappel Final (47h)
-            orders_reminder_final = await db.execute(
-                select(Order).where(
-                    and_(
-                        Order.status == OrderStatus.REMINDER_2,
-                        Order.delivered_at <= reminder_final_cutoff,
-                        Order.reminder_final_sent_at.is_(None)
-                    )
+
+            async with AsyncSessionLocal() as db:
+                try:
+                    await scheduler_election.check_fence(db)
+                    rows = (await db.execute(stmt)).all()
+                    await db.commit()
+                except LeaseLostError as e:
+                    await db.rollback()
+                    logger.warning(f"⚠️ Rappels interrompus, bail perdu: {e}")
+                    result["interrupted"] = True
+                    return result
+                except Exception as e:
+                    await db.rollback()
+                    logger.error(f"❌ Erreur lors de l'envoi des rappels ({to_status.value}): {e}")
+                    result["interrupted"] = True
+                    break
+
+            if rows:
+                await NotificationService.send_reminders_batch(
+                    [(row.id, row.client_id) for row in rows], to_status.value
                 )
-            )
-            
-            for order in orders_reminder_final.scalars().all():
-                order.status = OrderStatus.REMINDER_FINAL
-                order.reminder_final_sent_at = datetime.utcnow()
-                logger.info(f"🔔🔔🔔 Rappel FINAL envoyé pour commande #{order.id}")
+                sent[to_status.value] += len(rows)
+                result["order_ids"].extend(row.id for row in rows)
+                logger.info(f"🔔 {to_status.value}: {len(rows)} rappels envoyés")
 
-            await db.commit()
-            logger.info("✅ Tous les rappels traités avec succès")
+            if len(rows) < chunk_size:
+                break
 
-        except Exception as e:
-            await db.rollback()
-            logger.error(f"❌ Erreur lors de l'envoi des rappels: {e}")
+    if result["interrupted"]:
+        logger.warning(f"⚠️ Rappels partiellement traités: {sent}")
+    else:
+        logger.info(f"✅ Tous les rappels traités avec succès: {sent}")
+    return result
 
-async def job_auto_release():
+@profiled_job("auto_release")
+@timed_job("auto_release")
+async def job_auto_release(order_ids: Optional[Sequence[int]] = None) -> dict:
     """
     Libération automatique des fonds après 48h pour les commandes validées
     par le système (artisan a déclaré fini, client n'a pas répondu).
+
+    Traitement par lots ensemblistes (EscrowService.release_funds_batch),
+    chaque lot dans sa propre transaction : un gros arriéré (après une panne)
+    ne tient jamais une longue transaction unique.
+
+    Les totaux listent les commandes libérées (order_ids) et indiquent si le
+    traitement a été interrompu (erreur, bail perdu) avant la fin.
     """
-    async with AsyncSessionLocal() as db:
-        try:
-            # Commandes éligibles à l'auto-release
-            auto_release_cutoff = datetime.utcnow() - timedelta(hours=48)
-            
-            eligible_orders = await db.execute(
-                select(Order).where(
-                    and_(
-                        Order.status.in_([
-                            OrderStatus.DELIVERED,
-                            OrderStatus.REMINDER_1, 
-                            OrderStatus.REMINDER_2,
-                            OrderStatus.REMINDER_FINAL
-                        ]),
-                        Order.delivered_at <= auto_release_cutoff
-                    )
+    started = time.perf_counter()
+    auto_release_cutoff = datetime.utcnow() - timedelta(hours=AUTO_RELEASE_DELAY_HOURS)
+    chunk_size = settings.AUTO_RELEASE_CHUNK_SIZE
+    totals = {"released": 0, "amount": 0, "skipped": 0, "chunks": 0, "order_ids": [], "interrupted": False}
+    last_escrow_id = 0
+
+    while True:
+        async with AsyncSessionLocal() as db:
+            try:
+                await scheduler_election.check_fence(db)
+                batch = await EscrowService.release_funds_batch(
+                    db,
+                    delivered_before=auto_release_cutoff,
+                    after_escrow_id=last_escrow_id,
+                    limit=chunk_size,
+                    trigger_source="AUTO_RELEASE",
+                    order_ids=order_ids
                 )
-            )
+                await db.commit()
+            except LeaseLostError as e:
+                await db.rollback()
+                logger.warning(f"⚠️ Auto-release interrompue après escrow #{last_escrow_id}, bail perdu: {e}")
+                totals["interrupted"] = True
+                break
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"❌ Erreur critique dans job_auto_release (lot après escrow #{last_escrow_id}): {e}")
+                totals["interrupted"] = True
+                break
 
-            released_count = 0
-            for order in eligible_orders.scalars().all():
-                try:
-                    # ✅ CORRECTION : Utiliser directement EscrowService
-                    # Plus de manipulation de frozen_balance !
-                    result = await EscrowService.release_funds(
-                        db, order.id, trigger_source="AUTO_RELEASE"
-                    )
-                    
-                    released_count += 1
-                    logger.info(f"✅ Auto-release réussie pour commande #{order.id}: {result}")
-                    
-                except Exception as e:
-                    logger.error(f"❌ Erreur auto-release commande #{order.id}: {e}")
-                    continue
+        if batch["selected"]:
+            totals["chunks"] += 1
+            totals["released"] += batch["released"]
+            totals["amount"] += batch["amount"]
+            totals["skipped"] += batch["skipped"]
+            totals["order_ids"].extend(batch["order_ids"])
+            last_escrow_id = batch["last_escrow_id"]
+            logger.info(f"✅ Auto-release: lot #{totals['chunks']} commité ({batch['released']} commandes)")
 
-            await db.commit()
-            logger.info(f"🎉 Auto-release terminée: {released_count} commandes traitées")
+        if batch["selected"] < chunk_size:
+            break
 
-        except Exception as e:
-            await db.rollback()
-            logger.error(f"❌ Erreur critique dans job_auto_release: {e}")
\ No newline at end of file
+    elapsed = time.perf_counter() - started
+    totals["elapsed_s"] = round(elapsed, 3)
+    totals["per_second"] = round(totals["released"] / elapsed, 1) if elapsed > 0 else 0.0
+    logger.info(
+        f"🎉 Auto-release terminée: {totals['released']} commandes traitées, "
+        f"{totals['amount']} FCFA en {elapsed:.2f}s ({totals['per_second']} commandes/s, "
+        f"{totals['chunks']} lots, {totals['skipped']} ignorées)"
+    )
+    return totals
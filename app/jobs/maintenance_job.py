@@ -0,0 +1,21 @@
+import logging
+
+from app.core.idempotency import Idempotency
+from app.core.metrics import timed_job
+from app.core.profiling import profiled_job
+
+logger = logging.getLogger(__name__)
+
+
+@profiled_job("purge_idempotency_keys")
+@timed_job("purge_idempotency_keys")
+async def job_purge_idempotency_keys() -> int:
+    """Supprime les clés d'idempotence expirées (IDEMPOTENCY_TTL)"""
+    try:
+        purged = await Idempotency.purge_expired()
+    except Exception as e:
+        logger.error(f"❌ Erreur dans job_purge_idempotency_keys: {e}")
+        return 0
+    if purged:
+        logger.info(f"🧹 {purged} clés d'idempotence expirées supprimées")
+    return purged
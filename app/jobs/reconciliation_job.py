@@ -0,0 +1,69 @@
+import logging
+import time
+
+from app.core.config import settings
+from app.core.leader import scheduler_election, LeaseLostError
+from app.core.metrics import timed_job
+from app.core.profiling import profiled_job
+from app.db.session import AsyncSessionLocal
+from app.services.reconciliation_service import ReconciliationService
+
+logger = logging.getLogger(__name__)
+
+
+@profiled_job("reconcile_ledger")
+@timed_job("reconcile_ledger")
+async def job_reconcile_ledger(fenced: bool = True) -> dict:
+    """
+    Réconciliation incrémentale wallets / transactions (nocturne).
+
+    Parcourt les wallets par lots keyset (LEDGER_RECONCILE_BATCH_SIZE), chaque
+    lot dans sa propre transaction : seules les transactions postérieures au
+    dernier point de contrôle de chaque wallet sont sommées. Les écarts sont
+    journalisés et renvoyés dans le résumé (tronqué à 100 par lot).
+    fenced=False : exécution à la demande hors leader (endpoint admin).
+    """
+    started = time.perf_counter()
+    chunk_size = settings.LEDGER_RECONCILE_BATCH_SIZE
+    totals = {"checked": 0, "checkpointed": 0, "mismatched": 0, "chunks": 0, "mismatches": []}
+    last_wallet_id = 0
+
+    while True:
+        async with AsyncSessionLocal() as db:
+            try:
+                if fenced:
+                    await scheduler_election.check_fence(db)
+                batch = await ReconciliationService.reconcile_batch(db, after_wallet_id=last_wallet_id, limit=chunk_size)
+                await db.commit()
+            except LeaseLostError as e:
+                await db.rollback()
+                logger.warning(f"⚠️ Réconciliation interrompue après wallet #{last_wallet_id}, bail perdu: {e}")
+                break
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"❌ Erreur dans job_reconcile_ledger (lot après wallet #{last_wallet_id}): {e}")
+                break
+
+        for mismatch in batch["mismatches"]:
+            logger.error(
+                f"❌ Écart grand livre, wallet #{mismatch['wallet_id']}: solde {mismatch['balance']} "
+                f"!= {mismatch['ledger']} (point de contrôle après transaction #{mismatch['since_transaction_id']})"
+            )
+        totals["chunks"] += 1 if batch["checked"] else 0
+        totals["checked"] += batch["checked"]
+        totals["checkpointed"] += batch["checkpointed"]
+        totals["mismatched"] += len(batch["mismatches"])
+        totals["mismatches"].extend(batch["mismatches"])
+        last_wallet_id = batch["last_wallet_id"]
+
+        if batch["checked"] < chunk_size:
+            break
+
+    elapsed = time.perf_counter() - started
+    totals["elapsed_s"] = round(elapsed, 3)
+    log = logger.error if totals["mismatched"] else logger.info
+    log(
+        f"{'❌' if totals['mismatched'] else '✅'} Réconciliation terminée: {totals['checked']} wallets vérifiés, "
+        f"{totals['checkpointed']} points de contrôle, {totals['mismatched']} écarts en {elapsed:.2f}s"
+    )
+    return totals
@@ -3,39 +3,98 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from app.core.config import settings
 from app.api.v1.api import api_router
-from app.db.session import engine
+from app.db.session import engine, ReplicaRouter
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
 from app.models.base_class import Base
 from app.core.cache import CacheManager
 from app.core.scheduler import scheduler_service
+from app.services.market_service import MarketService
+from app.services.notification_engine import notification_engine
+from app.services.ai_enrichment import enrichment_worker
+from app.services.ai_simplifier import AISimplifierService
+from app.services.ledger_service import LedgerService
+from app.core.logging import LogPipeline, RequestIdMiddleware
+from app.core.metrics import MetricsMiddleware
+from app.core.profiling import ProfilingMiddleware
+from app.core.loop_monitor import LoopMonitor
+from app.api.v1.deps import is_admin_authorization
+from app.api.v1.endpoints import metrics as metrics_endpoint
 import logging
-logging.basicConfig(level=logging.DEBUG)
+
+# Logs JSON via une file et un thread d'écriture (jamais d'écriture bloquante dans l'event loop)
+LogPipeline.setup()
+logger = logging.getLogger(__name__)
+
+def create_missing_indexes(sync_conn):
+    # create_all ne crée pas les index ajoutés après coup sur une table existante
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+def create_missing_columns(sync_conn):
+    # Ni create_all ni les index : colonnes nullables ajoutées après coup sur une table existante
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                ddl = CreateColumn(column).compile(dialect=sync_conn.dialect)
+                sync_conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+                logger.info(f"🧱 Colonne ajoutée: {table.name}.{column.name}")
 
 async def create_tables():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(create_missing_columns)
+        await conn.run_sync(create_missing_indexes)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    # Retard de l'event loop et blocages (pile relevée pendant le blocage)
+    LoopMonitor.start()
+
     await create_tables()
 
     try:
         redis = CacheManager.get_client()
         await redis.ping()
-        print("Redis Connected")
+        logger.info("✅ Redis connecté")
     except Exception as e:
-        print(f"Redis not available: {e}")
+        logger.warning(f"⚠️ Redis indisponible: {e}")
+
+    # Réplicas en lecture : sondes de santé / retard
+    ReplicaRouter.start()
+
+    # Compte plateforme (commissions), créé avant le premier paiement
+    await LedgerService.platform_account()
+
+    # Index spatial des listings (Redis GEO ou repli mémoire)
+    await MarketService.rebuild_geo_index()
+
+    # Livraison des notifications (file + workers)
+    notification_engine.start()
+
+    # Enrichissement IA des commandes (file durable en base), classifieur
+    # local entraîné sur les commandes déjà enrichies
+    await AISimplifierService.train_local_classifier()
+    enrichment_worker.start()
 
     # Start Scheduler
     scheduler_service.start()
-    print("APScheduler started (Auto-Release active)")
+    logger.info("⏰ APScheduler démarré (Auto-Release actif sur le leader élu)")
 
     yield
 
     # Shutdown
-    scheduler_service.stop()
+    await scheduler_service.stop()
+    await notification_engine.stop()
+    await enrichment_worker.stop()
+    await ReplicaRouter.stop()
+    await LoopMonitor.stop()
     await CacheManager.close()
-    print("System stopped")
+    logger.info("🛑 Système arrêté")
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -44,6 +103,12 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Profil à la demande (X-Profile: 1, admin) ; non installé sinon : aucun coût
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware, authorize=is_admin_authorization)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestIdMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -53,6 +118,8 @@ app.add_middleware(
 )
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
+# /metrics à la racine (convention Prometheus), hors de l'API versionnée
+app.include_router(metrics_endpoint.router, tags=["System"])
 
 @app.get("/")
 def root():
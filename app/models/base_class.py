@@ -1,9 +1,21 @@
 from typing import Any, ClassVar
 from sqlalchemy.orm import declarative_base, declared_attr, Mapped
 from sqlalchemy import Column, Integer, DateTime
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.sql import func
 
 
+# Horodatage serveur. Sous SQLite, on stocke au même format que CURRENT_TIMESTAMP
+# (à la seconde) : sinon une valeur relue puis rebindée (curseur keyset) ne
+# serait jamais égale à la valeur stockée.
+Timestamp = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(
+        storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"
+    ),
+    "sqlite",
+)
+
+
 class Base:
     """Classe de base pour tous les modèles SQLAlchemy 2.0"""
     
@@ -16,7 +28,7 @@ class Base:
         return cls.__name__.lower() + "s"
 
     id: Mapped[int] = Column(Integer, primary_key=True, index=True)
-    created_at: Mapped[Any] = Column(DateTime(timezone=True), server_default=func.now())
+    created_at: Mapped[Any] = Column(Timestamp, server_default=func.now())
 
 
 # Créer la base déclarative
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index
+from app.models.base_class import Base
+
+
+class IdempotencyKey(Base):
+    """
+    Clé d'idempotence d'un appel monétaire (en-tête Idempotency-Key).
+
+    La ligne est insérée dans la transaction de l'opération elle-même : elle
+    n'existe que si l'opération a été commitée (ou refusée, réponse d'erreur
+    enregistrée). `response` est rempli juste après le commit et rejoué tel
+    quel aux requêtes suivantes portant la même clé.
+    """
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, unique=True, nullable=False)  # "<user_id>:<opération>:<clé client>"
+    fingerprint = Column(String(64), nullable=False)  # sha256 du corps de la requête
+    status_code = Column(Integer, nullable=True)
+    response = Column(Text, nullable=True)  # JSON
+    expires_at = Column(DateTime, nullable=False)
+
+    # Purge périodique des clés expirées
+    __table_args__ = (
+        Index('idx_idempotency_key_expires', 'expires_at'),
+    )
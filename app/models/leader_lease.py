@@ -0,0 +1,18 @@
+from sqlalchemy import Column, String, Integer, DateTime
+from app.models.base_class import Base
+
+
+class LeaderLease(Base):
+    """
+    Bail de leader (élection par la base).
+
+    Une ligne par rôle (ex: "scheduler"). `token` est incrémenté à chaque
+    prise de bail : c'est le jeton de fencing vérifié par les jobs avant
+    d'écrire.
+    """
+    __tablename__ = "leader_leases"
+
+    name = Column(String, unique=True, nullable=False)
+    holder = Column(String, nullable=True)
+    token = Column(Integer, nullable=False, default=0)
+    expires_at = Column(DateTime, nullable=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, Boolean, Integer, ForeignKey, DateTime
+from sqlalchemy import Column, String, Float, Boolean, Integer, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from app.models.base_class import Base
 
@@ -22,4 +22,11 @@ class Listing(Base):
     # Disponibilité (Le "On/Off" de l'artisan)
     is_available = Column(Boolean, default=True)
     
-    partner = relationship("User", back_populates="listings")
\ No newline at end of file
+    partner = relationship("User", back_populates="listings")
+    
+    # Index composites pour le fil paginé (keyset sur created_at, id)
+    __table_args__ = (
+        Index('idx_listing_feed', 'is_available', 'created_at', 'id'),
+        Index('idx_listing_category_feed', 'category', 'is_available', 'created_at', 'id'),
+        Index('idx_listing_type_feed', 'type', 'is_available', 'created_at', 'id'),
+    )
\ No newline at end of file
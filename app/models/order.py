@@ -1,6 +1,6 @@
 from sqlalchemy import Column, Integer, Float, String, ForeignKey, Enum, DateTime, Text, Index, Boolean  # ⬅️ AJOUTE Boolean ici
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 import enum
 from app.models.base_class import Base
 from datetime import datetime
@@ -21,6 +21,10 @@ class OrderStatus(str, enum.Enum):
     DISPUTED = "DISPUTED"     # Litige ouvert
     CANCELLED = "CANCELLED"   # Annulé avant travaux
 
+# Origine de ai_category : seules les catégories du modèle servent à entraîner le classifieur local
+AI_SOURCE_MODEL = "model"
+AI_SOURCE_LOCAL = "local"
+
 class Order(Base):
     __tablename__ = "orders"
     
@@ -43,6 +47,7 @@ class Order(Base):
     ai_title = Column(String, nullable=True)
     ai_category = Column(String, nullable=True)
     ai_tags = Column(String, nullable=True)
+    ai_source = Column(String, nullable=True)  # AI_SOURCE_MODEL / AI_SOURCE_LOCAL
 
     # Deep Linking WhatsApp
     partner_whatsapp = Column(String, nullable=True)
@@ -70,6 +75,16 @@ class Order(Base):
     __table_args__ = (
         Index('idx_order_status', 'status'),
         Index('idx_order_funded_at', 'funded_at'),
+        # Historique paginé : une jambe indexée par rôle (client / artisan)
+        Index('idx_order_client_created', 'client_id', 'created_at', 'id'),
+        Index('idx_order_partner_created', 'partner_id', 'created_at', 'id'),
+        # Escalade des rappels / auto-release : seules les commandes livrées
+        # ont un delivered_at, l'index partiel reste petit
+        Index(
+            'idx_order_status_delivered', 'status', 'delivered_at',
+            postgresql_where=text("delivered_at IS NOT NULL"),
+            sqlite_where=text("delivered_at IS NOT NULL"),
+        ),
     )
 
     def time_in_escrow_minutes(self) -> int:
@@ -0,0 +1,33 @@
+import enum
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, Enum, Index
+from app.models.base_class import Base
+
+
+class TaskKind(str, enum.Enum):
+    """Type d'échéance planifiée pour une commande"""
+    REMINDER = "REMINDER"           # Rappel de validation (J+1, +36h, +47h)
+    AUTO_RELEASE = "AUTO_RELEASE"   # Libération automatique des fonds (48h)
+    AI_ENRICH = "AI_ENRICH"         # Enrichissement IA de la description (titre, catégorie, tags)
+
+
+class ScheduledTask(Base):
+    """
+    File d'attente à échéance (delay queue) persistée en base.
+
+    Une ligne = un traitement à déclencher à due_at pour une commande.
+    Rappels / libération : la ligne est supprimée quand le dispatcher la prend
+    en charge ; les jobs périodiques restent le filet de sécurité.
+    Enrichissement IA : la ligne est louée (due_at repoussé) pendant le
+    traitement et supprimée seulement après écriture du résultat.
+    """
+    __tablename__ = "scheduled_tasks"
+
+    kind = Column(Enum(TaskKind), nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False)
+    due_at = Column(DateTime, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+
+    # Chaque consommateur ne lit que la tête de sa file : kind + due_at <= now
+    __table_args__ = (
+        Index('idx_scheduled_task_kind_due', 'kind', 'due_at'),
+    )
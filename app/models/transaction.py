@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
 from sqlalchemy.sql import func
-from app.models.base_class import Base
+from app.models.base_class import Base, Timestamp
 
 class Transaction(Base):
     """Grand Livre comptable pour l'audit."""
@@ -16,4 +16,11 @@ class Transaction(Base):
     status = Column(String, default="SUCCESS")
     reference = Column(String)
 
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(Timestamp, server_default=func.now())
+
+    # Historique / export par wallet (keyset sur created_at, id)
+    __table_args__ = (
+        Index('idx_transaction_wallet_created', 'wallet_id', 'created_at', 'id'),
+        # Réconciliation incrémentale : transactions d'un wallet après un point de contrôle
+        Index('idx_transaction_wallet_id', 'wallet_id', 'id'),
+    )
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, ForeignKey, Index
+from app.models.base_class import Base, Timestamp
+
+
+class WalletCheckpoint(Base):
+    """
+    Point de contrôle du grand livre d'un wallet.
+
+    `balance` = somme des transactions du wallet d'ID <= last_transaction_id,
+    écrite par la réconciliation quand elle correspond à wallets.balance.
+    La réconciliation suivante ne somme que les transactions postérieures ;
+    balance_as_of part du dernier point antérieur à la date demandée.
+    """
+    __tablename__ = "wallet_checkpoints"
+
+    wallet_id = Column(Integer, ForeignKey("wallets.id", ondelete="CASCADE"), nullable=False)
+    balance = Column(Integer, nullable=False)
+    last_transaction_id = Column(Integer, nullable=False)
+    # Plus récent created_at des transactions couvertes
+    last_transaction_at = Column(Timestamp, nullable=False)
+
+    # Dernier point d'un wallet = plus grand last_transaction_id
+    __table_args__ = (
+        Index('idx_wallet_checkpoint_wallet_tx', 'wallet_id', 'last_transaction_id', unique=True),
+    )
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class ListingBase(BaseModel):
@@ -15,9 +15,28 @@ class ListingBase(BaseModel):
 class ListingCreate(ListingBase):
     pass
 
+class ListingUpdate(BaseModel):
+    """Mise à jour partielle : seuls les champs envoyés sont modifiés"""
+    title: Optional[str] = None
+    description: Optional[str] = None
+    price: Optional[int] = None
+    price_unit: Optional[str] = None
+    type: Optional[str] = None
+    category: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    is_available: Optional[bool] = None
+
 class ListingResponse(ListingBase):
     id: int
     partner_id: int
+    is_available: bool = True
     created_at: datetime
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class ListingPage(BaseModel):
+    """Page du fil des listings : passer next_cursor pour la page suivante"""
+    items: List[ListingResponse]
+    next_cursor: Optional[str] = None
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from app.models.order import OrderStatus
 
@@ -43,4 +43,9 @@ class OrderResponse(BaseModel):
     dispute_raised_at: Optional[datetime] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class OrderPage(BaseModel):
+    """Page de l'historique des commandes : passer next_cursor pour la suite"""
+    items: List[OrderResponse]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,21 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+
+class TransactionResponse(BaseModel):
+    id: int
+    wallet_id: int
+    order_id: Optional[int] = None
+    amount: int
+    type: str
+    status: Optional[str] = None
+    reference: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class TransactionPage(BaseModel):
+    """Page de l'historique des transactions : passer next_cursor pour la suite"""
+    items: List[TransactionResponse]
+    next_cursor: Optional[str] = None
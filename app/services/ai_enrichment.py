@@ -0,0 +1,210 @@
+"""
+EnrichmentWorker - Enrichissement IA durable des commandes
+
+La file est en base (scheduled_tasks, kind AI_ENRICH) : une tâche est
+écrite dans la même transaction que la commande, donc rien n'est perdu
+au redémarrage. Le worker loue les tâches dues par lots, analyse les
+descriptions en micro-lots (AISimplifierService.analyze_many) puis écrit
+les résultats en un seul UPDATE executemany, dans la transaction qui
+supprime les tâches traitées. Les échecs sont replanifiés avec backoff.
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, exists, insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.delay_queue import DelayQueue
+from app.db.session import AsyncSessionLocal
+from app.models.order import AI_SOURCE_LOCAL, AI_SOURCE_MODEL, Order
+from app.models.scheduled_task import ScheduledTask, TaskKind
+from app.services.ai_simplifier import AISimplifierService
+
+logger = logging.getLogger(__name__)
+
+MIN_DESCRIPTION_LENGTH = 5
+RETRY_BASE_DELAY = 30  # secondes, doublé à chaque tentative
+RETRY_MAX_DELAY = 3600
+
+
+class EnrichmentWorker:
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.counters = {"enriched": 0, "skipped": 0, "retried": 0, "abandoned": 0, "batches": 0}
+
+    @staticmethod
+    def enqueue(db: AsyncSession, order_id: int):
+        """Planifie l'enrichissement d'une commande (sans commit : avec la commande)"""
+        DelayQueue.enqueue(db, TaskKind.AI_ENRICH, order_id, datetime.utcnow())
+
+    # ===== Cycle de vie =====
+
+    def start(self):
+        if self._task is not None:
+            return
+        if AISimplifierService.provider() is None:
+            logger.warning("⚠️ EnrichmentWorker non démarré : aucun fournisseur IA (les tâches restent en file)")
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info(f"🧠 EnrichmentWorker démarré ({AISimplifierService.provider().name})")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            logger.info("🛑 EnrichmentWorker arrêté")
+
+    def notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        try:
+            queued = await self.backfill()
+            if queued:
+                logger.info(f"🧠 EnrichmentWorker: {queued} commandes existantes mises en file")
+        except Exception as e:
+            logger.error(f"❌ EnrichmentWorker: reprise des commandes non enrichies impossible: {e}")
+
+        while True:
+            try:
+                wait = AISimplifierService.breaker.retry_after()
+                if wait:
+                    await asyncio.sleep(wait)
+                    continue
+                leased = await DelayQueue.lease_due(
+                    TaskKind.AI_ENRICH,
+                    limit=settings.AI_BATCH_SIZE * settings.AI_CONCURRENCY,
+                    lease_seconds=settings.AI_ENRICH_LEASE
+                )
+                if leased:
+                    await self.process(leased)
+                    continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.AI_ENRICH_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ EnrichmentWorker: {e}")
+                await asyncio.sleep(settings.AI_ENRICH_POLL_INTERVAL)
+
+    # ===== Traitement =====
+
+    @staticmethod
+    async def backfill() -> int:
+        """Met en file les commandes avec description, non enrichies et sans tâche en attente"""
+        pending = exists().where(and_(
+            ScheduledTask.kind == TaskKind.AI_ENRICH,
+            ScheduledTask.order_id == Order.id
+        ))
+        source = select(
+            literal(TaskKind.AI_ENRICH, ScheduledTask.kind.type),
+            Order.id,
+            literal(datetime.utcnow(), ScheduledTask.due_at.type),
+            literal(0)
+        ).where(
+            Order.problem_description.is_not(None),
+            Order.ai_title.is_(None),
+            ~pending
+        )
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                insert(ScheduledTask).from_select(["kind", "order_id", "due_at", "attempts"], source)
+            )
+            await db.commit()
+            return result.rowcount or 0
+
+    async def process(self, leased: List[Tuple[int, int, int]]) -> dict:
+        """Analyse un lot de tâches louées et écrit les résultats en bloc"""
+        order_ids = [order_id for _, order_id, _ in leased]
+        async with AsyncSessionLocal() as db:
+            rows = await db.execute(
+                select(Order.id, Order.problem_description, Order.ai_title).where(Order.id.in_(order_ids))
+            )
+            orders = {row.id: row for row in rows}
+
+        to_analyze, done_task_ids = [], []
+        for task_id, order_id, attempts in leased:
+            order = orders.get(order_id)
+            description = (order.problem_description or "").strip() if order else ""
+            if order is None or order.ai_title or len(description) < MIN_DESCRIPTION_LENGTH:
+                done_task_ids.append(task_id)
+                self.counters["skipped"] += 1
+            else:
+                to_analyze.append((task_id, order_id, attempts, description))
+
+        results = await AISimplifierService.analyze_many([item[3] for item in to_analyze])
+
+        updates, retry = [], []
+        for (task_id, order_id, attempts, _), result in zip(to_analyze, results):
+            if result is not None:
+                updates.append({
+                    "b_id": order_id,
+                    "b_title": result["title"],
+                    "b_category": result["category"],
+                    "b_tags": result["tags"],
+                    # Prédiction du classifieur local : jamais réutilisée comme donnée d'entraînement
+                    "b_source": AI_SOURCE_LOCAL if result.get("source") == AI_SOURCE_LOCAL else AI_SOURCE_MODEL,
+                })
+                done_task_ids.append(task_id)
+            elif attempts >= settings.AI_ENRICH_MAX_ATTEMPTS and AISimplifierService.breaker.retry_after() == 0:
+                logger.error(f"❌ IA: commande #{order_id} abandonnée après {attempts} tentatives")
+                done_task_ids.append(task_id)
+                self.counters["abandoned"] += 1
+            else:
+                retry.append((task_id, attempts))
+
+        orders_table = Order.__table__
+        async with AsyncSessionLocal() as db:
+            if updates:
+                # Pas d'écrasement si la commande a été enrichie entre-temps
+                await db.execute(
+                    update(orders_table)
+                    .where(orders_table.c.id == bindparam("b_id"), orders_table.c.ai_title.is_(None))
+                    .values(
+                        ai_title=bindparam("b_title"),
+                        ai_category=bindparam("b_category"),
+                        ai_tags=bindparam("b_tags"),
+                        ai_source=bindparam("b_source")
+                    ),
+                    updates
+                )
+            await DelayQueue.complete(db, done_task_ids)
+            now = datetime.utcnow()
+            # Circuit ouvert : on attend sa réouverture plutôt que le backoff
+            breaker_wait = AISimplifierService.breaker.retry_after()
+            by_delay = defaultdict(list)
+            for task_id, attempts in retry:
+                by_delay[breaker_wait or min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)].append(task_id)
+            for delay, task_ids in by_delay.items():
+                await DelayQueue.reschedule(db, task_ids, now + timedelta(seconds=delay))
+            await db.commit()
+
+        self.counters["batches"] += 1
+        self.counters["enriched"] += len(updates)
+        self.counters["retried"] += len(retry)
+        if updates:
+            logger.info(f"✅ IA: {len(updates)} commandes enrichies ({len(retry)} à retenter)")
+        return {"enriched": len(updates), "retried": len(retry), "done": len(done_task_ids)}
+
+    async def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "backlog": await DelayQueue.backlog(kinds=(TaskKind.AI_ENRICH,)),
+            **self.counters,
+        }
+
+
+# Instance globale (démarrée dans le lifespan de l'application)
+enrichment_worker = EnrichmentWorker()
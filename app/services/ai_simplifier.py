@@ -1,145 +1,339 @@
+"""
+AISimplifierService - Analyse IA des descriptions de problèmes clients
+
+Titre technique, catégorie et tags à partir de la description libre :
+- Fournisseurs interchangeables (AI_PROVIDER) : Gemini (API async) ou stub
+  local déterministe (tests, benchmarks hors ligne)
+- Plusieurs descriptions par appel modèle, résultat JSON par élément
+- Concurrence bornée, timeout par appel, circuit breaker
+- Cache adressé par le contenu (description normalisée)
+- Classifieur local (LocalClassifier) en premier : le modèle n'est appelé
+  que pour les descriptions où sa confiance est insuffisante
+"""
+
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-import google.generativeai as genai
+import hashlib
 import json
 import logging
-from sqlalchemy.ext.asyncio import AsyncSession
+import time
+from typing import Dict, List, Optional, Sequence
+
+import google.generativeai as genai
+
+from app.core.cache import TieredCache
+from app.core.circuit_breaker import CircuitBreaker, CircuitOpenError
 from app.core.config import settings
-from app.models.order import Order
-from app.models.base_class import Base # Nécessaire pour l'initialisation DB
+from app.services.local_classifier import local_classifier, normalize_description
 
 logger = logging.getLogger(__name__)
 
-# --- Configuration Gemini (Synchrone) ---
+CATEGORIES = ("PLOMBERIE", "ELECTRICITE", "FROID", "MACONNERIE", "DIVERS")
 
-# Configuration unique au démarrage de l'app (main.py)
-try:
-    if settings.GEMINI_API_KEY:
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        logger.info("🧠 Gemini configuré.")
-    else:
-        logger.warning("⚠️ GEMINI_API_KEY non définie. Le service IA est désactivé.")
-except Exception as e:
-    logger.error(f"❌ Erreur de configuration Gemini: {e}")
+# Résultats d'analyse adressés par le contenu (description normalisée)
+ai_cache = TieredCache(
+    "ai:analysis",
+    ttl=settings.AI_CACHE_TTL,
+    local_ttl=3600,
+    local_maxsize=settings.AI_CACHE_MAX_ENTRIES,
+)
 
-# ThreadPool pour les appels Gemini (qui sont synchrones)
-executor = ThreadPoolExecutor(max_workers=2)
+def description_key(description: str) -> str:
+    return hashlib.sha256(normalize_description(description).encode()).hexdigest()
 
-class AISimplifierService:
 
-    @staticmethod
-    def _call_gemini(description: str) -> dict:
+class AIAnalysisError(Exception):
+    """Échec d'analyse : jamais mis en cache"""
+
+
+def _clean_result(item: dict) -> dict:
+    category = str(item.get("category", "DIVERS")).upper()
+    tags = item.get("tags", "")
+    if isinstance(tags, list):
+        tags = ",".join(str(tag) for tag in tags)
+    return {
+        "title": str(item.get("title") or "Analyse en cours")[:80],
+        "category": category if category in CATEGORIES else "DIVERS",
+        "tags": str(tags),
+    }
+
+
+# ===== Fournisseurs =====
+
+class AIProvider:
+    name = "base"
+
+    async def analyze_batch(self, descriptions: Dict[str, str]) -> Dict[str, dict]:
         """
-        Appel SYNCHRONE à Gemini.
-        S'exécute dans un thread séparé (via run_in_executor) pour ne pas bloquer FastAPI.
+        ref -> description ; retourne ref -> {title, category, tags}.
+        Une ref absente du résultat est un échec de cet élément seulement.
         """
-        print(f"🧠 DEBUG IA: Appel Gemini avec description: '{description}'")  
-        
-        if not settings.GEMINI_API_KEY:
-            print("🧠 DEBUG IA: API Key manquante")  
-            return {"success": False, "error": "API Key manquante"}
-             
-        try:
-            model = genai.GenerativeModel('gemini-2.5-flash')
-            
-            prompt = f"""Tu es un assistant pour artisans. Analyse ce problème du client : "{description}"
-Retourne UNIQUEMENT un JSON brut (pas de markdown) :
-{{
+        raise NotImplementedError
+
+
+class GeminiProvider(AIProvider):
+    name = "gemini"
+    MODEL = "gemini-2.5-flash"
+
+    def __init__(self, api_key: str):
+        genai.configure(api_key=api_key)
+        self._model = genai.GenerativeModel(
+            self.MODEL, generation_config={"response_mime_type": "application/json"}
+        )
+
+    async def analyze_batch(self, descriptions: Dict[str, str]) -> Dict[str, dict]:
+        items = "\n".join(
+            f'- id "{ref}": {json.dumps(text, ensure_ascii=False)}' for ref, text in descriptions.items()
+        )
+        prompt = f"""Tu es un assistant pour artisans. Analyse chacun de ces problèmes de clients :
+{items}
+Retourne UNIQUEMENT un tableau JSON brut (pas de markdown), un objet par problème :
+[{{
+    "id": "id du problème",
     "title": "Titre technique court (max 5 mots, ex: Fuite d'eau WC)",
     "category": "PLOMBERIE|ELECTRICITE|FROID|MACONNERIE|DIVERS",
     "tags": "mot1,mot2,mot3,mot4"
-}}"""
-            
-            print("🧠 DEBUG IA: Envoi requête à Gemini...")  
-            
-            # Appel SYNC
-            response = model.generate_content(prompt)
-
-            
-            text = response.text
-            print(f"🧠 DEBUG IA: Réponse Gemini brute: {text}")  
-            
-            # Le modèle avec response_mime_type doit retourner du JSON propre, 
-            # mais on garde la logique de nettoyage pour plus de robustesse.
-            clean_json = text.replace("```json", "").replace("```", "").strip()
-            data = json.loads(clean_json)
-            
-            print(f"🧠 DEBUG IA: JSON parsé: {data}")  
-            
-            return {
-                "success": True,
-                "title": data.get("title", "Analyse en cours"),
-                "category": data.get("category", "DIVERS"),
-                "tags": data.get("tags", "")
-            }
-            
+}}]"""
+
+        response = await self._model.generate_content_async(prompt)
+        text = response.text.replace("```json", "").replace("```", "").strip()
+        try:
+            data = json.loads(text)
         except json.JSONDecodeError as e:
-            logger.warning(f"⚠️ JSON Parse Error: {e}. Response: {text}")
-            print(f"🧠 DEBUG IA: Erreur JSON: {e}") 
-            return {"success": False, "error": "JSON_PARSE_ERROR"}
-            
-        except Exception as e:
-            logger.error(f"❌ Gemini Error: {e}")
-            print(f"🧠 DEBUG IA: Erreur Gemini: {e}") 
-            return {"success": False, "error": str(e)}
+            raise AIAnalysisError(f"JSON_PARSE_ERROR: {e}") from e
 
-    @staticmethod
-    async def analyze_order(order_id: int, description: str):
-        """
-        Analyse asynchrone via ThreadPool. Ouvre sa propre session DB.
-        """
-        print(f"🧠 DEBUG IA: Début analyse pour order #{order_id}")  
-        
-        if not description:
-            print(f"🧠 DEBUG IA: Description vide pour order #{order_id}") 
-            return
-            
-        if len(description) < 5:
-            print(f"🧠 DEBUG IA: Description trop courte pour order #{order_id}") 
-            return
-            
-        if not settings.GEMINI_API_KEY:
-            print(f"🧠 DEBUG IA: API Key manquante pour order #{order_id}")  
-            return
-
-        from app.db.session import AsyncSessionLocal
-        
-        logger.info(f"🧠 IA: Analyse commande #{order_id} EN COURS...")
-        print(f"🧠 DEBUG IA: Analyse commande #{order_id} EN COURS...")  
-        
-        # 1. Exécuter l'appel Gemini dans un thread séparé
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            executor,
-            AISimplifierService._call_gemini,
-            description
+        results = {}
+        for item in data if isinstance(data, list) else []:
+            ref = str(item.get("id")) if isinstance(item, dict) else None
+            if ref in descriptions:
+                results[ref] = _clean_result(item)
+        return results
+
+
+class StubProvider(AIProvider):
+    """Analyse locale par mots-clés : déterministe, sans réseau (tests, benchmarks)"""
+    name = "stub"
+
+    KEYWORDS = {
+        "PLOMBERIE": ("fuite", "eau", "robinet", "tuyau", "wc", "evier", "lavabo", "douche", "canalisation"),
+        "ELECTRICITE": ("electri", "courant", "prise", "disjonct", "ampoule", "cable", "interrupteur", "tableau"),
+        "FROID": ("frigo", "clim", "congel", "froid", "refriger", "chambre froide"),
+        "MACONNERIE": ("mur", "fissure", "beton", "ciment", "carrel", "brique", "dalle", "crepi"),
+    }
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    async def analyze_batch(self, descriptions: Dict[str, str]) -> Dict[str, dict]:
+        self.calls += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return {ref: self.analyze(text) for ref, text in descriptions.items()}
+
+    @classmethod
+    def analyze(cls, description: str) -> dict:
+        normalized = normalize_description(description)
+        category = next(
+            (name for name, words in cls.KEYWORDS.items() if any(word in normalized for word in words)),
+            "DIVERS",
         )
-        
-        print(f"🧠 DEBUG IA: Résultat Gemini pour order #{order_id}: {result}")  
-        
-        if not result.get("success"):
-            logger.warning(f"⚠️ IA Analysis failed for #{order_id}: {result.get('error')}")
-            print(f"🧠 DEBUG IA: Échec analyse pour order #{order_id}: {result.get('error')}")  
-            return
-
-        # 2. Ouvrir une session DB dédiée pour la mise à jour (Critique #3: SAFE DB)
-        async with AsyncSessionLocal() as db:
+        words = [word for word in normalized.split() if len(word) > 3]
+        return {
+            "title": " ".join(normalized.split()[:5]).capitalize() or "Analyse en cours",
+            "category": category,
+            "tags": ",".join(list(dict.fromkeys(words))[:4]),
+        }
+
+
+def build_provider() -> Optional[AIProvider]:
+    if settings.AI_PROVIDER == "stub":
+        return StubProvider()
+    if not settings.GEMINI_API_KEY:
+        logger.warning("⚠️ GEMINI_API_KEY non définie. Le service IA est désactivé.")
+        return None
+    logger.info("🧠 Gemini configuré.")
+    return GeminiProvider(settings.GEMINI_API_KEY)
+
+
+# ===== Service =====
+
+class AISimplifierService:
+
+    counters = {
+        "model_calls": 0, "analyzed": 0, "local_served": 0, "cache_served": 0, "failed": 0, "timeouts": 0,
+        "call_ms_total": 0.0, "latency_saved_ms": 0.0,
+    }
+    breaker = CircuitBreaker("ai", settings.AI_BREAKER_THRESHOLD, settings.AI_BREAKER_COOLDOWN)
+    _provider: Optional[AIProvider] = None
+    _provider_loaded = False
+    _slots: Optional[asyncio.Semaphore] = None
+
+    @classmethod
+    def provider(cls) -> Optional[AIProvider]:
+        if not cls._provider_loaded:
+            cls._provider = build_provider()
+            cls._provider_loaded = True
+        return cls._provider
+
+    @classmethod
+    def use_provider(cls, provider: Optional[AIProvider]):
+        """Remplace le fournisseur (tests, benchmarks)"""
+        cls._provider = provider
+        cls._provider_loaded = True
+
+    @classmethod
+    async def _call(cls, descriptions: Dict[str, str]) -> Dict[str, dict]:
+        """Un appel modèle pour un lot, sous limite de concurrence, timeout et circuit breaker"""
+        provider = cls.provider()
+        if provider is None:
+            raise AIAnalysisError("Fournisseur IA non configuré")
+        if cls._slots is None:
+            cls._slots = asyncio.Semaphore(settings.AI_CONCURRENCY)
+
+        async with cls._slots:
+            cls.breaker.before_call()
+            started = time.perf_counter()
             try:
-                order = await db.get(Order, order_id)
-                if order:
-                    order.ai_title = result["title"]
-                    # Ajout des nouveaux champs
-                    order.ai_category = result["category"] 
-                    order.ai_tags = result["tags"] 
-                    order.ai_summary = description # Utiliser description comme summary pour MVP
-                    
-                    await db.commit()
-                    logger.info(f"✅ IA: Order #{order_id} enrichie -> {result['title']}")
-                    print(f"🧠 DEBUG IA: Order #{order_id} mis à jour avec succès -> {result['title']}")  
-                else:
-                    logger.warning(f"Commande {order_id} non trouvée pour mise à jour IA.")
-                    print(f"🧠 DEBUG IA: Commande {order_id} non trouvée en DB")  
+                results = await asyncio.wait_for(
+                    provider.analyze_batch(descriptions), timeout=settings.AI_CALL_TIMEOUT
+                )
+            except asyncio.TimeoutError as e:
+                cls.counters["timeouts"] += 1
+                cls.breaker.record_failure()
+                raise AIAnalysisError(f"TIMEOUT après {settings.AI_CALL_TIMEOUT}s") from e
             except Exception as e:
-                await db.rollback()
-                logger.error(f"❌ Erreur de mise à jour DB après IA: {e}")
-                print(f"🧠 DEBUG IA: Erreur DB pour order #{order_id}: {e}")  
\ No newline at end of file
+                cls.breaker.record_failure()
+                raise AIAnalysisError(str(e)) from e
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+        cls.breaker.record_success()
+        cls.counters["model_calls"] += 1
+        cls.counters["call_ms_total"] += elapsed_ms
+        # Coût d'un élément = part de l'appel (sert au calcul de la latence économisée)
+        per_item_ms = round(elapsed_ms / len(descriptions), 1)
+        return {ref: {**result, "success": True, "latency_ms": per_item_ms} for ref, result in results.items()}
+
+    @classmethod
+    def _local(cls, description: str) -> Optional[dict]:
+        """Résultat du classifieur local s'il est assez sûr de lui, sinon None"""
+        if not settings.AI_LOCAL_CLASSIFIER:
+            return None
+        result = local_classifier.analyze(description)
+        if result is None or result["confidence"] < settings.AI_LOCAL_MIN_CONFIDENCE:
+            return None
+        cls.counters["local_served"] += 1
+        return {**result, "success": True}
+
+    @staticmethod
+    def _learn(description: str, result: dict):
+        # Chaque réponse du modèle enrichit le classifieur local
+        if settings.AI_LOCAL_CLASSIFIER:
+            local_classifier.learn(description, result["category"])
+
+    @classmethod
+    async def train_local_classifier(cls) -> int:
+        if not settings.AI_LOCAL_CLASSIFIER:
+            return 0
+        return await local_classifier.train_from_db(limit=settings.AI_LOCAL_TRAINING_LIMIT)
+
+    @classmethod
+    async def analyze_description(cls, description: str) -> dict:
+        """
+        Analyse d'une description, servie depuis le cache quand une description
+        équivalente (même forme normalisée) a déjà été analysée. Les demandes
+        identiques simultanées partagent un seul appel.
+        """
+        local = cls._local(description)
+        if local is not None:
+            return local
+        called = False
+
+        async def load() -> dict:
+            nonlocal called
+            called = True
+            results = await cls._call({"0": description})
+            if "0" not in results:
+                raise AIAnalysisError("Résultat absent de la réponse du modèle")
+            cls.counters["analyzed"] += 1
+            cls._learn(description, results["0"])
+            return results["0"]
+
+        try:
+            result = await ai_cache.get_or_set(description_key(description), load)
+        except (AIAnalysisError, CircuitOpenError) as e:
+            cls.counters["failed"] += 1
+            return {"success": False, "error": str(e)}
+
+        if not called:
+            cls.counters["cache_served"] += 1
+            cls.counters["latency_saved_ms"] += result.get("latency_ms", 0.0)
+        return result
+
+    @classmethod
+    async def analyze_many(cls, descriptions: Sequence[str]) -> List[Optional[dict]]:
+        """
+        Analyse d'un lot de descriptions, dans l'ordre. Classifieur local
+        d'abord ; les descriptions déjà en cache ou en double ne sont envoyées
+        qu'une fois au modèle ; le reste part par lots de AI_BATCH_SIZE.
+        None = échec pour cet élément.
+        """
+        keys = [description_key(description) for description in descriptions]
+        local_results: Dict[int, dict] = {}
+        results: Dict[str, dict] = {}
+        pending: Dict[str, str] = {}
+        for index, (key, description) in enumerate(zip(keys, descriptions)):
+            local = cls._local(description)
+            if local is not None:
+                local_results[index] = local
+                continue
+            if key in results or key in pending:
+                continue
+            cached = await ai_cache.get(key)
+            if cached is not None:
+                results[key] = cached
+            else:
+                pending[key] = description
+
+        items = list(pending.items())
+        chunks = [dict(items[start:start + settings.AI_BATCH_SIZE]) for start in range(0, len(items), settings.AI_BATCH_SIZE)]
+        outcomes = await asyncio.gather(*[cls._call(chunk) for chunk in chunks], return_exceptions=True)
+        for chunk, outcome in zip(chunks, outcomes):
+            if isinstance(outcome, BaseException):
+                logger.warning(f"⚠️ IA: lot de {len(chunk)} descriptions en échec: {outcome}")
+                continue
+            for key, result in outcome.items():
+                results[key] = result
+                await ai_cache.set(key, result)
+                cls._learn(chunk[key], result)
+            cls.counters["analyzed"] += len(outcome)
+
+        # Servie sans appel dédié : en cache, ou doublon d'un élément du lot
+        sent = set(pending)
+        for index, key in enumerate(keys):
+            if index in local_results:
+                continue
+            if key not in results:
+                cls.counters["failed"] += 1
+            elif key in sent:
+                sent.discard(key)
+            else:
+                cls.counters["cache_served"] += 1
+                cls.counters["latency_saved_ms"] += results[key].get("latency_ms", 0.0)
+        return [local_results.get(index) or results.get(key) for index, key in enumerate(keys)]
+
+    @classmethod
+    def stats(cls) -> dict:
+        calls = cls.counters["model_calls"]
+        requests = cls.counters["analyzed"] + cls.counters["cache_served"] + cls.counters["local_served"]
+        provider = cls.provider()
+        return {
+            "provider": provider.name if provider else None,
+            **{name: round(value, 1) for name, value in cls.counters.items()},
+            # Analyses servies sans appel modèle (cache ou doublon partagé / classifieur local)
+            "hit_ratio": round(cls.counters["cache_served"] / requests, 4) if requests else 0.0,
+            "local_ratio": round(cls.counters["local_served"] / requests, 4) if requests else 0.0,
+            "avg_call_ms": round(cls.counters["call_ms_total"] / calls, 1) if calls else 0.0,
+            "breaker": cls.breaker.stats(),
+            "local_classifier": {**local_classifier.stats(), "min_confidence": settings.AI_LOCAL_MIN_CONFIDENCE},
+            "cache": ai_cache.stats(),
+        }
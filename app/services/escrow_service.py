@@ -1,13 +1,26 @@
 from datetime import datetime, timedelta
+from typing import Optional, Sequence
+import logging
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update
 from app.models.order import Order, OrderStatus
 from app.models.wallet import Wallet
-from app.models.transaction import Transaction
 from app.models.escrow_account import EscrowAccount, EscrowStatus # NOUVEAU
+from app.core.delay_queue import DelayQueue
+from app.services.ledger_service import LedgerService
 import math
 
+logger = logging.getLogger(__name__)
+
+# Statuts depuis lesquels les fonds peuvent être libérés
+RELEASABLE_STATUSES = [
+    OrderStatus.DELIVERED,
+    OrderStatus.REMINDER_1,
+    OrderStatus.REMINDER_2,
+    OrderStatus.REMINDER_FINAL
+]
+
 class EscrowService:
 
     COMMISSION_RATE = 0.05 # 5% de commission KoCo
@@ -55,19 +68,35 @@ class EscrowService:
         commission = int(round(amount_float * EscrowService.COMMISSION_RATE))
         net_pay = amount_int - commission
 
-        # 1. Vérif Solde Client
-        q_client = await db.execute(select(Wallet).where(Wallet.user_id == client_id))
-        client_wallet = q_client.scalars().first()
+        # --- FLUX ATOMIQUE CRITIQUE ---
+        now = datetime.utcnow()
 
-        # On vérifie le solde en FCFA (int)
-        if not client_wallet or client_wallet.balance < amount_int: 
-            raise HTTPException(status_code=400, detail="Solde insuffisant. Veuillez recharger.")
+        # 1. Marquer commande FUNDED + Timestamps, seulement si encore ACCEPTED :
+        # deux paiements concurrents ne peuvent pas débiter deux fois
+        claimed = await db.execute(
+            update(Order)
+            .where(Order.id == order.id, Order.status == OrderStatus.ACCEPTED)
+            .values(
+                status=OrderStatus.FUNDED,
+                funded_at=now,
+                commission_amount=commission # Optionnel: stocker aussi la commission dans Order (Float vs Int)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if claimed.rowcount == 0:
+            await db.rollback()
+            return {"status": "Fonds déjà sécurisés", "new_status": "FUNDED"}
+
+        # 2. Débiter client (entier, garde de solde) + trace (Débit client)
+        new_balance = await LedgerService.apply(
+            db, client_id, -amount_int,
+            type="ESCROW_LOCK",
+            reference=f"ORD-{order.id}-LOCK",
+            order_id=order.id
+        )
+        if new_balance is None:
+            await LedgerService.reject(db, client_id, "Solde insuffisant. Veuillez recharger.")
 
-        # --- FLUX ATOMIQUE CRITIQUE ---
-        
-        # 2. Débiter client (utilise l'entier)
-        client_wallet.balance -= amount_int
-        
         # 3. Créer l'EscrowAccount avec les entiers
         escrow = EscrowAccount(
             order_id=order.id,
@@ -75,25 +104,9 @@ class EscrowService:
             commission_amount=commission,
             artisan_payout=net_pay,
             status=EscrowStatus.LOCKED,
-            locked_at=datetime.utcnow()
+            locked_at=now
         )
         db.add(escrow)
-
-        # 4. Marquer commande FUNDED + Timestamps
-        order.status = OrderStatus.FUNDED
-        order.funded_at = datetime.utcnow()
-        order.commission_amount = commission # Optionnel: stocker aussi la commission dans Order (Float vs Int)
-
-        # 5. Trace (Débit client)
-        tx = Transaction(
-            wallet_id=client_wallet.id,
-            order_id=order.id,
-            # Le montant de transaction doit aussi être un entier négatif
-            amount=-amount_int, 
-            type="ESCROW_LOCK",
-            reference=f"ORD-{order.id}-LOCK"
-        )
-        db.add(tx)
         
         await db.commit()
         return {"status": "Fonds sécurisés en escrow", "new_status": "FUNDED", "escrow_id": escrow.id, "amount_locked": amount_int}
@@ -132,7 +145,11 @@ class EscrowService:
         order.status = OrderStatus.DELIVERED
         order.delivered_at = datetime.utcnow() # Timestamp critique
 
+        # Échéances précises (rappels + libération 48h), dans la même transaction
+        DelayQueue.schedule_delivery_timers(db, order.id, order.delivered_at)
+
         await db.commit()
+        DelayQueue.notify()
         return {"status": "Travail déclaré fini. Validation client attendue sous 48h."}
 
     @staticmethod
@@ -149,53 +166,198 @@ class EscrowService:
         if not order or not escrow:
             raise HTTPException(status_code=404, detail="Commande ou Escrow introuvable")
 
-        valid_release_statuses = [
-            OrderStatus.DELIVERED, 
-            OrderStatus.REMINDER_1, 
-            OrderStatus.REMINDER_2, 
-            OrderStatus.REMINDER_FINAL
-        ]
-        
-        if order.status not in valid_release_statuses:
+        if order.status not in RELEASABLE_STATUSES:
             raise HTTPException(status_code=400, detail=f"Libération impossible: statut invalide ({order.status.value}).")
 
         if escrow.status != EscrowStatus.LOCKED:
              raise HTTPException(status_code=400, detail=f"Fonds déjà libérés ou autre état Escrow: {escrow.status.value}.")
 
-        # Récupération du wallet partenaire
-        q_partner = await db.execute(select(Wallet).where(Wallet.user_id == order.partner_id))
-        partner_wallet = q_partner.scalars().first()
-        
+        platform_user_id, _ = await LedgerService.platform_account()
+
         # --- FLUX ATOMIQUE CRITIQUE DE LIBÉRATION ---
-        
-        # 1. On crédite l'artisan (Net - Entier)
+        now = datetime.utcnow()
         net_pay = escrow.artisan_payout
-        
-        # Vérif existence wallet
-        if not partner_wallet:
-            raise HTTPException(status_code=500, detail="Portefeuille artisan introuvable.")
 
-        partner_wallet.balance += net_pay
+        # 1. Mise à jour de l'EscrowAccount, seulement s'il est encore LOCKED :
+        # une validation client concurrente d'une auto-libération ne paie qu'une fois
+        claimed = await db.execute(
+            update(EscrowAccount)
+            .where(EscrowAccount.id == escrow.id, EscrowAccount.status == EscrowStatus.LOCKED)
+            .values(
+                status=EscrowStatus.RELEASED,
+                released_at=now,
+                released_by=trigger_source # Utilise le champ Audit
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if claimed.rowcount == 0:
+            await db.rollback()
+            raise HTTPException(status_code=400, detail="Fonds déjà libérés.")
+
+        # 2. On crédite l'artisan (Net - Entier) + Trace Artisan (Crédit - Entier)
+        new_balance = await LedgerService.apply(
+            db, order.partner_id, net_pay,
+            type="ESCROW_RELEASE",
+            reference=f"ORD-{order.id}-RELEASE",
+            order_id=order.id
+        )
+        if new_balance is None:
+            await db.rollback()
+            raise HTTPException(status_code=500, detail="Portefeuille artisan introuvable.")
 
-        # 2. Mise à jour de l'EscrowAccount
-        escrow.status = EscrowStatus.RELEASED
-        escrow.released_at = datetime.utcnow()
-        escrow.released_by = trigger_source # Utilise le champ Audit
+        # 3. Commission KoCo créditée au compte plateforme
+        if escrow.commission_amount:
+            await LedgerService.apply(
+                db, platform_user_id, escrow.commission_amount,
+                type="COMMISSION",
+                reference=f"ORD-{order.id}-COMMISSION",
+                order_id=order.id
+            )
 
-        # 3. Mise à jour de l'Order
+        # 4. Mise à jour de l'Order
         order.status = OrderStatus.COMPLETED
-        order.completed_at = datetime.utcnow()
+        order.completed_at = now
         order.commission_amount = escrow.commission_amount # Copie de l'entier
 
-        # 4. Trace Artisan (Crédit - Entier)
-        tx_pay = Transaction(
-            wallet_id=partner_wallet.id,
-            order_id=order.id,
-            amount=net_pay,
-            type="ESCROW_RELEASE",
-            description=f"Paiement reçu (Source: {trigger_source})"
-        )
-        db.add(tx_pay)
-        
         await db.commit()
-        return {"status": "Fonds libérés", "amount_paid": net_pay, "commission": escrow.commission_amount}
\ No newline at end of file
+        return {"status": "Fonds libérés", "amount_paid": net_pay, "commission": escrow.commission_amount}
+
+    @staticmethod
+    async def release_funds_batch(
+        db: AsyncSession,
+        delivered_before: datetime,
+        after_escrow_id: int = 0,
+        limit: int = 500,
+        trigger_source: str = "AUTO_RELEASE",
+        order_ids: Optional[Sequence[int]] = None
+    ) -> dict:
+        """
+        Libère en une passe ensembliste un lot d'escrows éligibles (sans commit).
+
+        - Lot verrouillé avec FOR UPDATE SKIP LOCKED (ignoré sous SQLite) :
+          plusieurs workers peuvent traiter des lots disjoints
+        - Crédits agrégés par wallet (artisans + commissions plateforme),
+          un UPDATE par wallet en executemany
+        - Escrows réclamés d'abord (UPDATE ... WHERE status = LOCKED RETURNING id),
+          comme release_funds : seuls les escrows réellement réclamés sont payés
+        - Transactions insérées en bulk, commandes mises à jour en masse
+        Pagination keyset sur l'ID d'escrow (after_escrow_id) pour garantir
+        la progression même si des escrows sont ignorés.
+        Le résumé liste les commandes libérées (order_ids).
+        """
+        _, platform_wallet_id = await LedgerService.platform_account()
+
+        query = (
+            select(
+                EscrowAccount.id,
+                EscrowAccount.order_id,
+                EscrowAccount.artisan_payout,
+                EscrowAccount.commission_amount,
+                Order.partner_id
+            )
+            .join(Order, Order.id == EscrowAccount.order_id)
+            .where(
+                EscrowAccount.status == EscrowStatus.LOCKED,
+                EscrowAccount.id > after_escrow_id,
+                Order.status.in_(RELEASABLE_STATUSES),
+                Order.delivered_at <= delivered_before
+            )
+            .order_by(EscrowAccount.id)
+            .limit(limit)
+            .with_for_update(of=EscrowAccount, skip_locked=True)
+        )
+        if order_ids is not None:
+            query = query.where(EscrowAccount.order_id.in_(order_ids))
+
+        rows = (await db.execute(query)).all()
+        summary = {"selected": len(rows), "released": 0, "amount": 0, "skipped": 0, "order_ids": [],
+                   "last_escrow_id": rows[-1].id if rows else after_escrow_id}
+        if not rows:
+            return summary
+
+        # Wallets artisans en une requête
+        partner_ids = {row.partner_id for row in rows}
+        q_wallets = await db.execute(
+            select(Wallet.id, Wallet.user_id).where(Wallet.user_id.in_(partner_ids))
+        )
+        wallet_by_partner = {w.user_id: w.id for w in q_wallets}
+
+        candidates = []
+        for row in rows:
+            if row.partner_id not in wallet_by_partner:
+                summary["skipped"] += 1
+                logger.error(f"❌ Portefeuille artisan introuvable (commande #{row.order_id}), escrow laissé LOCKED")
+                continue
+            candidates.append(row)
+
+        if not candidates:
+            return summary
+
+        now = datetime.utcnow()
+
+        # 1. Escrows -> RELEASED, seulement ceux encore LOCKED (commande toujours libérable) :
+        # FOR UPDATE est ignoré sous SQLite, une validation client (release_funds) a pu
+        # libérer un escrow du lot depuis le SELECT. Seuls les escrows réclamés ici sont payés.
+        claimed = await db.execute(
+            update(EscrowAccount)
+            .where(
+                EscrowAccount.id.in_([row.id for row in candidates]),
+                EscrowAccount.status == EscrowStatus.LOCKED,
+                EscrowAccount.order_id.in_(
+                    select(Order.id).where(Order.status.in_(RELEASABLE_STATUSES))
+                )
+            )
+            .values(status=EscrowStatus.RELEASED, released_at=now, released_by=trigger_source)
+            .returning(EscrowAccount.id)
+            .execution_options(synchronize_session=False)
+        )
+        claimed_ids = set(claimed.scalars())
+        if len(claimed_ids) < len(candidates):
+            summary["skipped"] += len(candidates) - len(claimed_ids)
+            logger.info(f"ℹ️ {len(candidates) - len(claimed_ids)} escrow(s) libéré(s) entre-temps, ignoré(s)")
+
+        released_order_ids, ledger_rows = [], []
+        for row in candidates:
+            if row.id not in claimed_ids:
+                continue
+            released_order_ids.append(row.order_id)
+            ledger_rows.append({
+                "wallet_id": wallet_by_partner[row.partner_id],
+                "order_id": row.order_id,
+                "amount": row.artisan_payout,
+                "type": "ESCROW_RELEASE",
+                "reference": f"ORD-{row.order_id}-RELEASE"
+            })
+            if row.commission_amount:
+                ledger_rows.append({
+                    "wallet_id": platform_wallet_id,
+                    "order_id": row.order_id,
+                    "amount": row.commission_amount,
+                    "type": "COMMISSION",
+                    "reference": f"ORD-{row.order_id}-COMMISSION"
+                })
+
+        if not released_order_ids:
+            return summary
+
+        # 2-3. Crédit artisans et commissions (un UPDATE par wallet, en executemany) + trace comptable
+        await LedgerService.apply_many(db, ledger_rows)
+
+        # 4. Commandes -> COMPLETED (commission recopiée depuis l'escrow)
+        await db.execute(
+            update(Order)
+            .where(Order.id.in_(released_order_ids), Order.status.in_(RELEASABLE_STATUSES))
+            .values(
+                status=OrderStatus.COMPLETED,
+                completed_at=now,
+                commission_amount=select(EscrowAccount.commission_amount)
+                .where(EscrowAccount.order_id == Order.id)
+                .scalar_subquery()
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+        summary["released"] = len(released_order_ids)
+        summary["order_ids"] = released_order_ids
+        summary["amount"] = sum(r["amount"] for r in ledger_rows if r["type"] == "ESCROW_RELEASE")
+        return summary
@@ -0,0 +1,162 @@
+"""
+LedgerService - Primitive unique de mouvement de solde
+
+Aucun solde n'est lu en Python puis réécrit : chaque mouvement est un
+UPDATE gardé (balance = balance + :delta, seulement si le résultat reste
+positif) suivi de l'écriture de la Transaction correspondante. Deux
+requêtes concurrentes sur le même wallet se sérialisent sur le verrou de
+ligne posé par l'UPDATE, sans perte de mise à jour ni solde négatif.
+
+- PostgreSQL : UPDATE ... RETURNING et INSERT dans une seule requête (CTE)
+- SQLite : deux requêtes dans la même transaction (SQLite n'accepte pas
+  d'UPDATE dans un WITH ; les écritures y sont de toute façon sérialisées)
+
+Aucune méthode ne commite : le mouvement fait partie de la transaction
+de l'appelant (changement de statut de commande, escrow...).
+
+Les commissions sont créditées au wallet d'un compte technique plateforme
+(settings.PLATFORM_ACCOUNT_PHONE) : tout mouvement a sa contrepartie et
+la somme des transactions reste égale à la somme des soldes.
+"""
+
+import logging
+from collections import defaultdict
+from typing import ClassVar, Iterable, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import bindparam, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.transaction import Transaction
+from app.models.user import User
+from app.models.wallet import Wallet
+
+logger = logging.getLogger(__name__)
+
+
+class LedgerService:
+
+    # (user_id, wallet_id) du compte plateforme, résolu une fois par worker
+    _platform: ClassVar[Optional[Tuple[int, int]]] = None
+
+    @classmethod
+    async def platform_account(cls) -> Tuple[int, int]:
+        """(user_id, wallet_id) du compte plateforme, créé au premier appel (sans connexion possible)"""
+        if cls._platform is not None:
+            return cls._platform
+
+        query = (
+            select(User.id, Wallet.id)
+            .join(Wallet, Wallet.user_id == User.id)
+            .where(User.phone == settings.PLATFORM_ACCOUNT_PHONE)
+        )
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(query)).first()
+            if row is None:
+                try:
+                    user = User(
+                        phone=settings.PLATFORM_ACCOUNT_PHONE,
+                        hashed_password="!",  # aucun hash bcrypt ne correspond
+                        full_name="KoCo (commissions)",
+                        is_active=False
+                    )
+                    db.add(user)
+                    await db.flush()
+                    db.add(Wallet(user_id=user.id, balance=0))
+                    await db.commit()
+                    logger.info(f"🏦 Compte plateforme créé (user #{user.id})")
+                except IntegrityError:
+                    # Créé en parallèle par un autre worker
+                    await db.rollback()
+                row = (await db.execute(query)).first()
+
+        cls._platform = (row[0], row[1])
+        return cls._platform
+
+    @staticmethod
+    async def apply(
+        db: AsyncSession,
+        user_id: int,
+        amount: int,
+        type: str,
+        reference: Optional[str] = None,
+        order_id: Optional[int] = None
+    ) -> Optional[int]:
+        """
+        Applique `amount` (signé) au wallet de l'utilisateur et trace la Transaction.
+        Retourne le nouveau solde, ou None si le wallet n'existe pas ou si le
+        débit rendrait le solde négatif (rien n'est alors écrit).
+        """
+        wallets = Wallet.__table__
+        transactions = Transaction.__table__
+
+        moved = (
+            update(wallets)
+            .where(wallets.c.user_id == user_id, wallets.c.balance + amount >= 0)
+            .values(balance=wallets.c.balance + amount)
+            .returning(wallets.c.id, wallets.c.balance)
+        )
+
+        if db.bind.dialect.name == "postgresql":
+            moved = moved.cte("moved")
+            traced = insert(transactions).from_select(
+                ["wallet_id", "order_id", "amount", "type", "reference"],
+                select(
+                    moved.c.id,
+                    literal(order_id, transactions.c.order_id.type),
+                    literal(amount),
+                    literal(type),
+                    literal(reference, transactions.c.reference.type)
+                )
+            ).cte("traced")
+            return (await db.execute(select(moved.c.balance).add_cte(traced))).scalar()
+
+        row = (await db.execute(moved)).first()
+        if row is None:
+            return None
+        await db.execute(insert(transactions).values(
+            wallet_id=row.id, order_id=order_id, amount=amount, type=type, reference=reference
+        ))
+        return row.balance
+
+    @staticmethod
+    async def apply_many(db: AsyncSession, entries: Iterable[dict]) -> int:
+        """
+        Crédits en bloc (libérations d'escrow...) : entrées au format Transaction
+        (wallet_id, order_id, amount, type, reference). Un UPDATE par wallet
+        (montants agrégés) en executemany, puis les Transactions en bulk insert.
+        Réservé aux crédits : un débit doit passer par apply() et sa garde.
+        """
+        entries = list(entries)
+        credits = defaultdict(int)
+        for entry in entries:
+            if entry["amount"] < 0:
+                raise ValueError("apply_many n'accepte que des crédits")
+            credits[entry["wallet_id"]] += entry["amount"]
+        if not entries:
+            return 0
+
+        wallets = Wallet.__table__
+        await db.execute(
+            update(wallets)
+            .where(wallets.c.id == bindparam("b_wallet_id"))
+            .values(balance=wallets.c.balance + bindparam("b_credit")),
+            [{"b_wallet_id": wallet_id, "b_credit": credit} for wallet_id, credit in credits.items()]
+        )
+        await db.execute(insert(Transaction), entries)
+        return sum(credits.values())
+
+    @staticmethod
+    async def reject(db: AsyncSession, user_id: int, detail: str):
+        """
+        Après un apply() refusé : annule la transaction en cours puis lève
+        l'erreur adaptée (wallet absent : 404, solde insuffisant : 400).
+        """
+        await db.rollback()
+        exists = (await db.execute(select(Wallet.id).where(Wallet.user_id == user_id))).first()
+        if exists is None:
+            raise HTTPException(status_code=404, detail="Wallet introuvable")
+        raise HTTPException(status_code=400, detail=detail)
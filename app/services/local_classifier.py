@@ -0,0 +1,201 @@
+"""
+LocalClassifier - Catégorie / tags / titre d'une commande sans appel réseau
+
+Naive Bayes multinomial sur des racines françaises (texte sans accents,
+mots vides retirés, stemmer léger), entraîné à partir des commandes déjà
+enrichies par le modèle et amorcé par une liste de mots-clés métier. Une
+prédiction coûte quelques dizaines de microsecondes : AISimplifierService
+ne sollicite le modèle distant que si la confiance est insuffisante.
+"""
+
+import logging
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from app.db.session import AsyncSessionLocal
+from app.models.order import AI_SOURCE_LOCAL, AI_SOURCE_MODEL, Order
+
+logger = logging.getLogger(__name__)
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a ai au aux avec avons avez c ce ces cet cette chez d dans de des depuis du elle elles en est et
+etre il ils j je l la le les leur leurs m ma mais me mes mon n ne nos notre nous on ont ou par pas
+plus pour qu que qui s sa se ses son sont sur t ta te tes ton tres tu un une vos votre vous y
+sous sans tout toute tous toutes fait faire encore bien aussi apres avant hier matin soir aujourd hui
+""".split())
+
+# Amorce (démarrage à froid) : mots-clés métier par catégorie
+SEED_KEYWORDS = {
+    "PLOMBERIE": "fuite eau robinet tuyau wc toilette evier lavabo douche baignoire canalisation chasse siphon chauffe bouche",
+    "ELECTRICITE": "electricite electrique courant prise disjoncteur ampoule cable interrupteur tableau lampe coupure fusible",
+    "FROID": "frigo refrigerateur congelateur climatiseur clim climatisation froid refroidit chambre gaz",
+    "MACONNERIE": "mur fissure beton ciment carrelage brique dalle crepi enduit fondation toiture",
+    "DIVERS": "meuble porte serrure peinture jardin demenagement nettoyage montage",
+}
+
+# Suffixes retirés par le stemmer léger (du plus long au plus court)
+_SUFFIXES = (
+    "issements", "issement", "atrices", "ateurs", "ations", "atrice", "ements", "ateur", "ation",
+    "ement", "euses", "iques", "ables", "ismes", "istes", "euse", "eurs", "ites", "ique", "able",
+    "isme", "iste", "ives", "eur", "ite", "ive", "ifs", "if",
+)
+
+
+def normalize_description(description: str) -> str:
+    """Minuscules, sans accents, ponctuation et espaces réduits à un espace"""
+    folded = unicodedata.normalize("NFKD", description)
+    folded = "".join(char for char in folded if not unicodedata.combining(char))
+    return _NON_ALNUM.sub(" ", folded.lower()).strip()
+
+
+def stem(word: str) -> str:
+    """Stemmer français léger (suffixes dérivationnels, pluriel, e / er final)"""
+    if len(word) > 5:
+        for suffix in _SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+                word = word[:-len(suffix)]
+                break
+    if len(word) > 4 and word.endswith("aux"):
+        word = word[:-3] + "al"
+    elif len(word) > 3 and word[-1] in "sx":
+        word = word[:-1]
+    if len(word) > 4 and word.endswith("er"):
+        word = word[:-2]
+    elif len(word) > 3 and word.endswith("e"):
+        word = word[:-1]
+    return word
+
+
+def tokenize(description: str) -> List[Tuple[str, str]]:
+    """(racine, forme sans accents) des mots porteurs de sens, dans l'ordre"""
+    return [
+        (stem(word), word)
+        for word in normalize_description(description).split()
+        if word not in STOPWORDS and len(word) > 1 and not word.isdigit()
+    ]
+
+
+class LocalClassifier:
+
+    def __init__(self, alpha: float = 0.5):
+        self.alpha = alpha
+        self.doc_counts: Counter = Counter()
+        self.token_counts: Dict[str, Counter] = defaultdict(Counter)
+        self.token_totals: Counter = Counter()
+        self.doc_freq: Counter = Counter()
+        self.trained_docs = 0
+        self._seed()
+
+    def _seed(self):
+        for category, keywords in SEED_KEYWORDS.items():
+            for keyword in keywords.split():
+                self._add([stem(keyword)], category)
+
+    def _add(self, stems: List[str], category: str):
+        self.doc_counts[category] += 1
+        self.token_counts[category].update(stems)
+        self.token_totals[category] += len(stems)
+        self.doc_freq.update(set(stems))
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self.doc_freq)
+
+    # ===== Entraînement =====
+
+    def learn(self, description: str, category: str):
+        stems = [token for token, _ in tokenize(description)]
+        if stems and category:
+            self._add(stems, category)
+            self.trained_docs += 1
+
+    async def train_from_db(self, limit: int = 20000) -> int:
+        """
+        Apprend des dernières commandes enrichies par le modèle. Les catégories
+        prédites localement (ou d'origine inconnue) sont exclues : sinon le
+        classifieur réapprendrait ses propres erreurs à chaque démarrage.
+        """
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(
+                select(Order.problem_description, Order.ai_category)
+                .where(
+                    Order.ai_category.is_not(None),
+                    Order.problem_description.is_not(None),
+                    Order.ai_source == AI_SOURCE_MODEL
+                )
+                .order_by(Order.id.desc())
+                .limit(limit)
+                .execution_options(yield_per=1000)
+            )
+            learned = 0
+            async for description, category in result:
+                self.learn(description, category)
+                learned += 1
+        logger.info(f"🧠 Classifieur local: {learned} commandes apprises ({self.vocabulary_size} racines)")
+        return learned
+
+    # ===== Prédiction =====
+
+    def predict(self, description: str) -> Tuple[Optional[str], float, List[Tuple[str, str]]]:
+        """(catégorie, probabilité a posteriori, tokens). Aucune racine connue => (None, 0.0)"""
+        tokens = tokenize(description)
+        known = [token for token, _ in tokens if token in self.doc_freq]
+        if not known:
+            return None, 0.0, tokens
+
+        total_docs = sum(self.doc_counts.values())
+        vocabulary = self.vocabulary_size
+        scores = {}
+        for category, docs in self.doc_counts.items():
+            counts = self.token_counts[category]
+            denominator = math.log(self.token_totals[category] + self.alpha * vocabulary)
+            scores[category] = math.log(docs / total_docs) + sum(
+                math.log(counts[token] + self.alpha) - denominator for token in known
+            )
+
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        confidence = 1.0 / sum(math.exp(score - top) for score in scores.values())
+        return best, confidence, tokens
+
+    def analyze(self, description: str) -> Optional[dict]:
+        """Résultat au format AISimplifierService (titre, catégorie, tags) + confiance"""
+        category, confidence, tokens = self.predict(description)
+        if category is None:
+            return None
+
+        # Mots les plus caractéristiques de la catégorie retenue pour les tags
+        # (mots inconnus en dernier) ; titre dans l'ordre du texte
+        counts = self.token_counts[category]
+        surfaces: Dict[str, str] = {}
+        for token, surface in tokens:
+            surfaces.setdefault(token, surface)
+        ranked = sorted(surfaces, key=lambda token: -counts[token] / (self.doc_freq[token] or 1))
+        title_tokens = [token for token in surfaces if token in ranked[:3]]
+        title = " ".join(surfaces[token] for token in title_tokens).capitalize()
+
+        return {
+            "title": title or "Analyse en cours",
+            "category": category,
+            "tags": ",".join(surfaces[token] for token in ranked[:4]),
+            "confidence": round(confidence, 4),
+            "source": AI_SOURCE_LOCAL,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "trained_docs": self.trained_docs,
+            "vocabulary": self.vocabulary_size,
+            "docs_per_category": dict(self.doc_counts),
+        }
+
+
+# Instance globale (entraînée au démarrage, enrichie à chaque réponse du modèle)
+local_classifier = LocalClassifier()
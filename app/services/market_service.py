@@ -1,14 +1,30 @@
-import json
+import logging
 import math
-from typing import List
+from typing import List, Optional, Tuple
+from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, tuple_
 from app.models.listing import Listing
-from app.schemas.listing import ListingCreate, ListingResponse
-from app.core.cache import CacheManager
+from app.schemas.listing import ListingCreate, ListingUpdate, ListingResponse, ListingPage
+from app.core.cache import TieredCache
+from app.core.geo_index import GeoIndex, haversine_km
+from app.core.pagination import encode_cursor, decode_cursor
+from app.db.session import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Résultats "nearby" par tuile : 5 min frais + 1 min servis en stale pendant le recalcul
+nearby_cache = TieredCache("market:nearby", ttl=300, stale_ttl=60)
 
 class MarketService:
     
+    # Cache par tuile géographique + rayon arrondi au palier supérieur
+    NEARBY_TILE_DEG = 0.01 # ~1,1 km
+    NEARBY_RADIUS_BUCKETS_KM = (1, 2, 5, 10, 20, 50)
+    # Cellules d'invalidation (tag sets) : une entrée est rattachée à toutes
+    # les cellules que couvre son cercle de recherche
+    NEARBY_TAG_CELL_DEG = 0.1 # ~11 km
+
     @staticmethod
     async def get_nearby_listings(
         db: AsyncSession, 
@@ -17,67 +33,214 @@ class MarketService:
         radius_km: float
     ) -> List[dict]:
         
-        redis = CacheManager.get_client()
-        cache_key = f"market:nearby:{round(lat, 3)}:{round(lon, 3)}:{radius_km}"
+        bucket = MarketService._radius_bucket(radius_km)
+        if bucket is None:
+            # Rayon hors paliers : pas de cache, recherche directe
+            candidates = await MarketService._search_listings(db, lat, lon, radius_km)
+        else:
+            candidates = await MarketService._get_tile_candidates(lat, lon, bucket)
         
-        cached_data = await redis.get(cache_key)
-        if cached_data:
-            return json.loads(cached_data)
+        # Filtrage précis autour du point demandé (le cache couvre toute la tuile)
+        nearby = []
+        for item in candidates:
+            dist = haversine_km(lat, lon, item["latitude"], item["longitude"])
+            if dist <= radius_km:
+                nearby.append((dist, item))
+        nearby.sort(key=lambda hit: hit[0])
         
-        # ✅ CORRECTIF : Pré-filtrage SQL (Bounding Box) pour performance
-        # 1 degré de latitude ~= 111 km. 
-        # On prend une marge large (delta) pour la requête SQL
-        delta_deg = (radius_km / 111) * 1.5 # Marge de sécurité
+        return [item for _, item in nearby]
+
+    @staticmethod
+    async def _search_listings(
+        db: AsyncSession,
+        lat: float,
+        lon: float,
+        radius_km: float
+    ) -> List[dict]:
+        # Index spatial : IDs candidats déjà triés par distance
+        hits = await GeoIndex.search(lat, lon, radius_km)
+        if not hits:
+            return []
+        
+        ids = [listing_id for listing_id, _ in hits]
+        result = await db.execute(
+            select(Listing).where(Listing.id.in_(ids), Listing.is_available == True)
+        )
+        listings_by_id = {item.id: item for item in result.scalars().all()}
         
-        lat_min, lat_max = lat - delta_deg, lat + delta_deg
-        lon_min, lon_max = lon - delta_deg, lon + delta_deg
+        nearby = []
+        for listing_id in ids:
+            item = listings_by_id.get(listing_id)
+            if item is not None:
+                schema = ListingResponse.model_validate(item)
+                nearby.append(schema.model_dump(mode='json'))
+        return nearby
 
-        query = select(Listing).where(
-            and_(
-                Listing.latitude.between(lat_min, lat_max),
-                Listing.longitude.between(lon_min, lon_max)
-            )
+    @staticmethod
+    async def _get_tile_candidates(lat: float, lon: float, bucket: int) -> List[dict]:
+        tile_lat, tile_lon = MarketService._tile(lat, lon)
+        
+        # Recherche depuis le centre de la tuile, rayon élargi de la
+        # demi-diagonale pour couvrir n'importe quel point de la tuile
+        center_lat = (tile_lat + 0.5) * MarketService.NEARBY_TILE_DEG
+        center_lon = (tile_lon + 0.5) * MarketService.NEARBY_TILE_DEG
+        search_radius = bucket + MarketService.NEARBY_TILE_DEG * 111 * 0.75
+        
+        async def load() -> List[dict]:
+            # Session dédiée : le recalcul peut finir après la requête (stale-while-revalidate)
+            async with AsyncSessionLocal() as db:
+                return await MarketService._search_listings(db, center_lat, center_lon, search_radius)
+        
+        return await nearby_cache.get_or_set(
+            f"{tile_lat}:{tile_lon}:{bucket}",
+            load,
+            tags=MarketService._tags_for_circle(center_lat, center_lon, search_radius),
         )
+
+    @staticmethod
+    async def get_listings_page(
+        db: AsyncSession,
+        cursor: Optional[str] = None,
+        limit: int = 20,
+        category: Optional[str] = None,
+        listing_type: Optional[str] = None,
+        min_price: Optional[int] = None,
+        max_price: Optional[int] = None
+    ) -> ListingPage:
+        """Fil des listings disponibles, du plus récent au plus ancien (keyset)."""
+        query = select(Listing).where(Listing.is_available == True)
         
-        result = await db.execute(query)
-        candidates = result.scalars().all()
+        if category:
+            query = query.where(Listing.category == category)
+        if listing_type:
+            query = query.where(Listing.type == listing_type)
+        if min_price is not None:
+            query = query.where(Listing.price >= min_price)
+        if max_price is not None:
+            query = query.where(Listing.price <= max_price)
         
-        nearby = []
-        for item in candidates:
-            if item.latitude and item.longitude:
-                # Calcul précis en Python (Haversine)
-                dist = MarketService._calculate_distance(lat, lon, item.latitude, item.longitude)
-                if dist <= radius_km:
-                    schema = ListingResponse.model_validate(item)
-                    data = schema.model_dump(mode='json') 
-                    nearby.append(data)
+        position = decode_cursor(cursor)
+        if position:
+            query = query.where(tuple_(Listing.created_at, Listing.id) < position)
         
-        await redis.set(cache_key, json.dumps(nearby), ex=300) # Cache 5 min
+        # limit + 1 : savoir s'il reste une page sans COUNT(*)
+        query = query.order_by(Listing.created_at.desc(), Listing.id.desc()).limit(limit + 1)
+        result = await db.execute(query)
+        items = result.scalars().all()
         
-        return nearby
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+        
+        return ListingPage(items=items, next_cursor=next_cursor)
 
     @staticmethod
     async def create_listing(db: AsyncSession, listing_in: ListingCreate, partner_id: int) -> Listing:
-        db_listing = Listing(**listing_in.model_dump(), partner_id=partner_id)
+        # Création avec contrôle des champs pour éviter les erreurs de parsing
+        db_listing = Listing(
+            title=listing_in.title,
+            description=listing_in.description or "",
+            price=listing_in.price,
+            category=listing_in.category,
+            type=listing_in.type,
+            partner_id=partner_id,
+            price_unit=listing_in.price_unit,
+            latitude=listing_in.latitude,
+            longitude=listing_in.longitude
+        )
         db.add(db_listing)
         await db.commit()
         await db.refresh(db_listing)
         
-        # Invalidation cache
-        redis = CacheManager.get_client()
-        keys = await redis.keys("market:nearby:*")
-        if keys:
-            await redis.delete(*keys)
+        await GeoIndex.sync_listing(db_listing)
+        await MarketService._invalidate_nearby_cache([(db_listing.latitude, db_listing.longitude)])
             
         return db_listing
 
+    @staticmethod
+    async def update_listing(
+        db: AsyncSession,
+        listing_id: int,
+        partner_id: int,
+        listing_in: ListingUpdate
+    ) -> Listing:
+        """Met à jour un listing (champs, position, disponibilité) et l'index spatial."""
+        listing = await db.get(Listing, listing_id)
+        if not listing:
+            raise HTTPException(status_code=404, detail="Service/Produit introuvable")
+        if listing.partner_id != partner_id:
+            raise HTTPException(status_code=403, detail="Non autorisé")
+        
+        old_point = (listing.latitude, listing.longitude)
+        for field, value in listing_in.model_dump(exclude_none=True).items():
+            setattr(listing, field, value)
+        
+        await db.commit()
+        await db.refresh(listing)
+        
+        await GeoIndex.sync_listing(listing)
+        await MarketService._invalidate_nearby_cache([old_point, (listing.latitude, listing.longitude)])
+        
+        return listing
+
+    @staticmethod
+    async def rebuild_geo_index():
+        """Reconstruit l'index spatial depuis la base (appelé au démarrage)."""
+        async with AsyncSessionLocal() as db:
+            return await GeoIndex.rebuild(db)
+
+    @staticmethod
+    async def _invalidate_nearby_cache(points: List[Tuple[Optional[float], Optional[float]]]):
+        """
+        Invalidation ciblée : seules les entrées rattachées aux cellules des
+        points modifiés sont supprimées (pas de KEYS, pas de purge globale).
+        """
+        tags = {
+            MarketService._tag(*MarketService._tag_cell(lat, lon))
+            for lat, lon in points
+            if lat is not None and lon is not None
+        }
+        if tags:
+            await nearby_cache.invalidate_tags(*tags)
+
+    @staticmethod
+    def _radius_bucket(radius_km: float) -> Optional[int]:
+        for bucket in MarketService.NEARBY_RADIUS_BUCKETS_KM:
+            if radius_km <= bucket:
+                return bucket
+        return None
+
+    @staticmethod
+    def _tile(lat: float, lon: float) -> Tuple[int, int]:
+        return (
+            math.floor(lat / MarketService.NEARBY_TILE_DEG),
+            math.floor(lon / MarketService.NEARBY_TILE_DEG),
+        )
+
+    @staticmethod
+    def _tag_cell(lat: float, lon: float) -> Tuple[int, int]:
+        return (
+            math.floor(lat / MarketService.NEARBY_TAG_CELL_DEG),
+            math.floor(lon / MarketService.NEARBY_TAG_CELL_DEG),
+        )
+
+    @staticmethod
+    def _tag(cell_lat: int, cell_lon: int) -> str:
+        return f"{cell_lat}:{cell_lon}"
+
+    @staticmethod
+    def _tags_for_circle(lat: float, lon: float, radius_km: float) -> List[str]:
+        d_lat = radius_km / 111.0
+        d_lon = radius_km / (111.0 * max(math.cos(math.radians(lat)), 0.01))
+        min_cell = MarketService._tag_cell(lat - d_lat, lon - d_lon)
+        max_cell = MarketService._tag_cell(lat + d_lat, lon + d_lon)
+        return [
+            MarketService._tag(cell_lat, cell_lon)
+            for cell_lat in range(min_cell[0], max_cell[0] + 1)
+            for cell_lon in range(min_cell[1], max_cell[1] + 1)
+        ]
+
     @staticmethod
     def _calculate_distance(lat1, lon1, lat2, lon2):
-        R = 6371 # Rayon Terre km
-        dLat = math.radians(lat2 - lat1)
-        dLon = math.radians(lon2 - lon1)
-        a = (math.sin(dLat / 2) * math.sin(dLat / 2) +
-             math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
-             math.sin(dLon / 2) * math.sin(dLon / 2))
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        return R * c
\ No newline at end of file
+        return haversine_km(lat1, lon1, lat2, lon2)
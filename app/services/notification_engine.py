@@ -0,0 +1,382 @@
+"""
+NotificationEngine - Livraison asynchrone des notifications sortantes
+
+Les appelants (jobs, endpoints) ne font que déposer les messages dans une
+file bornée : aucun aller-retour fournisseur dans leur chemin critique.
+Un pool de workers vide la file par lots, sous un débit limité par
+fournisseur (token bucket), avec retries exponentiels. Une clé de
+déduplication (Redis SET NX, repli mémoire) garantit qu'un même rappel
+n'est envoyé qu'une fois.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+import httpx
+from redis.exceptions import RedisError
+
+from app.core.cache import CacheManager, LRUCache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Notification:
+    user_id: int
+    message: str
+    kind: str
+    dedupe_key: Optional[str] = None
+    attempts: int = 0
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class ProviderError(Exception):
+    """Échec transitoire du fournisseur (timeout, 429, 5xx) : le lot sera retenté"""
+
+
+# ===== Fournisseurs =====
+
+class NotificationProvider:
+    name = "base"
+    max_batch = 1
+
+    async def send_batch(self, batch: List[Notification]):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class LogProvider(NotificationProvider):
+    """MVP : les notifications sont seulement journalisées"""
+    name = "log"
+    max_batch = 500
+
+    async def send_batch(self, batch: List[Notification]):
+        for item in batch:
+            logger.info(f"📱 [{item.kind}] Utilisateur {item.user_id}: {item.message}")
+
+
+class FakeProvider(NotificationProvider):
+    """Fournisseur local pour tests et benchmarks (latence et pannes simulées)"""
+    name = "fake"
+
+    def __init__(self, latency_ms: float = 20, failure_rate: float = 0.0, max_batch: int = 100):
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.max_batch = max_batch
+        self.sent: List[Notification] = []
+        self.calls = 0
+
+    async def send_batch(self, batch: List[Notification]):
+        self.calls += 1
+        await asyncio.sleep(self.latency_ms / 1000)
+        if random.random() < self.failure_rate:
+            raise ProviderError("Échec simulé")
+        self.sent.extend(batch)
+
+
+class HttpProvider(NotificationProvider):
+    """
+    Passerelle SMS/WhatsApp HTTP acceptant des envois par lot :
+    POST {"messages": [{"user_id", "message", "kind", "dedupe_key"}]}.
+    Un seul client httpx (pool de connexions keep-alive) partagé par les workers.
+    """
+    name = "http"
+
+    def __init__(self, url: str, token: str = "", max_batch: int = 50, timeout: float = 10.0):
+        self.url = url
+        self.max_batch = max_batch
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self._client = httpx.AsyncClient(
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=settings.NOTIFICATION_WORKERS, max_keepalive_connections=settings.NOTIFICATION_WORKERS),
+        )
+
+    async def send_batch(self, batch: List[Notification]):
+        payload = {"messages": [
+            {"user_id": item.user_id, "message": item.message, "kind": item.kind, "dedupe_key": item.dedupe_key}
+            for item in batch
+        ]}
+        try:
+            response = await self._client.post(self.url, json=payload)
+        except httpx.HTTPError as e:
+            raise ProviderError(str(e)) from e
+        if response.status_code == 429 or response.status_code >= 500:
+            raise ProviderError(f"HTTP {response.status_code}")
+        # 4xx : requête invalide, inutile de réessayer
+        response.raise_for_status()
+
+    async def close(self):
+        await self._client.aclose()
+
+
+def build_provider() -> NotificationProvider:
+    if settings.NOTIFICATION_PROVIDER == "http":
+        return HttpProvider(settings.NOTIFICATION_HTTP_URL, settings.NOTIFICATION_HTTP_TOKEN, settings.NOTIFICATION_BATCH_SIZE)
+    if settings.NOTIFICATION_PROVIDER == "fake":
+        return FakeProvider(max_batch=settings.NOTIFICATION_BATCH_SIZE)
+    return LogProvider()
+
+
+# ===== Limitation de débit =====
+
+class TokenBucket:
+    """Débit moyen `rate`/s, rafale max `capacity`. Partagé par les workers d'un fournisseur."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: int = 1):
+        # Un lot plus gros que la rafale autorisée est débité en plusieurs fois
+        async with self._lock:
+            while amount > 0:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                take = min(amount, self.capacity)
+                if self._tokens >= take:
+                    self._tokens -= take
+                    amount -= take
+                else:
+                    await asyncio.sleep((take - self._tokens) / self.rate)
+
+
+# ===== Moteur =====
+
+class NotificationEngine:
+
+    DEDUPE_PREFIX = "notif:dedupe:"
+    RETRY_BASE_DELAY = 1.0
+    RETRY_MAX_DELAY = 60.0
+    THROUGHPUT_WINDOW = 60.0
+
+    def __init__(self, provider: Optional[NotificationProvider] = None):
+        self._provider = provider
+        self._queue: Optional[asyncio.Queue] = None
+        self._bucket: Optional[TokenBucket] = None
+        self._workers: List[asyncio.Task] = []
+        self._retries: set = set()
+        self._local_dedupe = LRUCache(100_000)
+        self._sent_window: deque = deque()
+        self._lag_ms_avg = 0.0
+        self._lag_ms_max = 0.0
+        self.counters = {
+            "enqueued": 0, "sent": 0, "failed": 0, "retried": 0,
+            "deduplicated": 0, "batches": 0, "inline": 0,
+        }
+
+    @property
+    def provider(self) -> NotificationProvider:
+        if self._provider is None:
+            self._provider = build_provider()
+        return self._provider
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    # ===== Cycle de vie =====
+
+    def start(self, provider: Optional[NotificationProvider] = None):
+        if self.running:
+            return
+        if provider is not None:
+            self._provider = provider
+        self._queue = asyncio.Queue(maxsize=settings.NOTIFICATION_QUEUE_SIZE)
+        self._bucket = TokenBucket(settings.NOTIFICATION_RATE_PER_SECOND)
+        self._workers = [
+            asyncio.get_running_loop().create_task(self._worker(index))
+            for index in range(settings.NOTIFICATION_WORKERS)
+        ]
+        logger.info(
+            f"📨 NotificationEngine démarré ({self.provider.name}, {settings.NOTIFICATION_WORKERS} workers, "
+            f"{settings.NOTIFICATION_RATE_PER_SECOND}/s)"
+        )
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """Vide la file (dans la limite de drain_timeout) puis arrête les workers"""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ NotificationEngine: {self._queue.qsize()} notifications non envoyées à l'arrêt")
+        for task in [*self._workers, *self._retries]:
+            task.cancel()
+        self._workers, self._retries = [], set()
+        await self.provider.close()
+        self._provider = None
+        logger.info("🛑 NotificationEngine arrêté")
+
+    # ===== Dépôt =====
+
+    async def enqueue(self, user_id: int, message: str, kind: str, dedupe_key: Optional[str] = None):
+        await self.enqueue_many([Notification(user_id, message, kind, dedupe_key)])
+
+    async def enqueue_many(self, items: Iterable[Notification]):
+        """
+        Dépose des notifications. Celles dont la clé de déduplication a déjà
+        été vue sont ignorées. Attend si la file est pleine (backpressure).
+        Sans moteur démarré (script, job lancé à la main) : envoi direct.
+        """
+        items = await self._deduplicate(list(items))
+        if not items:
+            return
+        self.counters["enqueued"] += len(items)
+
+        if not self.running:
+            self.counters["inline"] += len(items)
+            for start in range(0, len(items), self.provider.max_batch):
+                await self._deliver(items[start:start + self.provider.max_batch])
+            return
+
+        for item in items:
+            await self._queue.put(item)
+
+    async def _deduplicate(self, items: List[Notification]) -> List[Notification]:
+        keyed = [item for item in items if item.dedupe_key]
+        if not keyed:
+            return items
+
+        fresh_keys = set()
+        try:
+            pipe = CacheManager.get_client().pipeline(transaction=False)
+            for item in keyed:
+                pipe.set(self.DEDUPE_PREFIX + item.dedupe_key, 1, nx=True, ex=settings.NOTIFICATION_DEDUPE_TTL)
+            claimed = await pipe.execute()
+            fresh_keys = {item.dedupe_key for item, ok in zip(keyed, claimed) if ok}
+        except (RedisError, OSError) as e:
+            logger.warning(f"⚠️ NotificationEngine: déduplication Redis indisponible, repli mémoire: {e}")
+            for item in keyed:
+                if self._local_dedupe.get(item.dedupe_key) is None:
+                    self._local_dedupe.set(item.dedupe_key, True)
+                    fresh_keys.add(item.dedupe_key)
+
+        result = []
+        for item in items:
+            if item.dedupe_key and item.dedupe_key not in fresh_keys:
+                self.counters["deduplicated"] += 1
+                continue
+            # Un même lot ne peut pas non plus contenir deux fois la même clé
+            fresh_keys.discard(item.dedupe_key)
+            result.append(item)
+        return result
+
+    async def _release_dedupe(self, items: List[Notification]):
+        """Échec définitif : la clé est libérée pour qu'un envoi ultérieur reste possible"""
+        keys = [item.dedupe_key for item in items if item.dedupe_key]
+        if not keys:
+            return
+        for key in keys:
+            self._local_dedupe.delete(key)
+        try:
+            await CacheManager.get_client().delete(*[self.DEDUPE_PREFIX + key for key in keys])
+        except (RedisError, OSError):
+            pass
+
+    # ===== Livraison =====
+
+    async def _worker(self, index: int):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.provider.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                await self._bucket.acquire(len(batch))
+                await self._deliver(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ NotificationEngine worker {index}: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _deliver(self, batch: List[Notification]):
+        try:
+            await self.provider.send_batch(batch)
+        except ProviderError as e:
+            self._schedule_retry(batch, e)
+            return
+        except Exception as e:
+            self.counters["failed"] += len(batch)
+            await self._release_dedupe(batch)
+            logger.error(f"❌ NotificationEngine: lot de {len(batch)} rejeté par {self.provider.name}: {e}")
+            return
+
+        now = time.monotonic()
+        self.counters["sent"] += len(batch)
+        self.counters["batches"] += 1
+        self._sent_window.append((now, len(batch)))
+        for item in batch:
+            lag_ms = (now - item.enqueued_at) * 1000
+            self._lag_ms_avg = lag_ms if not self._lag_ms_avg else 0.9 * self._lag_ms_avg + 0.1 * lag_ms
+            self._lag_ms_max = max(self._lag_ms_max, lag_ms)
+
+    def _schedule_retry(self, batch: List[Notification], error: Exception):
+        retryable = []
+        for item in batch:
+            item.attempts += 1
+            if item.attempts > settings.NOTIFICATION_MAX_RETRIES:
+                self.counters["failed"] += 1
+                asyncio.get_running_loop().create_task(self._release_dedupe([item]))
+                logger.error(f"❌ Notification abandonnée ({item.kind}, user #{item.user_id}) après {item.attempts} essais: {error}")
+            else:
+                retryable.append(item)
+        if not retryable:
+            return
+
+        self.counters["retried"] += len(retryable)
+        attempts = max(item.attempts for item in retryable)
+        delay = min(self.RETRY_BASE_DELAY * 2 ** (attempts - 1), self.RETRY_MAX_DELAY)
+        delay *= random.uniform(0.5, 1.5)
+        logger.warning(f"⚠️ {self.provider.name}: {len(retryable)} notifications retentées dans {delay:.1f}s ({error})")
+
+        async def requeue():
+            await asyncio.sleep(delay)
+            if self.running:
+                for item in retryable:
+                    await self._queue.put(item)
+            else:
+                await self._deliver(retryable)
+
+        task = asyncio.get_running_loop().create_task(requeue())
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    # ===== Observabilité =====
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        while self._sent_window and self._sent_window[0][0] < now - self.THROUGHPUT_WINDOW:
+            self._sent_window.popleft()
+        sent_recently = sum(count for _, count in self._sent_window)
+        return {
+            "provider": self.provider.name,
+            "running": self.running,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "pending_retries": len(self._retries),
+            "sent_per_second": round(sent_recently / self.THROUGHPUT_WINDOW, 2),
+            "lag_ms_avg": round(self._lag_ms_avg, 1),
+            "lag_ms_max": round(self._lag_ms_max, 1),
+            **self.counters,
+        }
+
+
+# Instance globale (démarrée dans le lifespan de l'application)
+notification_engine = NotificationEngine()
@@ -1,14 +1,26 @@
 """
 NotificationService - Envoyer des notifications SMS/WhatsApp
 
-Pour l'MVP: Simple logging (prêt pour Twilio/AWS SNS plus tard)
+Les messages sont déposés dans le NotificationEngine (file + workers) :
+l'appelant n'attend jamais le fournisseur. Fournisseur configuré par
+NOTIFICATION_PROVIDER (journalisation seule par défaut).
 """
 
 import logging
+from typing import Iterable, Tuple
+
+from app.services.notification_engine import Notification, notification_engine
 
 logger = logging.getLogger(__name__)
 
 
+REMINDER_MESSAGES = {
+    "REMINDER_1": "🔔 Travaux terminés pour la commande #{order_id}. Merci de valider.",
+    "REMINDER_2": "🔔🔔 Commande #{order_id} toujours en attente de votre validation.",
+    "REMINDER_FINAL": "🔔🔔🔔 Dernier rappel : sans réponse, les fonds de la commande #{order_id} seront libérés automatiquement.",
+}
+
+
 class NotificationService:
     """Service centralisé pour toutes les notifications"""
     
@@ -22,12 +34,28 @@ class NotificationService:
             message: Contenu du message
             reminder_type: Type ('REMINDER_1', 'REMINDER_2', 'REMINDER_FINAL')
         
-        TODO: Intégrer avec provider SMS:
-            - Twilio
-            - AWS SNS
-            - Vonage
         """
-        logger.info(f"📱 [{reminder_type}] Utilisateur {user_id}: {message}")
+        await notification_engine.enqueue(user_id, message, reminder_type)
+    
+    @staticmethod
+    async def send_reminders_batch(recipients: Iterable[Tuple[int, int]], reminder_type: str):
+        """
+        Envoyer un lot de rappels de validation
+
+        Args:
+            recipients: couples (order_id, user_id) retournés par l'escalade
+            reminder_type: Type ('REMINDER_1', 'REMINDER_2', 'REMINDER_FINAL')
+        """
+        # Clé de déduplication : un rappel donné n'est jamais envoyé deux fois
+        await notification_engine.enqueue_many(
+            Notification(
+                user_id,
+                REMINDER_MESSAGES[reminder_type].format(order_id=order_id),
+                reminder_type,
+                dedupe_key=f"{reminder_type}:{order_id}"
+            )
+            for order_id, user_id in recipients
+        )
     
     @staticmethod
     async def send_payment_notification(user_id: int, amount: int, order_id: int, currency: str = "FCFA"):
@@ -35,7 +63,7 @@ class NotificationService:
         Notifier qu'un paiement a été reçu et bloqué en escrow
         """
         message = f"💳 {amount} {currency} bloqués pour commande #{order_id}"
-        logger.info(f"📱 Utilisateur {user_id}: {message}")
+        await notification_engine.enqueue(user_id, message, "PAYMENT")
     
     @staticmethod
     async def send_completion_notification(user_id: int, amount: int, order_id: int, currency: str = "FCFA"):
@@ -43,7 +71,7 @@ class NotificationService:
         Notifier que les fonds ont été débloqués et transférés
         """
         message = f"✅ {amount} {currency} crédités (commande #{order_id} complétée)"
-        logger.info(f"📱 Utilisateur {user_id}: {message}")
+        await notification_engine.enqueue(user_id, message, "COMPLETION")
     
     @staticmethod
     async def send_dispute_notification(user_id: int, order_id: int, reason: str):
@@ -51,7 +79,7 @@ class NotificationService:
         Notifier qu'un litige a été soulevé
         """
         message = f"🚨 Litige sur commande #{order_id}: {reason}"
-        logger.info(f"📱 Utilisateur {user_id}: {message}")
+        await notification_engine.enqueue(user_id, message, "DISPUTE")
     
     @staticmethod
     async def send_refund_notification(user_id: int, amount: int, order_id: int, currency: str = "FCFA"):
@@ -59,7 +87,7 @@ class NotificationService:
         Notifier d'un remboursement
         """
         message = f"💰 {amount} {currency} remboursés (commande #{order_id})"
-        logger.info(f"📱 Utilisateur {user_id}: {message}")
+        await notification_engine.enqueue(user_id, message, "REFUND")
     
     @staticmethod
     async def send_excessive_balance_warning(user_id: int, amount: int, currency: str = "FCFA"):
@@ -68,4 +96,4 @@ class NotificationService:
         Encourager le retrait pour conformité légale.
         """
         message = f"⚠️  Vous avez {amount} {currency} disponibles. Veuillez retirer (compliance BEAC)"
-        logger.info(f"📱 Utilisateur {user_id}: {message}")
\ No newline at end of file
+        await notification_engine.enqueue(user_id, message, "BALANCE_WARNING")
\ No newline at end of file
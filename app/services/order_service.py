@@ -1,8 +1,11 @@
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from typing import Optional
+from sqlalchemy import select, tuple_, union_all
 from app.models.order import Order, OrderStatus
 from app.models.listing import Listing
+from app.schemas.order import OrderPage
+from app.core.pagination import encode_cursor, decode_cursor
 
 class OrderService:
     
@@ -33,11 +36,47 @@ class OrderService:
         return new_order
     
     @staticmethod
-    async def get_user_orders(db: AsyncSession, user_id: int) -> list[Order]:
-        """Récupère toutes les commandes d'un utilisateur (client ou artisan)"""
-        query = select(Order).where(
-            (Order.client_id == user_id) | (Order.partner_id == user_id)
-        ).order_by(Order.created_at.desc())
+    async def get_user_orders(
+        db: AsyncSession,
+        user_id: int,
+        cursor: Optional[str] = None,
+        limit: int = 20,
+        status: Optional[OrderStatus] = None
+    ) -> OrderPage:
+        """
+        Récupère les commandes d'un utilisateur (client ou artisan), page par page.
         
+        Au lieu d'un `client_id = X OR partner_id = X` (qui force un scan),
+        chaque rôle est une jambe servie par son index (role_id, created_at, id),
+        limitée à la taille de page, puis les deux jambes sont fusionnées.
+        """
+        position = decode_cursor(cursor)
+        
+        def leg(*conditions):
+            query = select(Order.id).where(*conditions)
+            if status:
+                query = query.where(Order.status == status)
+            if position:
+                query = query.where(tuple_(Order.created_at, Order.id) < position)
+            return query.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit + 1).subquery()
+        
+        as_client = leg(Order.client_id == user_id)
+        # Exclut les commandes où l'utilisateur est aussi client (déjà dans l'autre jambe)
+        as_partner = leg(Order.partner_id == user_id, Order.client_id != user_id)
+        page_ids = union_all(select(as_client.c.id), select(as_partner.c.id)).subquery()
+        
+        query = (
+            select(Order)
+            .join(page_ids, Order.id == page_ids.c.id)
+            .order_by(Order.created_at.desc(), Order.id.desc())
+            .limit(limit + 1)
+        )
         result = await db.execute(query)
-        return result.scalars().all()
\ No newline at end of file
+        items = result.scalars().all()
+        
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+        
+        return OrderPage(items=items, next_cursor=next_cursor)
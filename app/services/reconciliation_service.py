@@ -0,0 +1,133 @@
+"""
+ReconciliationService - Vérification incrémentale wallets / grand livre
+
+Invariant : wallets.balance == dernier point de contrôle + somme des
+transactions postérieures. Chaque lot de wallets est vérifié en une
+requête (instantané cohérent : solde et transactions sont écrits dans
+la même transaction par LedgerService), puis un nouveau point est posé
+pour les wallets cohérents ayant bougé. Un wallet incohérent n'avance
+pas : il reste signalé à chaque passage jusqu'à correction.
+
+Sûreté des points : LedgerService verrouille la ligne du wallet avant
+d'insérer la transaction, donc pour un même wallet l'ordre des IDs de
+transaction est l'ordre de commit. Tout ID inférieur au dernier visible
+est déjà commité : aucun point ne peut sauter une transaction en cours.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import and_, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.transaction import Transaction
+from app.models.wallet import Wallet
+from app.models.wallet_checkpoint import WalletCheckpoint
+
+MAX_REPORTED_MISMATCHES = 100  # par lot
+
+
+class ReconciliationService:
+
+    @staticmethod
+    async def reconcile_batch(db: AsyncSession, after_wallet_id: int = 0, limit: int = 1000) -> dict:
+        """
+        Vérifie les `limit` wallets suivant after_wallet_id (pagination keyset)
+        et pose les nouveaux points de contrôle (sans commit).
+        """
+        wallets = (
+            select(Wallet.id, Wallet.balance)
+            .where(Wallet.id > after_wallet_id)
+            .order_by(Wallet.id)
+            .limit(limit)
+            .subquery()
+        )
+        latest = (
+            select(WalletCheckpoint.wallet_id, func.max(WalletCheckpoint.last_transaction_id).label("last_id"))
+            .where(WalletCheckpoint.wallet_id.in_(select(wallets.c.id)))
+            .group_by(WalletCheckpoint.wallet_id)
+            .subquery()
+        )
+        checkpoint = WalletCheckpoint.__table__.alias("checkpoint")
+        transactions = Transaction.__table__
+        since = func.coalesce(checkpoint.c.last_transaction_id, 0)
+
+        query = (
+            select(
+                wallets.c.id,
+                wallets.c.balance,
+                func.coalesce(checkpoint.c.balance, 0).label("base"),
+                since.label("since"),
+                checkpoint.c.last_transaction_at.label("since_at"),
+                func.coalesce(func.sum(transactions.c.amount), 0).label("delta"),
+                func.max(transactions.c.id).label("last_id"),
+                func.max(transactions.c.created_at).label("last_at"),
+            )
+            .select_from(wallets)
+            .outerjoin(latest, latest.c.wallet_id == wallets.c.id)
+            .outerjoin(checkpoint, and_(
+                checkpoint.c.wallet_id == wallets.c.id,
+                checkpoint.c.last_transaction_id == latest.c.last_id
+            ))
+            .outerjoin(transactions, and_(
+                transactions.c.wallet_id == wallets.c.id,
+                transactions.c.id > since
+            ))
+            .group_by(
+                wallets.c.id, wallets.c.balance,
+                checkpoint.c.balance, checkpoint.c.last_transaction_id, checkpoint.c.last_transaction_at
+            )
+            .order_by(wallets.c.id)
+        )
+        rows = (await db.execute(query)).all()
+
+        summary = {"checked": len(rows), "checkpointed": 0, "mismatches": [],
+                   "last_wallet_id": rows[-1].id if rows else after_wallet_id}
+        checkpoints = []
+        for row in rows:
+            expected = row.base + row.delta
+            if (row.balance or 0) != expected:
+                if len(summary["mismatches"]) < MAX_REPORTED_MISMATCHES:
+                    summary["mismatches"].append({
+                        "wallet_id": row.id,
+                        "balance": row.balance,
+                        "ledger": expected,
+                        "since_transaction_id": row.since
+                    })
+                continue
+            if row.last_id is not None:
+                checkpoints.append({
+                    "wallet_id": row.id,
+                    "balance": expected,
+                    "last_transaction_id": row.last_id,
+                    # Couvre aussi les transactions du point précédent
+                    "last_transaction_at": max(row.last_at, row.since_at or row.last_at)
+                })
+
+        if checkpoints:
+            await db.execute(insert(WalletCheckpoint), checkpoints)
+        summary["checkpointed"] = len(checkpoints)
+        return summary
+
+    @staticmethod
+    async def balance_as_of(db: AsyncSession, wallet_id: int, at: datetime) -> int:
+        """
+        Solde du wallet d'après les transactions enregistrées jusqu'à `at` :
+        dernier point de contrôle entièrement antérieur + transactions suivantes.
+        """
+        checkpoint = (await db.execute(
+            select(WalletCheckpoint.balance, WalletCheckpoint.last_transaction_id)
+            .where(WalletCheckpoint.wallet_id == wallet_id, WalletCheckpoint.last_transaction_at <= at)
+            .order_by(WalletCheckpoint.last_transaction_id.desc())
+            .limit(1)
+        )).first()
+        base, since = (checkpoint.balance, checkpoint.last_transaction_id) if checkpoint else (0, 0)
+
+        delta = await db.scalar(
+            select(func.coalesce(func.sum(Transaction.amount), 0))
+            .where(
+                Transaction.wallet_id == wallet_id,
+                Transaction.id > since,
+                Transaction.created_at <= at
+            )
+        )
+        return base + delta
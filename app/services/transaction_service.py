@@ -0,0 +1,128 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Optional
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, tuple_
+from app.models.transaction import Transaction
+from app.models.wallet import Wallet
+from app.schemas.transaction import TransactionPage
+from app.core.pagination import encode_cursor, decode_cursor
+from app.db.session import ReplicaRouter
+
+EXPORT_COLUMNS = ["id", "created_at", "type", "amount", "status", "order_id", "reference"]
+
+class TransactionService:
+
+    EXPORT_BATCH_SIZE = 500
+
+    @staticmethod
+    async def get_wallet_id(db: AsyncSession, user_id: int) -> int:
+        """Résout l'ID du wallet sans charger l'utilisateur ni le wallet complet"""
+        result = await db.execute(select(Wallet.id).where(Wallet.user_id == user_id))
+        wallet_id = result.scalar()
+        if wallet_id is None:
+            raise HTTPException(status_code=404, detail="Wallet introuvable")
+        return wallet_id
+
+    @staticmethod
+    def _filtered(
+        query,
+        wallet_id: int,
+        tx_type: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        order_id: Optional[int] = None
+    ):
+        query = query.where(Transaction.wallet_id == wallet_id)
+        if tx_type:
+            query = query.where(Transaction.type == tx_type)
+        if date_from:
+            query = query.where(Transaction.created_at >= date_from)
+        if date_to:
+            query = query.where(Transaction.created_at < date_to)
+        if order_id is not None:
+            query = query.where(Transaction.order_id == order_id)
+        return query
+
+    @staticmethod
+    async def get_history(
+        db: AsyncSession,
+        wallet_id: int,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+        tx_type: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        order_id: Optional[int] = None
+    ) -> TransactionPage:
+        """Historique filtré, du plus récent au plus ancien (keyset sur created_at, id)"""
+        query = TransactionService._filtered(
+            select(Transaction), wallet_id, tx_type, date_from, date_to, order_id
+        )
+        position = decode_cursor(cursor)
+        if position:
+            query = query.where(tuple_(Transaction.created_at, Transaction.id) < position)
+        query = query.order_by(Transaction.created_at.desc(), Transaction.id.desc()).limit(limit + 1)
+
+        result = await db.execute(query)
+        items = result.scalars().all()
+
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+
+        return TransactionPage(items=items, next_cursor=next_cursor)
+
+    @staticmethod
+    async def stream_export(
+        wallet_id: int,
+        export_format: str = "ndjson",
+        tx_type: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        order_id: Optional[int] = None,
+        user_id: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """
+        Export du grand livre en NDJSON ou CSV, à mémoire constante.
+
+        Curseur côté serveur (yield_per) + lignes brutes (pas d'objets ORM),
+        émises par lots. Ouvre sa propre session de lecture (réplica si
+        disponible) : le générateur est consommé pendant l'envoi de la réponse.
+        """
+        query = TransactionService._filtered(
+            select(*[getattr(Transaction, column) for column in EXPORT_COLUMNS]),
+            wallet_id, tx_type, date_from, date_to, order_id
+        ).order_by(Transaction.created_at, Transaction.id)
+        query = query.execution_options(yield_per=TransactionService.EXPORT_BATCH_SIZE)
+
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_COLUMNS)
+            yield buffer.getvalue()
+
+        async with await ReplicaRouter.read_session(user_id) as db:
+            result = await db.stream(query)
+            async for rows in result.partitions():
+                if export_format == "csv":
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    for row in rows:
+                        writer.writerow([
+                            row.created_at.isoformat() if column == "created_at" else getattr(row, column)
+                            for column in EXPORT_COLUMNS
+                        ])
+                    yield buffer.getvalue()
+                else:
+                    yield "".join(
+                        json.dumps({
+                            column: row.created_at.isoformat() if column == "created_at" else getattr(row, column)
+                            for column in EXPORT_COLUMNS
+                        }) + "\n"
+                        for row in rows
+                    )
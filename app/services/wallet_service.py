@@ -1,8 +1,10 @@
+from datetime import datetime
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.models.wallet import Wallet
-from app.models.transaction import Transaction
+from app.services.ledger_service import LedgerService
+from app.services.reconciliation_service import ReconciliationService
 
 class WalletService:
     
@@ -17,46 +19,35 @@ class WalletService:
             
         return wallet
     
+    @staticmethod
+    async def balance_as_of(db: AsyncSession, user_id: int, at: datetime) -> dict:
+        """Solde du wallet à une date passée (d'après le grand livre)"""
+        wallet = await WalletService.get_balance(db, user_id)
+        balance = await ReconciliationService.balance_as_of(db, wallet.id, at)
+        return {"balance": balance, "currency": wallet.currency, "as_of": at}
+
     @staticmethod
     async def deposit(db: AsyncSession, user_id: int, amount: int) -> dict:
         """Dépose de l'argent sur le wallet (simulation pour MVP)"""
-        wallet = await WalletService.get_balance(db, user_id)
-        
-        # Crédit du wallet
-        wallet.balance += amount
-        
-        # Trace comptable
-        tx = Transaction(
-            wallet_id=wallet.id,
-            amount=amount,
-            type="DEPOSIT",
-            reference=f"DEP-{user_id}"
+        # Crédit du wallet + trace comptable (mouvement atomique)
+        new_balance = await LedgerService.apply(
+            db, user_id, amount, type="DEPOSIT", reference=f"DEP-{user_id}"
         )
-        db.add(tx)
-        
+        if new_balance is None:
+            await LedgerService.reject(db, user_id, "Dépôt impossible")
+
         await db.commit()
-        return {"status": "Dépôt réussi", "new_balance": wallet.balance}
+        return {"status": "Dépôt réussi", "new_balance": new_balance}
     
     @staticmethod
     async def withdraw(db: AsyncSession, user_id: int, amount: int) -> dict:
         """Retrait d'argent du wallet"""
-        wallet = await WalletService.get_balance(db, user_id)
-        
-        # Vérification solde
-        if wallet.balance < amount:
-            raise HTTPException(status_code=400, detail="Solde insuffisant")
-        
-        # Débit du wallet
-        wallet.balance -= amount
-        
-        # Trace comptable
-        tx = Transaction(
-            wallet_id=wallet.id,
-            amount=-amount,
-            type="WITHDRAWAL", 
-            reference=f"WITH-{user_id}"
+        # Débit gardé : refusé si le solde deviendrait négatif
+        new_balance = await LedgerService.apply(
+            db, user_id, -amount, type="WITHDRAWAL", reference=f"WITH-{user_id}"
         )
-        db.add(tx)
-        
+        if new_balance is None:
+            await LedgerService.reject(db, user_id, "Solde insuffisant")
+
         await db.commit()
-        return {"status": "Retrait réussi", "new_balance": wallet.balance}
\ No newline at end of file
+        return {"status": "Retrait réussi", "new_balance": new_balance}
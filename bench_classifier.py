@@ -0,0 +1,172 @@
+"""
+Benchmark du classifieur local (LocalClassifier) contre les catégories du modèle.
+
+Usage:
+    python bench_classifier.py              # commandes enrichies par le modèle en base (sinon échantillon intégré)
+    python bench_classifier.py --gemini 10  # + latence / accord de 10 appels Gemini réels
+
+Découpe 80/20 (graine fixe), entraîne sur 80 %, mesure sur 20 % :
+accord avec la catégorie de référence, couverture par seuil de confiance
+(part des commandes qui ne passeraient plus par le modèle) et latence.
+Seules les catégories produites par le modèle servent de référence : celles
+du classifieur local gonfleraient l'accord mesuré.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+# Ajouter le chemin du projet
+sys.path.append(os.path.dirname(__file__))
+
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError
+
+import app.db.base  # noqa: F401 (enregistre tous les modèles)
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal, engine, is_sqlite
+from app.models.order import AI_SOURCE_MODEL, Order
+from app.services.local_classifier import LocalClassifier
+
+THRESHOLDS = (0.5, 0.7, 0.8, 0.9, 0.95, 0.99)
+
+# Échantillon de secours (base vide) : descriptions réalistes étiquetées à la main
+SAMPLE = [
+    ("Mon évier fuit depuis ce matin, eau partout dans la cuisine", "PLOMBERIE"),
+    ("Fuite d'eau sous le lavabo de la salle de bain", "PLOMBERIE"),
+    ("La chasse d'eau des WC coule sans arrêt", "PLOMBERIE"),
+    ("Robinet cassé, impossible de le fermer", "PLOMBERIE"),
+    ("Canalisation bouchée, l'eau ne s'évacue plus", "PLOMBERIE"),
+    ("Le chauffe-eau ne chauffe plus du tout", "PLOMBERIE"),
+    ("Tuyau percé derrière la machine à laver", "PLOMBERIE"),
+    ("Douche qui goutte et pression très faible", "PLOMBERIE"),
+    ("Toilettes bouchées depuis hier soir", "PLOMBERIE"),
+    ("Fuite au niveau du compteur d'eau", "PLOMBERIE"),
+    ("Plus de courant dans toute la maison", "ELECTRICITE"),
+    ("Le disjoncteur saute dès que j'allume le four", "ELECTRICITE"),
+    ("Prise électrique qui fait des étincelles", "ELECTRICITE"),
+    ("Installer des ampoules et un interrupteur au salon", "ELECTRICITE"),
+    ("Câble arraché au plafond de la chambre", "ELECTRICITE"),
+    ("Coupure de courant dans la cuisine uniquement", "ELECTRICITE"),
+    ("Tableau électrique à remplacer, fusibles grillés", "ELECTRICITE"),
+    ("Lampe du couloir ne s'allume plus, problème électrique", "ELECTRICITE"),
+    ("Brancher un nouveau compteur électrique", "ELECTRICITE"),
+    ("Panne d'électricité après l'orage", "ELECTRICITE"),
+    ("Le frigo ne refroidit plus", "FROID"),
+    ("Climatiseur en panne, il souffle de l'air chaud", "FROID"),
+    ("Congélateur qui fait du givre et un bruit fort", "FROID"),
+    ("Recharge de gaz pour la clim du bureau", "FROID"),
+    ("Chambre froide du restaurant à réparer", "FROID"),
+    ("Réfrigérateur qui coule et ne fait plus de froid", "FROID"),
+    ("Entretien de la climatisation avant la saison chaude", "FROID"),
+    ("Clim qui goutte à l'intérieur de la pièce", "FROID"),
+    ("Fissure importante sur le mur de la façade", "MACONNERIE"),
+    ("Construire un petit mur de clôture en briques", "MACONNERIE"),
+    ("Carrelage décollé dans la salle de séjour", "MACONNERIE"),
+    ("Dalle en béton à couler pour la terrasse", "MACONNERIE"),
+    ("Refaire le crépi de la maison", "MACONNERIE"),
+    ("Toiture qui laisse passer la pluie, fissures dans le ciment", "MACONNERIE"),
+    ("Enduit qui s'effrite sur les murs de la chambre", "MACONNERIE"),
+    ("Monter une armoire et deux meubles de cuisine", "DIVERS"),
+    ("Changer la serrure de la porte d'entrée", "DIVERS"),
+    ("Peinture complète d'un appartement de trois pièces", "DIVERS"),
+    ("Aide pour un déménagement samedi", "DIVERS"),
+    ("Nettoyage du jardin et taille des arbres", "DIVERS"),
+]
+
+
+async def load_dataset(minimum: int = 50):
+    # Base SQLite absente (checkout neuf) : ne pas la créer juste pour constater qu'elle est vide
+    database = engine.url.database
+    if is_sqlite and database and database != ":memory:" and not os.path.exists(database):
+        return SAMPLE, f"échantillon intégré (base {database} absente)"
+    try:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Order.problem_description, Order.ai_category)
+                .where(
+                    Order.ai_category.is_not(None),
+                    Order.problem_description.is_not(None),
+                    Order.ai_source == AI_SOURCE_MODEL
+                )
+            )
+            rows = [(description, category) for description, category in result.all()]
+    except DBAPIError as e:
+        # Tables non créées ou schéma antérieur à ai_source
+        return SAMPLE, f"échantillon intégré (base non initialisée : {e.orig})"
+    finally:
+        await engine.dispose()
+    if len(rows) >= minimum:
+        return rows, "base (commandes enrichies par le modèle)"
+    return SAMPLE, f"échantillon intégré ({len(rows)} commandes enrichies par le modèle en base, minimum {minimum})"
+
+
+def percentile(values, ratio):
+    values = sorted(values)
+    return values[min(int(len(values) * ratio), len(values) - 1)]
+
+
+async def bench_gemini(samples):
+    from app.services.ai_simplifier import GeminiProvider
+
+    if not settings.GEMINI_API_KEY:
+        print("⚠️  GEMINI_API_KEY non définie : latence modèle non mesurée")
+        return
+    provider = GeminiProvider(settings.GEMINI_API_KEY)
+    latencies, agree = [], 0
+    for description, expected in samples:
+        started = time.perf_counter()
+        result = await provider.analyze_batch({"0": description})
+        latencies.append((time.perf_counter() - started) * 1000)
+        agree += result.get("0", {}).get("category") == expected
+    print(f"\n🧠 Gemini ({len(samples)} appels unitaires)")
+    print(f"   latence p50 {statistics.median(latencies):.0f} ms, p95 {percentile(latencies, 0.95):.0f} ms")
+    print(f"   accord avec la référence: {agree / len(samples):.1%}")
+
+
+async def main(gemini_calls: int):
+    rows, source = await load_dataset()
+    random.Random(42).shuffle(rows)
+    split = max(int(len(rows) * 0.8), 1)
+    train, test = rows[:split], rows[split:] or rows[:1]
+
+    classifier = LocalClassifier()
+    started = time.perf_counter()
+    for description, category in train:
+        classifier.learn(description, category)
+    train_ms = (time.perf_counter() - started) * 1000
+
+    predictions, latencies_us = [], []
+    for description, expected in test:
+        started = time.perf_counter_ns()
+        result = classifier.analyze(description)
+        latencies_us.append((time.perf_counter_ns() - started) / 1000)
+        predictions.append((result, expected))
+
+    print(f"📊 Source: {source}")
+    print(f"   entraînement: {len(train)} descriptions en {train_ms:.1f} ms, test: {len(test)}")
+    print(f"   latence analyse p50 {statistics.median(latencies_us):.0f} µs, p99 {percentile(latencies_us, 0.99):.0f} µs")
+
+    agree = sum(1 for result, expected in predictions if result and result["category"] == expected)
+    print(f"   accord global (sans seuil): {agree / len(test):.1%}")
+
+    print("\n   seuil   couverture   accord sur la part couverte")
+    for threshold in THRESHOLDS:
+        covered = [(r, e) for r, e in predictions if r and r["confidence"] >= threshold]
+        agreement = sum(1 for r, e in covered if r["category"] == e) / len(covered) if covered else 0.0
+        marker = "  <- AI_LOCAL_MIN_CONFIDENCE" if threshold == settings.AI_LOCAL_MIN_CONFIDENCE else ""
+        print(f"   {threshold:<7} {len(covered) / len(test):>9.1%}   {agreement:>8.1%}{marker}")
+
+    if gemini_calls:
+        await bench_gemini(test[:gemini_calls])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gemini", type=int, default=0, help="nombre d'appels Gemini à mesurer")
+    args = parser.parse_args()
+    asyncio.run(main(args.gemini))
@@ -0,0 +1,140 @@
+"""
+Benchmark de contention sur un seul wallet (LedgerService).
+
+Usage:
+    python bench_ledger.py                       # 2000 opérations, 50 en parallèle
+    python bench_ledger.py --ops 5000 --concurrency 100 --legacy
+
+Lance des dépôts et retraits concurrents (une session par opération) sur le
+même wallet, puis vérifie :
+- solde final == solde initial + somme des transactions tracées
+- solde jamais négatif (rejeu des transactions dans l'ordre d'écriture)
+--legacy rejoue le même scénario avec l'ancien schéma lecture / calcul
+Python / commit pour comparer (mises à jour perdues attendues).
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+# Ajouter le chemin du projet
+sys.path.append(os.path.dirname(__file__))
+
+from fastapi import HTTPException
+from sqlalchemy import func, select
+
+import app.db.base  # noqa: F401 (enregistre tous les modèles)
+from app.db.session import AsyncSessionLocal, engine
+from app.main import create_tables
+from app.models.transaction import Transaction
+from app.models.user import User
+from app.models.wallet import Wallet
+from app.services.wallet_service import WalletService
+
+INITIAL_BALANCE = 10_000
+
+
+async def create_wallet() -> int:
+    async with AsyncSessionLocal() as db:
+        user = User(phone=f"bench-ledger-{time.time_ns()}", hashed_password="x", full_name="Bench Ledger")
+        db.add(user)
+        await db.flush()
+        db.add(Wallet(user_id=user.id, balance=INITIAL_BALANCE))
+        await db.commit()
+        return user.id
+
+
+async def legacy_move(db, user_id: int, amount: int):
+    """Ancien schéma : solde lu en Python, modifié puis réécrit"""
+    wallet = await WalletService.get_balance(db, user_id)
+    if wallet.balance + amount < 0:
+        raise HTTPException(status_code=400, detail="Solde insuffisant")
+    wallet.balance += amount
+    db.add(Transaction(wallet_id=wallet.id, amount=amount, type="BENCH", reference=f"BENCH-{user_id}"))
+    await db.commit()
+
+
+async def run(user_id: int, ops: int, concurrency: int, legacy: bool) -> dict:
+    rng = random.Random(42)
+    amounts = [rng.choice((1, -1)) * rng.randint(100, 2000) for _ in range(ops)]
+    semaphore = asyncio.Semaphore(concurrency)
+    outcome = {"applied": 0, "rejected": 0, "errors": 0}
+    latencies = []
+
+    async def one(amount: int):
+        async with semaphore, AsyncSessionLocal() as db:
+            started = time.perf_counter()
+            try:
+                if legacy:
+                    await legacy_move(db, user_id, amount)
+                elif amount > 0:
+                    await WalletService.deposit(db, user_id, amount)
+                else:
+                    await WalletService.withdraw(db, user_id, -amount)
+                outcome["applied"] += 1
+            except HTTPException:
+                outcome["rejected"] += 1
+            except Exception:
+                await db.rollback()
+                outcome["errors"] += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(amount) for amount in amounts))
+    outcome["elapsed"] = time.perf_counter() - started
+    outcome["p50_ms"] = statistics.median(latencies)
+    outcome["p99_ms"] = sorted(latencies)[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+    return outcome
+
+
+async def verify(user_id: int) -> dict:
+    async with AsyncSessionLocal() as db:
+        wallet = await WalletService.get_balance(db, user_id)
+        amounts = (await db.execute(
+            select(Transaction.amount).where(Transaction.wallet_id == wallet.id).order_by(Transaction.id)
+        )).scalars().all()
+        count = await db.scalar(select(func.count()).select_from(Transaction).where(Transaction.wallet_id == wallet.id))
+
+    running, lowest = INITIAL_BALANCE, INITIAL_BALANCE
+    for amount in amounts:
+        running += amount
+        lowest = min(lowest, running)
+    return {"balance": wallet.balance, "expected": running, "lowest": lowest, "transactions": count}
+
+
+async def main(ops: int, concurrency: int, legacy: bool):
+    engine.sync_engine.echo = False
+    await create_tables()
+    print(f"⚙️  {ops} opérations, {concurrency} en parallèle, base {engine.dialect.name}")
+
+    modes = [("ledger", False)] + ([("legacy", True)] if legacy else [])
+    failed = False
+    for label, is_legacy in modes:
+        user_id = await create_wallet()
+        outcome = await run(user_id, ops, concurrency, is_legacy)
+        check = await verify(user_id)
+        consistent = check["balance"] == check["expected"] and check["lowest"] >= 0
+        failed |= not consistent and not is_legacy
+
+        print(f"\n📊 {label}")
+        print(f"   appliquées {outcome['applied']}, refusées (solde) {outcome['rejected']}, erreurs {outcome['errors']}")
+        print(f"   {ops / outcome['elapsed']:.0f} op/s, latence p50 {outcome['p50_ms']:.1f} ms, p99 {outcome['p99_ms']:.1f} ms")
+        print(f"   solde final {check['balance']} / attendu d'après le grand livre {check['expected']} "
+              f"({check['transactions']} transactions), minimum {check['lowest']}")
+        print(f"   {'✅ cohérent' if consistent else '❌ INCOHÉRENT'}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=2000, help="nombre d'opérations")
+    parser.add_argument("--concurrency", type=int, default=50, help="opérations simultanées")
+    parser.add_argument("--legacy", action="store_true", help="comparer avec l'ancien schéma lecture/écriture")
+    args = parser.parse_args()
+    asyncio.run(main(args.ops, args.concurrency, args.legacy))
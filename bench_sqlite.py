@@ -0,0 +1,172 @@
+"""
+Benchmark SQLite : profil "legacy" (défauts SQLite) contre "production"
+(WAL et pragmas), avec et sans file d'écriture unique.
+
+Usage:
+    python bench_sqlite.py                          # 10 s par scénario, 10 écrivains, 10 lecteurs
+    python bench_sqlite.py --duration 30 --writers 50 --readers 100
+
+Chaque profil et scénario tourne dans un sous-processus (SQLITE_PROFILE
+est lu à l'import de app.db.session) sur une base neuve dans un dossier
+temporaire. Deux scénarios : écritures seules, puis écritures et lectures
+mêlées.
+Écrivains : dépôts (WalletService.deposit) sur des wallets tirés au hasard.
+Lecteurs : historique des 20 dernières transactions d'un wallet.
+Mesure débit, latences p50 / p99 et erreurs "database is locked".
+
+Les tâches bouclent sans pause : en scénario mixte l'event loop est saturé
+et le débit d'écriture dépend de la part de CPU laissée par les lectures.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# (libellé, variables d'environnement du sous-processus)
+PROFILES = (
+    ("legacy", {"SQLITE_PROFILE": "legacy"}),
+    ("production sans file", {"SQLITE_PROFILE": "production", "SQLITE_SINGLE_WRITER": "false"}),
+    ("production", {"SQLITE_PROFILE": "production", "SQLITE_SINGLE_WRITER": "true"}),
+)
+WALLETS = 200
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+async def child(duration: float, writers: int, readers: int) -> dict:
+    sys.path.append(PROJECT_DIR)
+    from sqlalchemy import select, text
+    from sqlalchemy.exc import OperationalError
+
+    import app.db.base  # noqa: F401 (enregistre tous les modèles)
+    from app.db.session import AsyncSessionLocal, SQLiteWriter, engine
+    from app.main import create_tables
+    from app.models.transaction import Transaction
+    from app.models.user import User
+    from app.models.wallet import Wallet
+    from app.services.wallet_service import WalletService
+
+    engine.sync_engine.echo = False
+    await create_tables()
+
+    async with AsyncSessionLocal() as db:
+        users = [User(phone=f"bench-sqlite-{i}", hashed_password="x", full_name="Bench SQLite") for i in range(WALLETS)]
+        db.add_all(users)
+        await db.flush()
+        wallets = [Wallet(user_id=user.id, balance=0) for user in users]
+        db.add_all(wallets)
+        await db.commit()
+        pairs = [(user.id, wallet.id) for user, wallet in zip(users, wallets)]
+
+    stats = {
+        "write": {"ok": 0, "locked": 0, "errors": 0, "latencies": []},
+        "read": {"ok": 0, "locked": 0, "errors": 0, "latencies": []},
+    }
+    deadline = time.monotonic() + duration
+    rng = random.Random(42)
+
+    async def writer():
+        while time.monotonic() < deadline:
+            user_id, _ = rng.choice(pairs)
+            await measure("write", lambda db: WalletService.deposit(db, user_id, rng.randint(100, 5000)))
+
+    async def reader():
+        while time.monotonic() < deadline:
+            _, wallet_id = rng.choice(pairs)
+            await measure("read", lambda db: db.execute(
+                select(Transaction)
+                .where(Transaction.wallet_id == wallet_id)
+                .order_by(Transaction.id.desc())
+                .limit(20)
+            ))
+
+    async def measure(kind: str, operation):
+        bucket = stats[kind]
+        started = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            try:
+                await operation(db)
+                bucket["ok"] += 1
+            except OperationalError as e:
+                await db.rollback()
+                bucket["locked" if "locked" in str(e) else "errors"] += 1
+            except Exception:
+                await db.rollback()
+                bucket["errors"] += 1
+        bucket["latencies"].append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(writer() for _ in range(writers)), *(reader() for _ in range(readers)))
+    elapsed = time.perf_counter() - started
+
+    async with AsyncSessionLocal() as db:
+        journal = (await db.execute(text("PRAGMA journal_mode"))).scalar()
+
+    report = {"elapsed": elapsed, "journal_mode": journal, "writer": SQLiteWriter.stats()}
+    for kind, bucket in stats.items():
+        latencies = bucket.pop("latencies")
+        report[kind] = {
+            **bucket,
+            "per_second": bucket["ok"] / elapsed,
+            "p50_ms": statistics.median(latencies) if latencies else 0.0,
+            "p99_ms": percentile(latencies, 0.99),
+        }
+    return report
+
+
+def run_profile(profile: str, overrides: dict, duration: float, writers: int, readers: int) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {**os.environ, **overrides, "ENVIRONMENT": "development"}
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child",
+             "--duration", str(duration), "--writers", str(writers), "--readers", str(readers)],
+            cwd=workdir, env=env, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            print(completed.stderr[-2000:])
+            raise SystemExit(f"❌ Profil {profile} en échec")
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main(args):
+    print(f"⚙️  {args.duration:.0f} s par scénario, {args.writers} écrivains, {args.readers} lecteurs, {WALLETS} wallets")
+    scenarios = (("écritures seules", 0), ("mixte", args.readers))
+    for (scenario, readers), (profile, overrides) in itertools.product(scenarios, PROFILES):
+        report = run_profile(profile, overrides, args.duration, args.writers, readers)
+        print(f"\n📊 {scenario} - {profile} (journal {report['journal_mode']})")
+        for kind, label in (("write", "écritures"), ("read", "lectures")):
+            r = report[kind]
+            if kind == "read" and not readers:
+                continue
+            print(f"   {label:<9} {r['per_second']:>8.0f}/s  p50 {r['p50_ms']:>7.1f} ms  p99 {r['p99_ms']:>8.1f} ms  "
+                  f"verrouillées {r['locked']}, erreurs {r['errors']}")
+        if report["writer"]["enabled"]:
+            print(f"   file d'écriture : attente max {report['writer']['max_wait_ms']:.1f} ms, "
+                  f"détention max {report['writer']['max_hold_ms']:.1f} ms, délais dépassés {report['writer']['timeouts']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=10.0, help="secondes de charge par profil")
+    parser.add_argument("--writers", type=int, default=10, help="tâches d'écriture simultanées")
+    parser.add_argument("--readers", type=int, default=10, help="tâches de lecture simultanées")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(asyncio.run(child(args.duration, args.writers, args.readers))))
+    else:
+        main(args)
@@ -0,0 +1,47 @@
+"""
+Fixtures partagées : base SQLite (aiosqlite) vierge par test.
+
+L'URI SQLite de développement est relative (./koco.db) et résolue à la
+création de l'engine : les tests travaillent dans un répertoire temporaire
+choisi avant tout import de l'application.
+"""
+
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_DIR = tempfile.mkdtemp(prefix="koco-tests-")
+os.chdir(DB_DIR)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(DB_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    from app.db.session import SQLiteWriter, engine
+    from app.main import create_tables
+    from app.models.base_class import Base
+    from app.services.ledger_service import LedgerService
+
+    # Verrou lié à l'event loop : chaque test tourne dans son propre asyncio.run
+    monkeypatch.setattr(SQLiteWriter, "_lock", asyncio.Lock())
+    # Compte plateforme mis en cache par worker : recréé dans chaque base
+    monkeypatch.setattr(LedgerService, "_platform", None)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await create_tables()
+        await engine.dispose()
+
+    asyncio.run(setup())
+    yield
+    asyncio.run(engine.dispose())
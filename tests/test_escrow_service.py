@@ -0,0 +1,113 @@
+"""
+EscrowService.release_funds_batch : un escrow n'est jamais crédité deux
+fois, même quand deux lots sélectionnent les mêmes escrows.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from app.db.session import AsyncSessionLocal
+from app.models.escrow_account import EscrowAccount, EscrowStatus
+from app.models.listing import Listing
+from app.models.order import Order, OrderStatus
+from app.models.transaction import Transaction
+from app.models.user import User, UserRole
+from app.models.wallet import Wallet
+from app.services.escrow_service import EscrowService
+
+pytestmark = pytest.mark.usefixtures("database")
+
+PAYOUT = 950
+COMMISSION = 50
+
+
+async def _delivered_orders(count: int):
+    """Commandes livrées il y a 50h avec escrow LOCKED ; retourne (artisan_id, order_ids)"""
+    async with AsyncSessionLocal() as db:
+        client = User(phone="+242060000001", hashed_password="x")
+        artisan = User(phone="+242060000002", hashed_password="x", role=UserRole.ARTISAN)
+        db.add_all([client, artisan])
+        await db.flush()
+        db.add_all([Wallet(user_id=client.id, balance=0), Wallet(user_id=artisan.id, balance=0)])
+        listing = Listing(partner_id=artisan.id, title="Plomberie", price=PAYOUT + COMMISSION)
+        db.add(listing)
+        await db.flush()
+
+        order_ids = []
+        for _ in range(count):
+            order = Order(
+                client_id=client.id, partner_id=artisan.id, listing_id=listing.id,
+                total_amount=PAYOUT + COMMISSION, status=OrderStatus.DELIVERED,
+                delivered_at=datetime.utcnow() - timedelta(hours=50)
+            )
+            db.add(order)
+            await db.flush()
+            db.add(EscrowAccount(
+                order_id=order.id, amount=PAYOUT + COMMISSION, commission_amount=COMMISSION,
+                artisan_payout=PAYOUT, status=EscrowStatus.LOCKED
+            ))
+            order_ids.append(order.id)
+        await db.commit()
+        return artisan.id, order_ids
+
+
+async def _release_batch(db) -> dict:
+    summary = await EscrowService.release_funds_batch(db, delivered_before=datetime.utcnow())
+    await db.commit()
+    return summary
+
+
+async def _artisan_state(artisan_id: int):
+    async with AsyncSessionLocal() as db:
+        balance = (await db.execute(select(Wallet.balance).where(Wallet.user_id == artisan_id))).scalar()
+        releases = (await db.execute(
+            select(func.count()).select_from(Transaction).where(Transaction.type == "ESCROW_RELEASE")
+        )).scalar()
+        return balance, releases
+
+
+def test_overlapping_batches_credit_each_escrow_once():
+    async def scenario():
+        artisan_id, order_ids = await _delivered_orders(4)
+
+        async with AsyncSessionLocal() as db:
+            execute = db.execute
+            competitor = {}
+
+            async def execute_then_compete(*args, **kwargs):
+                result = await execute(*args, **kwargs)
+                if not competitor:
+                    # Juste après la sélection du lot : un autre worker libère les mêmes escrows
+                    async with AsyncSessionLocal() as other:
+                        competitor.update(await _release_batch(other))
+                return result
+
+            db.execute = execute_then_compete
+            late = await _release_batch(db)
+
+        assert competitor["released"] == 4
+        assert late["selected"] == 4
+        assert late["released"] == 0
+        assert late["skipped"] == 4
+        assert await _artisan_state(artisan_id) == (4 * PAYOUT, 4)
+
+    asyncio.run(scenario())
+
+
+def test_second_run_releases_nothing():
+    async def scenario():
+        artisan_id, order_ids = await _delivered_orders(3)
+        async with AsyncSessionLocal() as db:
+            assert (await _release_batch(db))["order_ids"] == order_ids
+        async with AsyncSessionLocal() as db:
+            assert (await _release_batch(db))["released"] == 0
+
+        assert await _artisan_state(artisan_id) == (3 * PAYOUT, 3)
+        async with AsyncSessionLocal() as db:
+            statuses = (await db.execute(select(Order.status).where(Order.id.in_(order_ids)))).scalars().all()
+        assert set(statuses) == {OrderStatus.COMPLETED}
+
+    asyncio.run(scenario())
@@ -0,0 +1,122 @@
+"""
+Idempotency.run : une clé rejouée renvoie la réponse enregistrée sans
+réexécuter l'opération ; une clé réutilisée pour une autre requête est
+refusée (422). Chemin Redis (fakeredis) et chemin base seule.
+"""
+
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy import func, select
+
+from app.core.cache import CacheManager
+from app.core.idempotency import REPLAY_HEADER, Idempotency
+from app.db.session import AsyncSessionLocal
+from app.models.transaction import Transaction
+from app.models.user import User
+from app.models.wallet import Wallet
+from app.services.ledger_service import LedgerService
+
+pytestmark = pytest.mark.usefixtures("database")
+
+
+@pytest.fixture(params=["redis", "database"], autouse=True)
+def backend(request, monkeypatch):
+    if request.param == "redis":
+        fakeredis = pytest.importorskip("fakeredis")
+        monkeypatch.setattr(CacheManager, "_redis", fakeredis.FakeAsyncRedis(decode_responses=True))
+        monkeypatch.setattr(Idempotency, "_redis_retry_at", 0.0)
+    else:
+        # Redis considéré indisponible : la table idempotency_keys fait seule foi
+        monkeypatch.setattr(Idempotency, "_redis_retry_at", time.time() + 3600)
+    return request.param
+
+
+async def _user() -> int:
+    async with AsyncSessionLocal() as db:
+        user = User(phone="+242060000001", hashed_password="x")
+        db.add(user)
+        await db.flush()
+        db.add(Wallet(user_id=user.id, balance=0))
+        await db.commit()
+        return user.id
+
+
+def _deposit(user_id: int, calls: list):
+    """Opération monétaire de test : crédit du wallet (commité par Idempotency)"""
+
+    async def run(db, payload: dict, key: str, response=None):
+        async def call():
+            calls.append(payload)
+            balance = await LedgerService.apply(db, user_id, payload["amount"], "DEPOSIT")
+            return {"balance": balance}
+
+        return await Idempotency.run(db, key, f"deposit:{user_id}", payload, call, response)
+
+    return run
+
+
+async def _deposits(user_id: int):
+    async with AsyncSessionLocal() as db:
+        balance = (await db.execute(select(Wallet.balance).where(Wallet.user_id == user_id))).scalar()
+        count = (await db.execute(select(func.count()).select_from(Transaction))).scalar()
+        return balance, count
+
+
+def test_same_key_replays_stored_response():
+    async def scenario():
+        user_id = await _user()
+        calls = []
+        deposit = _deposit(user_id, calls)
+
+        async with AsyncSessionLocal() as db:
+            first = await deposit(db, {"amount": 500}, "key-1")
+        response = Response()
+        async with AsyncSessionLocal() as db:
+            replay = await deposit(db, {"amount": 500}, "key-1", response)
+
+        assert first == replay == {"balance": 500}
+        assert response.headers[REPLAY_HEADER] == "true"
+        assert len(calls) == 1
+        assert await _deposits(user_id) == (500, 1)
+
+    asyncio.run(scenario())
+
+
+def test_key_reused_with_other_payload_is_rejected():
+    async def scenario():
+        user_id = await _user()
+        calls = []
+        deposit = _deposit(user_id, calls)
+
+        async with AsyncSessionLocal() as db:
+            await deposit(db, {"amount": 500}, "key-1")
+        async with AsyncSessionLocal() as db:
+            with pytest.raises(HTTPException) as error:
+                await deposit(db, {"amount": 900}, "key-1")
+
+        assert error.value.status_code == 422
+        assert len(calls) == 1
+        assert await _deposits(user_id) == (500, 1)
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_duplicates_execute_once():
+    async def scenario():
+        user_id = await _user()
+        calls = []
+        deposit = _deposit(user_id, calls)
+
+        async def attempt():
+            async with AsyncSessionLocal() as db:
+                return await deposit(db, {"amount": 500}, "key-1")
+
+        results = await asyncio.gather(attempt(), attempt(), attempt())
+        assert results == [{"balance": 500}] * 3
+        assert len(calls) == 1
+        assert await _deposits(user_id) == (500, 1)
+
+    asyncio.run(scenario())
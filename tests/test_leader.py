@@ -0,0 +1,69 @@
+"""
+Fencing du backend d'élection "redis" : le jeton est tiré et vérifié en
+base (leader_leases), un ancien leader figé est rejeté par check_fence.
+"""
+
+import asyncio
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from sqlalchemy import select  # noqa: E402
+
+from app.core.cache import CacheManager  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.leader import LeaderElection, LeaseLostError  # noqa: E402
+from app.db.session import AsyncSessionLocal  # noqa: E402
+from app.models.leader_lease import LeaderLease  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def redis_backend(database, monkeypatch):
+    monkeypatch.setattr(CacheManager, "_redis", fakeredis.FakeAsyncRedis(decode_responses=True))
+    monkeypatch.setattr(settings, "LEADER_BACKEND", "redis")
+    monkeypatch.setattr(settings, "LEADER_RENEW_INTERVAL", 0.05)
+
+
+async def _wait_leader(election: LeaderElection):
+    deadline = time.monotonic() + 5
+    while not election.is_leader:
+        assert time.monotonic() < deadline, "élection non obtenue"
+        await asyncio.sleep(0.01)
+
+
+async def _lease_row():
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(
+            select(LeaderLease.holder, LeaderLease.token).where(LeaderLease.name == "test")
+        )).one()
+
+
+def test_frozen_leader_is_fenced_after_redis_takeover():
+    async def scenario():
+        old, new = LeaderElection("test"), LeaderElection("test")
+        old.start()
+        await _wait_leader(old)
+        assert await _lease_row() == (old.node_id, old.token)
+
+        # Ancien leader figé (plus de renouvellement), bail expiré dans Redis
+        old._task.cancel()
+        await CacheManager.get_client().delete("leader:test")
+        new.start()
+        await _wait_leader(new)
+
+        assert new.token == old.token + 1
+        assert await _lease_row() == (new.node_id, new.token)
+        assert old.is_leader  # se croit encore leader (validité estimée localement)
+
+        async with AsyncSessionLocal() as db:
+            with pytest.raises(LeaseLostError):
+                await old.check_fence(db)
+        assert not old.is_leader
+
+        async with AsyncSessionLocal() as db:
+            await new.check_fence(db)
+        await new.stop()
+
+    asyncio.run(scenario())
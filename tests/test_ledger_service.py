@@ -0,0 +1,68 @@
+"""
+LedgerService.apply : garde de solde (aucun débit ne rend un wallet négatif).
+"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, select
+
+from app.db.session import AsyncSessionLocal
+from app.models.transaction import Transaction
+from app.models.user import User
+from app.models.wallet import Wallet
+from app.services.ledger_service import LedgerService
+
+pytestmark = pytest.mark.usefixtures("database")
+
+
+async def _user_with_balance(balance: int) -> int:
+    async with AsyncSessionLocal() as db:
+        user = User(phone="+242060000001", hashed_password="x")
+        db.add(user)
+        await db.flush()
+        db.add(Wallet(user_id=user.id, balance=balance))
+        await db.commit()
+        return user.id
+
+
+async def _wallet_state(user_id: int):
+    async with AsyncSessionLocal() as db:
+        balance = (await db.execute(select(Wallet.balance).where(Wallet.user_id == user_id))).scalar()
+        transactions = (await db.execute(select(func.count()).select_from(Transaction))).scalar()
+        return balance, transactions
+
+
+def test_apply_rejects_overdraft():
+    async def scenario():
+        user_id = await _user_with_balance(1000)
+        async with AsyncSessionLocal() as db:
+            assert await LedgerService.apply(db, user_id, -1500, "WITHDRAWAL") is None
+            await db.commit()
+        assert await _wallet_state(user_id) == (1000, 0)
+
+    asyncio.run(scenario())
+
+
+def test_apply_debits_down_to_zero():
+    async def scenario():
+        user_id = await _user_with_balance(1000)
+        async with AsyncSessionLocal() as db:
+            assert await LedgerService.apply(db, user_id, -1000, "WITHDRAWAL", reference="W-1") == 0
+            await db.commit()
+        assert await _wallet_state(user_id) == (0, 1)
+
+    asyncio.run(scenario())
+
+
+def test_reject_reports_insufficient_balance():
+    async def scenario():
+        user_id = await _user_with_balance(100)
+        async with AsyncSessionLocal() as db:
+            assert await LedgerService.apply(db, user_id, -500, "PAYMENT") is None
+            with pytest.raises(HTTPException) as error:
+                await LedgerService.reject(db, user_id, "Solde insuffisant")
+        assert error.value.status_code == 400
+
+    asyncio.run(scenario())
@@ -0,0 +1,84 @@
+"""
+Invalidation du principal entre workers : deux TieredCache sur le même
+namespace et le même Redis (fakeredis) simulent deux workers.
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from fastapi import HTTPException  # noqa: E402
+from jose import jwt  # noqa: E402
+
+from app.api.v1.deps import get_current_principal  # noqa: E402
+from app.core.cache import CacheManager, TieredCache  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.principal_cache import PrincipalCache  # noqa: E402
+
+LOCAL_TTL = 0.2
+
+
+@pytest.fixture(autouse=True)
+def fake_redis():
+    CacheManager._redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    TieredCache._redis_retry_at = 0.0
+    instances = dict(TieredCache._instances)
+    yield
+    CacheManager._redis = None
+    TieredCache._instances = instances
+
+
+def _worker_cache() -> TieredCache:
+    """Cache utilisateur d'un autre worker (même namespace, TTL local raccourci)"""
+    return TieredCache(
+        PrincipalCache._by_user.namespace,
+        ttl=settings.AUTH_CACHE_REDIS_TTL,
+        local_ttl=LOCAL_TTL,
+    )
+
+
+def test_deactivation_reaches_other_worker_within_local_ttl():
+    async def scenario():
+        db = {"id": 42, "role": "CLIENT", "is_active": True}
+
+        async def load():
+            return dict(db)
+
+        worker_a = PrincipalCache._by_user
+        worker_b = _worker_cache()
+        assert (await worker_a.get_or_set("42", load))["is_active"] is True
+        assert (await worker_b.get_or_set("42", load))["is_active"] is True
+
+        # Désactivation commitée sur le worker A
+        db["is_active"] = False
+        await PrincipalCache.invalidate_user(42)
+
+        await asyncio.sleep(LOCAL_TTL * 1.5)
+        assert (await worker_b.get_or_set("42", load))["is_active"] is False
+
+    asyncio.run(scenario())
+
+
+def test_local_copy_still_served_when_redis_is_down():
+    async def scenario():
+        cache = _worker_cache()
+        await cache.set("7", {"id": 7, "role": "CLIENT", "is_active": True})
+        await asyncio.sleep(LOCAL_TTL * 1.5)
+        TieredCache._redis_retry_at = time.time() + 60  # Redis tombé
+        assert (await cache.get("7"))["is_active"] is True
+
+    asyncio.run(scenario())
+
+
+def test_token_without_exp_is_rejected():
+    token = jwt.encode({"sub": "1"}, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(get_current_principal(token))
+    assert error.value.status_code == 401
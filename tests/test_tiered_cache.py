@@ -0,0 +1,111 @@
+"""
+Chargement concurrent d'une invalidation par tag : un chargement lancé
+avant invalidate_tags ne doit pas stocker sa valeur (périmée).
+Deux TieredCache sur le même namespace et le même Redis (fakeredis)
+simulent deux workers.
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.core.cache import CacheManager, TieredCache  # noqa: E402
+
+NAMESPACE = "test:tiles"
+
+
+@pytest.fixture(autouse=True)
+def fake_redis():
+    CacheManager._redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    TieredCache._redis_retry_at = 0.0
+    instances = dict(TieredCache._instances)
+    yield
+    CacheManager._redis = None
+    TieredCache._instances = instances
+
+
+def _slow_loader(db: dict, started: asyncio.Event, release: asyncio.Event):
+    async def load():
+        value = dict(db)  # lecture "base" avant l'invalidation
+        started.set()
+        await release.wait()
+        return value
+    return load
+
+
+async def _reload(cache: TieredCache, db: dict):
+    async def load():
+        return dict(db)
+    return await cache.get_or_set("cell", load, tags=("c1",))
+
+
+def test_load_started_before_invalidation_is_not_stored():
+    async def scenario():
+        cache = TieredCache(NAMESPACE, ttl=60)
+        db = {"listings": 1}
+        started, release = asyncio.Event(), asyncio.Event()
+
+        pending = asyncio.ensure_future(
+            cache.get_or_set("cell", _slow_loader(db, started, release), tags=("c1",))
+        )
+        await started.wait()
+        db["listings"] = 2
+        await cache.invalidate_tags("c1")
+        release.set()
+        assert (await pending)["listings"] == 1
+
+        assert cache.counters["discarded"] == 1
+        assert await CacheManager.get_client().get(f"{NAMESPACE}:cell") is None
+        assert (await _reload(cache, db))["listings"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_invalidation_on_other_worker_discards_load():
+    async def scenario():
+        worker_a = TieredCache(NAMESPACE, ttl=60)
+        worker_b = TieredCache(NAMESPACE, ttl=60)
+        db = {"listings": 1}
+        started, release = asyncio.Event(), asyncio.Event()
+
+        pending = asyncio.ensure_future(
+            worker_b.get_or_set("cell", _slow_loader(db, started, release), tags=("c1",))
+        )
+        await started.wait()
+        db["listings"] = 2
+        await worker_a.invalidate_tags("c1")
+        release.set()
+        await pending
+
+        assert worker_b.counters["discarded"] == 1
+        assert (await _reload(worker_a, db))["listings"] == 2
+        assert (await _reload(worker_b, db))["listings"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_readers_after_invalidation_do_not_join_stale_load():
+    async def scenario():
+        cache = TieredCache(NAMESPACE, ttl=60)
+        db = {"listings": 1}
+        started, release = asyncio.Event(), asyncio.Event()
+
+        pending = asyncio.ensure_future(
+            cache.get_or_set("cell", _slow_loader(db, started, release), tags=("c1",))
+        )
+        await started.wait()
+        db["listings"] = 2
+        await cache.invalidate_tags("c1")
+        assert (await asyncio.wait_for(_reload(cache, db), timeout=2))["listings"] == 2
+        release.set()
+        await pending
+
+        assert (await _reload(cache, db))["listings"] == 2
+
+    asyncio.run(scenario())